@@ -0,0 +1,185 @@
+"""
+Benchmark of pessimistic, optimistic and group committed operations.
+
+Runs random deposits and withdrawals from concurrent workers over
+sets of wallets of different sizes, fewer wallets meaning more
+contention, with both values of 'CONCURRENCY_MODE' and with
+'GROUP_COMMIT', see 'wallet_app.groupcommit'. Lock wait time
+is estimated by sampling backends waiting for a lock in
+'pg_stat_activity'. Uses the database from the .env settings:
+
+    python -m benchmarks.bench_concurrency --wallets 1,10,100 --workers 32
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from uuid import UUID
+
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from wallet_app import optimistic
+from wallet_app.config import settings
+from wallet_app.exceptions import InsufficientFundsError, WalletConflictError
+from wallet_app.groupcommit import wallet_queues
+from wallet_app.models import Wallet
+from wallet_app.operations import apply_operation
+from wallet_app.schemas import OperationType, SWalletOperation
+from wallet_app.transactions import TransactionRunner
+
+MODES = ("pessimistic", "optimistic", "group_commit")
+
+INITIAL_BALANCE = 1_000_000
+
+LOCK_WAITERS = text(
+    "SELECT count(*) FROM pg_stat_activity "
+    "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+)
+
+
+async def sample_lock_waits(
+        engine: AsyncEngine, interval: float, stop: asyncio.Event
+) -> float:
+    """
+    Samples the number of backends waiting for a lock.
+    :param engine: engine of the benchmarked database.
+    :param interval: pause between samples in seconds.
+    :param stop: event that ends the sampling.
+    :return: estimated total lock wait time in seconds.
+    """
+    waited = 0.0
+    async with engine.connect() as connection:
+        while not stop.is_set():
+            waiters = await connection.scalar(LOCK_WAITERS)
+            await connection.commit()
+            waited += waiters * interval
+            await asyncio.sleep(interval)
+    return waited
+
+
+async def run(
+        mode: str,
+        session_factory: async_sessionmaker,
+        wallet_uuids: list[UUID],
+        workers: int,
+        duration: float
+) -> tuple[float, int]:
+    """
+    Runs random operations from concurrent workers for a fixed time.
+    :param mode: one of 'MODES'.
+    :param session_factory: session factory bound to the benchmark engine.
+    :param wallet_uuids: UUIDs of the wallets.
+    :param workers: number of concurrent workers.
+    :param duration: duration in seconds.
+    :return: applied operations per second and number of aborts.
+    """
+    settings.CONCURRENCY_MODE = (
+        "optimistic" if mode == "optimistic" else "pessimistic"
+    )
+    runner = TransactionRunner(session_factory)
+    deadline = time.perf_counter() + duration
+    done = 0
+    aborted = 0
+
+    async def operate(wallet_uuid: UUID, operation_type: OperationType):
+        if mode == "group_commit":
+            return await wallet_queues.submit(
+                runner, wallet_uuid,
+                SWalletOperation(operation_type=operation_type, amount=1),
+            )
+        return await runner.run(lambda session: apply_operation(
+            session, wallet_uuid, operation_type, 1
+        ))
+
+    async def worker(seed: int) -> None:
+        nonlocal done, aborted
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            try:
+                await operate(
+                    rng.choice(wallet_uuids), rng.choice(list(OperationType))
+                )
+                done += 1
+            except WalletConflictError:
+                aborted += 1
+            except InsufficientFundsError:
+                pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(workers)))
+    return done / (time.perf_counter() - started), aborted
+
+
+async def main(
+        wallet_counts: list[int],
+        workers: int,
+        duration: float,
+        interval: float
+) -> None:
+    """
+    Benchmarks every mode at each contention level.
+    :param wallet_counts: numbers of wallets the workers operate on.
+    :param workers: number of concurrent workers.
+    :param duration: duration of each run in seconds.
+    :param interval: pause between lock wait samples in seconds.
+    :return: None.
+    """
+    engine = create_async_engine(
+        settings.get_db_url(), pool_size=workers + 1, max_overflow=0
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        created = [
+            Wallet(balance=INITIAL_BALANCE) for _ in range(max(wallet_counts))
+        ]
+        session.add_all(created)
+        await session.commit()
+    wallet_uuids = [UUID(str(wallet.uuid)) for wallet in created]
+    print(f"{'wallets':>8} {'mode':>12} {'ops/sec':>10} "
+          f"{'lock wait':>10} {'retries':>8} {'aborts':>7} {'commits':>8}")
+    try:
+        for wallets in wallet_counts:
+            for mode in MODES:
+                retries = optimistic.stats.get("retries")
+                commits = wallet_queues.stats.get("commits")
+                stop = asyncio.Event()
+                sampler = asyncio.create_task(
+                    sample_lock_waits(engine, interval, stop)
+                )
+                ops, aborted = await run(
+                    mode, session_factory, wallet_uuids[:wallets],
+                    workers, duration
+                )
+                stop.set()
+                waited = await sampler
+                retries = optimistic.stats.get("retries") - retries
+                commits = wallet_queues.stats.get("commits") - commits
+                print(f"{wallets:>8} {mode:>12} {ops:10.1f} "
+                      f"{waited:9.2f}s {retries:>8} {aborted:>7} "
+                      f"{commits:>8}")
+    finally:
+        async with session_factory() as session:
+            await session.execute(
+                delete(Wallet).where(Wallet.uuid.in_(wallet_uuids))
+            )
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wallets", default="1,10,100")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+    asyncio.run(main(
+        [int(count) for count in args.wallets.split(",")],
+        args.workers, args.duration, args.interval,
+    ))
@@ -0,0 +1,101 @@
+"""
+Benchmark of export and import of the wallets table.
+
+Seeds '--wallets' wallets into the database '<DB_NAME>_bench', created
+on the server from the .env settings like for 'benchmarks.loadtest',
+then for every dump format measures in rows/sec the export with
+'COPY TO STDOUT' into a temporary file, the import of that file into
+the emptied table and its import once more over the existing wallets,
+see 'wallet_app.dump'. The database is dropped after the run:
+
+    python -m benchmarks.bench_dump --wallets 1000000 --chunk-size 10000
+"""
+
+import os
+
+os.environ.setdefault("TEST", "_bench")
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy_utils import drop_database
+
+from benchmarks.loadtest import prepare_database, seed_wallets
+from wallet_app import dump
+from wallet_app.config import settings
+from wallet_app.schemas import DumpFormat
+
+
+async def load(
+        session_factory: async_sessionmaker,
+        data_format: DumpFormat,
+        path: str
+) -> float:
+    """
+    Imports a dump file.
+    :param session_factory: session factory bound to the benchmark engine.
+    :param data_format: format of the dump.
+    :param path: path of the dump file.
+    :return: imported rows per second.
+    """
+    started = time.perf_counter()
+    rows = 0
+    records = dump.read_records(
+        dump.stream_file(open(path, "rb")), data_format
+    )
+    async for rows in dump.import_wallets(session_factory, records):
+        pass
+    return rows / (time.perf_counter() - started)
+
+
+async def main(wallets: int) -> None:
+    """
+    Benchmarks export and import in every format.
+    :param wallets: number of seeded wallets.
+    :return: None.
+    """
+    dsn = settings.get_db_url()
+    await seed_wallets(dsn.replace("+asyncpg", ""), wallets)
+    engine = create_async_engine(dsn)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    print(f"{'format':>8} {'size MB':>8} {'export/s':>10} "
+          f"{'import/s':>10} {'upsert/s':>10}")
+    try:
+        for data_format in DumpFormat:
+            with tempfile.NamedTemporaryFile() as file:
+                started = time.perf_counter()
+                rows = await dump.export_file(
+                    session_factory, data_format, file
+                )
+                exported = rows / (time.perf_counter() - started)
+                size = file.tell() / 2 ** 20
+                async with engine.begin() as connection:
+                    await connection.execute(
+                        text("TRUNCATE wallets CASCADE")
+                    )
+                imported = await load(session_factory, data_format, file.name)
+                upserted = await load(session_factory, data_format, file.name)
+            print(f"{data_format.value:>8} {size:8.1f} {exported:10.0f} "
+                  f"{imported:10.0f} {upserted:10.0f}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int,
+                        default=settings.IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    settings.IMPORT_CHUNK_SIZE = args.chunk_size
+
+    database_url = settings.get_db_url().replace("+asyncpg", "")
+    prepare_database(database_url)
+    try:
+        asyncio.run(main(args.wallets))
+    finally:
+        drop_database(database_url)
@@ -0,0 +1,106 @@
+"""
+Benchmark of wallet listing pages at different depths.
+
+Seeds '--wallets' wallets into the database '<DB_NAME>_bench', created
+on the server from the .env settings like for 'benchmarks.loadtest',
+then measures the time of a page of '--limit' wallets starting at
+the beginning, the middle and the end of the table: by keyset
+on UUID as 'GET /api/v1/wallets' reads it, unfiltered, with a balance
+range no wallet is in and with one every wallet is in, and with
+OFFSET for comparison. The database is dropped after the run:
+
+    python -m benchmarks.bench_listing --wallets 1000000 --limit 100
+"""
+
+import os
+
+os.environ.setdefault("TEST", "_bench")
+
+import argparse
+import asyncio
+import time
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy_utils import drop_database
+
+from benchmarks.loadtest import (
+    SEED_BALANCE,
+    prepare_database,
+    seed_wallets,
+    seeded_uuid,
+)
+from wallet_app.config import settings
+from wallet_app.operations import wallets_statement
+from wallet_app.schemas import WalletField
+
+REPEATS = 20
+
+
+async def measure(session: AsyncSession, statement: Select) -> float:
+    """
+    Runs a page query several times.
+    :param session: session bound to the benchmark engine.
+    :param statement: page query.
+    :return: average time of the query in milliseconds.
+    """
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        (await session.execute(statement)).all()
+    return (time.perf_counter() - started) / REPEATS * 1000
+
+
+async def main(wallets: int, limit: int) -> None:
+    """
+    Benchmarks pages at the start, middle and end of the table.
+    :param wallets: number of seeded wallets.
+    :param limit: wallets per page.
+    :return: None.
+    """
+    dsn = settings.get_db_url()
+    await seed_wallets(dsn.replace("+asyncpg", ""), wallets)
+    engine = create_async_engine(dsn)
+    fields = list(WalletField)
+    ranges: dict[str, tuple[Optional[Decimal], Optional[Decimal]]] = {
+        "keyset": (None, None),
+        "no match": (Decimal(SEED_BALANCE + 1), None),
+        "all match": (Decimal(0), None),
+    }
+    print(f"{'depth':>10} " + " ".join(
+        f"{name + ' ms':>13}" for name in [*ranges, "offset"]
+    ))
+    try:
+        async with AsyncSession(engine) as session:
+            for depth in (0, wallets // 2, max(wallets - limit, 0)):
+                cursor = seeded_uuid(depth - 1) if depth else None
+                times = [
+                    await measure(session, wallets_statement(
+                        fields, cursor, low, high
+                    ).limit(limit))
+                    for low, high in ranges.values()
+                ]
+                times.append(await measure(
+                    session,
+                    wallets_statement(fields).offset(depth).limit(limit)
+                ))
+                print(f"{depth:>10} " + " ".join(
+                    f"{elapsed:13.2f}" for elapsed in times
+                ))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    database_url = settings.get_db_url().replace("+asyncpg", "")
+    prepare_database(database_url)
+    try:
+        asyncio.run(main(args.wallets, args.limit))
+    finally:
+        drop_database(database_url)
@@ -0,0 +1,69 @@
+"""
+Benchmark of the lookups of missing wallets.
+
+Measures the CPU time of answering a lookup from the negative cache
+and from the Bloom filter of wallet UUIDs, the time of adding
+the UUIDs to the filter at startup and its memory, to compare with
+the database round trip of a request for a missing wallet.
+No database is needed:
+
+    python -m benchmarks.bench_lookups --wallets 1000000
+"""
+
+import argparse
+import time
+import uuid
+from typing import Callable
+
+from wallet_app.lookups import BloomFilter, NegativeCache
+
+
+def measure(call: Callable[[uuid.UUID], object], keys: list) -> float:
+    """
+    Calls a function with every key.
+    :param call: function.
+    :param keys: UUIDs passed to the function.
+    :return: average CPU time of a call in microseconds.
+    """
+    started = time.process_time()
+    for key in keys:
+        call(key)
+    return (time.process_time() - started) / len(keys) * 1e6
+
+
+def main(wallets: int, lookups: int, error_rate: float) -> None:
+    """
+    Measures the lookups.
+    :param wallets: number of wallets in the filter.
+    :param lookups: number of lookups of each kind.
+    :param error_rate: false positive rate of the filter.
+    :return: None.
+    """
+    existing = [uuid.uuid4() for _ in range(wallets)]
+    missing = [uuid.uuid4() for _ in range(lookups)]
+
+    bloom = BloomFilter(wallets, error_rate)
+    elapsed = measure(bloom.add, existing)
+    print(f"filter add            {elapsed:8.2f} us, "
+          f"{elapsed * wallets / 1e6:.1f} s for {wallets} wallets, "
+          f"{bloom.size / 8 / 2 ** 20:.1f} MiB")
+    print(f"filter hit            "
+          f"{measure(bloom.__contains__, existing[:lookups]):8.2f} us")
+    print(f"filter reject         "
+          f"{measure(bloom.__contains__, missing):8.2f} us, "
+          f"{sum(key in bloom for key in missing) / lookups:.4f} passed")
+
+    cache = NegativeCache(max_size=lookups, ttl=60)
+    print(f"negative cache add    {measure(cache.add, missing):8.2f} us")
+    print(f"negative cache hit    "
+          f"{measure(cache.__contains__, missing):8.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    main(args.wallets, args.lookups, args.error_rate)
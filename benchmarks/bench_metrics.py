@@ -0,0 +1,94 @@
+"""
+Benchmark of the overhead of the request metrics.
+
+Measures the time of a histogram observation and of a request to
+an ASGI application answering at once, called directly and through
+'MetricsMiddleware', so the difference is the cost the metrics add
+to every request. No database is needed:
+
+    python -m benchmarks.bench_metrics --requests 100000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from wallet_app import metrics
+from wallet_app.metrics import MetricsMiddleware
+
+SCOPE = {"type": "http", "method": "GET", "path": "/api/v1/wallets"}
+
+
+async def app(scope, receive, send) -> None:
+    """
+    ASGI application sending an empty response.
+    :return: None.
+    """
+    await send({"type": "http.response.start", "status": 200})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive() -> dict:
+    """
+    Returns the end of the request body.
+    :return: ASGI message.
+    """
+    return {"type": "http.request"}
+
+
+async def send(message: dict) -> None:
+    """
+    Discards a message of the response.
+    :param message: ASGI message.
+    :return: None.
+    """
+
+
+async def measure(handler: Callable, requests: int) -> float:
+    """
+    Runs requests through an ASGI application.
+    :param handler: ASGI application.
+    :param requests: number of requests.
+    :return: average time of a request in nanoseconds.
+    """
+    started = time.perf_counter_ns()
+    for _ in range(requests):
+        await handler(dict(SCOPE), receive, send)
+    return (time.perf_counter_ns() - started) / requests
+
+
+def measure_observe(observations: int) -> float:
+    """
+    Records values in a histogram.
+    :param observations: number of values.
+    :return: average time of an observation in nanoseconds.
+    """
+    histograms = metrics.Histograms("seconds", labels=("route",))
+    started = time.perf_counter_ns()
+    for number in range(observations):
+        histograms.observe("seconds", number * 1e-6, "/api/v1/wallets")
+    return (time.perf_counter_ns() - started) / observations
+
+
+async def main(requests: int) -> None:
+    """
+    Compares requests with and without the metrics.
+    :param requests: number of requests of each run.
+    :return: None.
+    """
+    await measure(app, requests)
+    direct = await measure(app, requests)
+    timed = await measure(MetricsMiddleware(app), requests)
+    print(f"observe:          {measure_observe(requests):8.0f} ns")
+    print(f"request:          {direct:8.0f} ns")
+    print(f"request, metrics: {timed:8.0f} ns")
+    print(f"overhead:         {timed - direct:8.0f} ns")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
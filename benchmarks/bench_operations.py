@@ -0,0 +1,125 @@
+"""
+Benchmark of wallet operations on a single contended wallet.
+
+Compares the previous 'SELECT ... FOR UPDATE' path with the atomic
+'UPDATE ... RETURNING' path from 'wallet_app.operations'.
+Uses the database from the .env settings:
+
+    python -m benchmarks.bench_operations --workers 32 --duration 10
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from wallet_app.config import settings
+from wallet_app.models import Wallet
+from wallet_app.operations import apply_operation
+from wallet_app.schemas import OperationType
+
+Operation = Callable[[AsyncSession, UUID], Awaitable[None]]
+
+
+async def locking_deposit(session: AsyncSession, wallet_uuid: UUID) -> None:
+    """
+    Deposit through the ORM with a row lock held across Python code.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :return: None.
+    """
+    async with session.begin():
+        result = await session.execute(
+            select(Wallet).where(Wallet.uuid == wallet_uuid).with_for_update()
+        )
+        wallet = result.scalar_one()
+        wallet.balance += 1
+
+
+async def atomic_deposit(session: AsyncSession, wallet_uuid: UUID) -> None:
+    """
+    Deposit through the single-statement operation engine.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :return: None.
+    """
+    async with session.begin():
+        await apply_operation(session, wallet_uuid, OperationType.DEPOSIT, 1)
+
+
+async def run(
+        operation: Operation,
+        session_factory: async_sessionmaker,
+        wallet_uuid: UUID,
+        workers: int,
+        duration: float
+) -> float:
+    """
+    Runs the operation from concurrent workers for a fixed time.
+    :param operation: operation to benchmark.
+    :param session_factory: session factory bound to the benchmark engine.
+    :param wallet_uuid: UUID of the contended wallet.
+    :param workers: number of concurrent workers.
+    :param duration: duration in seconds.
+    :return: operations per second.
+    """
+    deadline = time.perf_counter() + duration
+    done = 0
+
+    async def worker() -> None:
+        nonlocal done
+        while time.perf_counter() < deadline:
+            async with session_factory() as session:
+                await operation(session, wallet_uuid)
+            done += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return done / (time.perf_counter() - started)
+
+
+async def main(workers: int, duration: float) -> None:
+    """
+    Creates a wallet and benchmarks both operation paths on it.
+    :param workers: number of concurrent workers.
+    :param duration: duration of each run in seconds.
+    :return: None.
+    """
+    engine = create_async_engine(
+        settings.get_db_url(), pool_size=workers, max_overflow=0
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        wallet = Wallet(balance=0)
+        session.add(wallet)
+        await session.commit()
+    try:
+        for name, operation in (
+                ("select for update", locking_deposit),
+                ("update returning", atomic_deposit),
+        ):
+            ops = await run(
+                operation, session_factory, wallet.uuid, workers, duration
+            )
+            print(f"{name:>20}: {ops:10.1f} ops/sec")
+    finally:
+        async with session_factory() as session:
+            await session.delete(await session.get(Wallet, wallet.uuid))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.duration))
@@ -0,0 +1,121 @@
+"""
+Benchmark of the serialization of responses.
+
+Measures the CPU time of a request to an endpoint returning a wallet,
+called directly as an ASGI application: returning the model for
+FastAPI to validate against 'response_model' and encode, and rendering
+it with 'wallet_app.responses' as JSON and as MessagePack. Also
+measures building the model from a row with and without validation.
+No database is needed:
+
+    python -m benchmarks.bench_serialization --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+from typing import Callable
+
+from fastapi import FastAPI
+
+from wallet_app.responses import JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, render
+from wallet_app.schemas import SWalletCreated
+
+WALLET_UUID = uuid.uuid4()
+BALANCE = Decimal("1535.70")
+
+
+def create_app() -> FastAPI:
+    """
+    Creates an application with an endpoint per serialization.
+    :return: application.
+    """
+    app = FastAPI()
+
+    @app.get("/model", response_model=SWalletCreated)
+    async def get_model() -> SWalletCreated:
+        return SWalletCreated(uuid=WALLET_UUID, balance=BALANCE)
+
+    @app.get("/json", response_model=SWalletCreated)
+    async def get_json():
+        return render(SWalletCreated.model_construct(
+            uuid=WALLET_UUID, balance=BALANCE
+        ), JSON_MEDIA_TYPE)
+
+    @app.get("/msgpack", response_model=SWalletCreated)
+    async def get_msgpack():
+        return render(SWalletCreated.model_construct(
+            uuid=WALLET_UUID, balance=BALANCE
+        ), MSGPACK_MEDIA_TYPE)
+
+    return app
+
+
+async def measure(app: FastAPI, path: str, requests: int) -> float:
+    """
+    Runs requests to an endpoint.
+    :param app: application.
+    :param path: path of the endpoint.
+    :param requests: number of requests.
+    :return: average CPU time of a request in microseconds.
+    """
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": b"",
+        "root_path": "", "query_string": b"", "headers": [],
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message: dict) -> None:
+        pass
+
+    started = time.process_time()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.process_time() - started) / requests * 1e6
+
+
+def measure_call(call: Callable[[], object], requests: int) -> float:
+    """
+    Runs a function several times.
+    :param call: function.
+    :param requests: number of calls.
+    :return: average CPU time of a call in microseconds.
+    """
+    started = time.process_time()
+    for _ in range(requests):
+        call()
+    return (time.process_time() - started) / requests * 1e6
+
+
+async def main(requests: int) -> None:
+    """
+    Compares the serializations.
+    :param requests: number of requests of each run.
+    :return: None.
+    """
+    app = create_app()
+    for path in ("/model", "/json", "/msgpack"):
+        await measure(app, path, requests // 10)
+        elapsed = await measure(app, path, requests)
+        print(f"request {path:<16} {elapsed:8.1f} us")
+    for name, call in (
+            ("validated", lambda: SWalletCreated(
+                uuid=WALLET_UUID, balance=BALANCE
+            )),
+            ("constructed", lambda: SWalletCreated.model_construct(
+                uuid=WALLET_UUID, balance=BALANCE
+            )),
+    ):
+        print(f"model {name:<18} {measure_call(call, requests):8.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
@@ -0,0 +1,100 @@
+"""
+Benchmark of a burst of concurrent reads of one wallet.
+
+Sends concurrent 'GET /api/v1/wallets/{uuid}' requests through the
+application with the balance cache disabled and counts the database
+queries with and without single-flight reads.
+Uses the database from the .env settings:
+
+    python -m benchmarks.bench_singleflight --requests 1000
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from uuid import UUID
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from wallet_app.cache import NullCache, balance_cache
+from wallet_app.config import settings
+from wallet_app.deps import get_session_factory
+from wallet_app.main import app
+from wallet_app.models import Wallet
+
+
+async def burst(
+        client: AsyncClient, wallet_uuid: UUID, requests: int
+) -> float:
+    """
+    Sends concurrent reads of the wallet.
+    :param client: asynchronous client of the application.
+    :param wallet_uuid: UUID of the wallet.
+    :param requests: number of concurrent requests.
+    :return: duration in seconds.
+    """
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.get(f"/api/v1/wallets/{wallet_uuid}") for _ in range(requests)
+    ))
+    duration = time.perf_counter() - started
+    assert all(response.status_code == 200 for response in responses)
+    return duration
+
+
+async def main(requests: int, pool_size: int) -> None:
+    """
+    Creates a wallet and reads it in a burst with both read paths.
+    :param requests: number of concurrent requests.
+    :param pool_size: size of the connection pool.
+    :return: None.
+    """
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    engine = create_async_engine(
+        settings.get_db_url(), pool_size=pool_size, max_overflow=0
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    queries = 0
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_query(*args) -> None:
+        nonlocal queries
+        queries += 1
+
+    async with session_factory() as session:
+        wallet = Wallet(balance=0)
+        session.add(wallet)
+        await session.commit()
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    balance_cache.backend = NullCache()
+    transport = ASGITransport(app=app)
+    try:
+        async with AsyncClient(
+                transport=transport, base_url="http://bench"
+        ) as client:
+            for name, single_flight in (
+                    ("per request", False),
+                    ("single-flight", True),
+            ):
+                settings.SINGLE_FLIGHT = single_flight
+                queries = 0
+                duration = await burst(client, wallet.uuid, requests)
+                print(f"{name:>15}: {queries:6d} queries, "
+                      f"{requests / duration:10.1f} req/sec")
+    finally:
+        app.dependency_overrides.clear()
+        async with session_factory() as session:
+            await session.delete(await session.get(Wallet, wallet.uuid))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--pool-size", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.pool_size))
@@ -0,0 +1,167 @@
+"""
+Benchmark of random transfers across a small set of wallets.
+
+Compares locking the two wallets in request order, which deadlocks
+on opposing transfers, with 'wallet_app.operations.apply_transfer',
+which locks them in UUID order in one statement.
+Uses the database from the .env settings:
+
+    python -m benchmarks.bench_transfers --wallets 10 --workers 32
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from decimal import Decimal
+from typing import Awaitable, Callable
+from uuid import UUID
+
+from asyncpg.exceptions import DeadlockDetectedError
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from wallet_app.config import settings
+from wallet_app.exceptions import InsufficientFundsError
+from wallet_app.models import Wallet
+from wallet_app.operations import apply_transfer
+
+Transfer = Callable[[AsyncSession, UUID, UUID, float], Awaitable[None]]
+
+INITIAL_BALANCE = 1_000_000
+
+
+async def request_order_transfer(
+        session: AsyncSession, source: UUID, target: UUID, amount: Decimal
+) -> None:
+    """
+    Transfer that locks the source wallet first, then the destination.
+    :param session: asynchronous database session.
+    :param source: UUID of the source wallet.
+    :param target: UUID of the destination wallet.
+    :param amount: amount of the transfer.
+    :return: None.
+    """
+    async with session.begin():
+        wallets = []
+        for wallet_uuid in (source, target):
+            result = await session.execute(
+                select(Wallet)
+                .where(Wallet.uuid == wallet_uuid)
+                .with_for_update()
+            )
+            wallets.append(result.scalar_one())
+        if wallets[0].balance < amount:
+            raise InsufficientFundsError(source)
+        wallets[0].balance -= amount
+        wallets[1].balance += amount
+
+
+async def ordered_transfer(
+        session: AsyncSession, source: UUID, target: UUID, amount: Decimal
+) -> None:
+    """
+    Transfer through the single-statement transfer engine.
+    :param session: asynchronous database session.
+    :param source: UUID of the source wallet.
+    :param target: UUID of the destination wallet.
+    :param amount: amount of the transfer.
+    :return: None.
+    """
+    async with session.begin():
+        await apply_transfer(session, source, target, amount)
+
+
+async def run(
+        transfer: Transfer,
+        session_factory: async_sessionmaker,
+        wallet_uuids: list[UUID],
+        workers: int,
+        duration: float
+) -> tuple[float, int]:
+    """
+    Runs random transfers from concurrent workers for a fixed time.
+    :param transfer: transfer to benchmark.
+    :param session_factory: session factory bound to the benchmark engine.
+    :param wallet_uuids: UUIDs of the wallets.
+    :param workers: number of concurrent workers.
+    :param duration: duration in seconds.
+    :return: transfers per second and number of deadlocks.
+    """
+    deadline = time.perf_counter() + duration
+    done = 0
+    deadlocks = 0
+
+    async def worker(seed: int) -> None:
+        nonlocal done, deadlocks
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            source, target = rng.sample(wallet_uuids, 2)
+            async with session_factory() as session:
+                try:
+                    await transfer(session, source, target, 1)
+                    done += 1
+                except DBAPIError as e:
+                    if not isinstance(e.orig.__cause__, DeadlockDetectedError):
+                        raise
+                    deadlocks += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(workers)))
+    return done / (time.perf_counter() - started), deadlocks
+
+
+async def main(wallets: int, workers: int, duration: float) -> None:
+    """
+    Creates wallets and benchmarks both transfer paths on them.
+    :param wallets: number of wallets.
+    :param workers: number of concurrent workers.
+    :param duration: duration of each run in seconds.
+    :return: None.
+    """
+    engine = create_async_engine(
+        settings.get_db_url(), pool_size=workers, max_overflow=0
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        created = [Wallet(balance=INITIAL_BALANCE) for _ in range(wallets)]
+        session.add_all(created)
+        await session.commit()
+    wallet_uuids = [UUID(str(wallet.uuid)) for wallet in created]
+    try:
+        for name, transfer in (
+                ("request order", request_order_transfer),
+                ("uuid order", ordered_transfer),
+        ):
+            ops, deadlocks = await run(
+                transfer, session_factory, wallet_uuids, workers, duration
+            )
+            print(f"{name:>15}: {ops:10.1f} transfers/sec, "
+                  f"{deadlocks} deadlocks")
+        async with session_factory() as session:
+            total = await session.scalar(
+                select(func.sum(Wallet.balance))
+                .where(Wallet.uuid.in_(wallet_uuids))
+            )
+        assert total == INITIAL_BALANCE * wallets, "funds were lost"
+    finally:
+        async with session_factory() as session:
+            await session.execute(
+                delete(Wallet).where(Wallet.uuid.in_(wallet_uuids))
+            )
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wallets", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.wallets, args.workers, args.duration))
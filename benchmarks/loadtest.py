@@ -0,0 +1,461 @@
+"""
+Load test of the wallet API with latency percentiles.
+
+Drives the application in process through the ASGI interface
+or over a socket of a uvicorn server started for the run.
+The database '<DB_NAME>_bench' is created on the server from the .env
+settings, e.g. the one of 'docker compose up db' or a local cluster,
+seeded with '--wallets' wallets and dropped after the run:
+
+    python -m benchmarks.loadtest --transport uvicorn --duration 10 \\
+        --output results.json --baseline baseline.json
+
+Scenarios:
+    hot_wallet    deposits into one wallet from every worker;
+    uniform       deposits and withdrawals on random seeded wallets;
+    read_heavy    95% reads and 5% deposits on random seeded wallets;
+    create_burst  creates new wallets.
+
+Results are written as JSON. With '--baseline' the run fails with exit
+code 1 if a scenario had errors, lost more than '--tolerance' of the
+baseline throughput or its p99 latency grew by more than that.
+'--save-baseline' stores the results as the new baseline instead.
+"""
+
+import os
+
+os.environ.setdefault("TEST", "_bench")
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional
+from uuid import UUID
+
+import asyncpg
+import httpx
+from alembic import command
+from alembic.config import Config
+from sqlalchemy_utils import create_database, database_exists, drop_database
+
+from wallet_app.config import settings
+from wallet_app.money import to_minor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WALLETS_URL = "/api/v1/wallets"
+SEED_BALANCE = 10 ** 12
+# Seeded wallets have UUIDs 'be000000-...-<index>', so clients pick
+# a random wallet without loading the UUIDs from the database.
+SEED_PREFIX = 0xBE << 120
+
+Request = tuple[str, str, Optional[dict]]
+
+
+class Scenario(NamedTuple):
+    """Load test scenario."""
+
+    name: str
+    description: str
+    next_request: Callable[[random.Random, int], Request]
+
+
+def seeded_uuid(index: int) -> UUID:
+    """
+    Returns the UUID of a seeded wallet.
+    :param index: index of the wallet.
+    :return: wallet UUID.
+    """
+    return UUID(int=SEED_PREFIX | index)
+
+
+def operation(wallet_uuid: UUID, operation_type: str) -> Request:
+    """
+    Returns a request of a wallet operation of amount 1.
+    :param wallet_uuid: UUID of the wallet.
+    :param operation_type: 'DEPOSIT' or 'WITHDRAW'.
+    :return: method, path and JSON body.
+    """
+    return (
+        "POST",
+        f"{WALLETS_URL}/{wallet_uuid}/operation",
+        {"operation_type": operation_type, "amount": 1},
+    )
+
+
+def hot_wallet(rng: random.Random, wallets: int) -> Request:
+    """Deposit into the first seeded wallet."""
+    return operation(seeded_uuid(0), "DEPOSIT")
+
+
+def uniform(rng: random.Random, wallets: int) -> Request:
+    """Deposit or withdrawal on a random seeded wallet."""
+    return operation(
+        seeded_uuid(rng.randrange(wallets)),
+        rng.choice(("DEPOSIT", "WITHDRAW")),
+    )
+
+
+def read_heavy(rng: random.Random, wallets: int) -> Request:
+    """Read of a random seeded wallet, one request in 20 is a deposit."""
+    wallet_uuid = seeded_uuid(rng.randrange(wallets))
+    if rng.random() < 0.95:
+        return "GET", f"{WALLETS_URL}/{wallet_uuid}", None
+    return operation(wallet_uuid, "DEPOSIT")
+
+
+def create_burst(rng: random.Random, wallets: int) -> Request:
+    """Creation of a new wallet."""
+    return "POST", f"{WALLETS_URL}/add", {}
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        Scenario("hot_wallet", "single hot-wallet contention", hot_wallet),
+        Scenario("uniform", "uniform random across wallets", uniform),
+        Scenario("read_heavy", "95% reads, 5% deposits", read_heavy),
+        Scenario("create_burst", "wallet creation", create_burst),
+    )
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Returns the nearest-rank percentile.
+    :param values: sorted values.
+    :param q: percentile in the range (0, 1].
+    :return: value of the percentile, 0 for no values.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summarize(
+        latencies: list[float], statuses: Counter, errors: int, elapsed: float
+) -> dict:
+    """
+    Summarizes a scenario run.
+    :param latencies: latencies of completed requests in seconds.
+    :param statuses: number of responses per status code.
+    :param errors: number of failed requests.
+    :param elapsed: duration of the run in seconds.
+    :return: throughput, latency percentiles in milliseconds and errors.
+    """
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(code): count for code, count in statuses.items()},
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_scenario(
+        client: httpx.AsyncClient,
+        scenario: Scenario,
+        wallets: int,
+        concurrency: int,
+        duration: float,
+        warmup: float
+) -> dict:
+    """
+    Runs the scenario from concurrent closed-loop workers.
+
+    Requests completed during the warmup are not measured.
+    Responses with a 5xx status and transport errors count as errors.
+    :param client: client of the application.
+    :param scenario: scenario to run.
+    :param wallets: number of seeded wallets.
+    :param concurrency: number of concurrent workers.
+    :param duration: measured duration in seconds.
+    :param warmup: warmup duration in seconds.
+    :return: summary of the run.
+    """
+    started = time.perf_counter() + warmup
+    deadline = started + duration
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+
+    async def worker(seed: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed)
+        while (sent := time.perf_counter()) < deadline:
+            method, url, body = scenario.next_request(rng, wallets)
+            try:
+                response = await client.request(method, url, json=body)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = None
+            if sent < started:
+                continue
+            latencies.append(time.perf_counter() - sent)
+            statuses[status] += 1
+            if status is None or status >= 500:
+                errors += 1
+
+    await asyncio.gather(*(worker(seed) for seed in range(concurrency)))
+    return summarize(
+        latencies, statuses, errors, time.perf_counter() - started
+    )
+
+
+def prepare_database(database_url: str) -> None:
+    """
+    Creates the benchmark database and applies the migrations.
+    :param database_url: synchronous database URL.
+    :return: None.
+    """
+    if database_exists(database_url):
+        drop_database(database_url)
+    create_database(database_url)
+    alembic_cfg = Config(os.path.join(BASE_DIR, "alembic.ini"))
+    alembic_cfg.set_main_option("sqlalchemy.url", database_url)
+    command.upgrade(alembic_cfg, "head")
+
+
+async def seed_wallets(dsn: str, wallets: int) -> None:
+    """
+    Inserts the seeded wallets in one statement.
+    :param dsn: database URL.
+    :param wallets: number of wallets.
+    :return: None.
+    """
+    connection = await asyncpg.connect(dsn)
+    try:
+        await connection.execute(
+            """
+            INSERT INTO wallets (uuid, balance)
+            SELECT format('be%s', lpad(to_hex(i), 30, '0'))::uuid, $2
+            FROM generate_series(0, $1 - 1) AS i
+            """,
+            wallets, to_minor(SEED_BALANCE),
+        )
+        await connection.execute("ANALYZE wallets")
+    finally:
+        await connection.close()
+
+
+def free_port() -> int:
+    """
+    Returns a free local TCP port.
+    :return: port number.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_uvicorn(workers: int) -> tuple[subprocess.Popen, str]:
+    """
+    Starts a uvicorn server on the benchmark database.
+    :param workers: number of uvicorn worker processes.
+    :return: server process and its base URL.
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "wallet_app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+            "--no-access-log",
+        ],
+        cwd=BASE_DIR,
+        env={**os.environ, "WEB_CONCURRENCY": str(workers)},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                await client.get("/api/v1/stats")
+                return process, base_url
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start in 30 seconds")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """
+    Seeds the database and runs the scenarios over the transport.
+    :param args: command line arguments.
+    :return: results of the run.
+    """
+    seeded = time.perf_counter()
+    await seed_wallets(
+        settings.get_db_url().replace("+asyncpg", ""), args.wallets
+    )
+    print(f"seeded {args.wallets} wallets "
+          f"in {time.perf_counter() - seeded:.1f}s")
+    limits = httpx.Limits(max_connections=args.concurrency)
+    scenarios = {}
+    if args.transport == "uvicorn":
+        process, base_url = await start_uvicorn(args.workers)
+        try:
+            async with httpx.AsyncClient(
+                    base_url=base_url, limits=limits, timeout=30.0
+            ) as client:
+                for name in args.scenario:
+                    scenarios[name] = await run_scenario(
+                        client, SCENARIOS[name], args.wallets,
+                        args.concurrency, args.duration, args.warmup
+                    )
+                    print_summary(name, scenarios[name])
+        finally:
+            process.terminate()
+            process.wait()
+    else:
+        from wallet_app.main import app
+
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=app),
+                    base_url="http://bench",
+                    timeout=30.0,
+            ) as client:
+                for name in args.scenario:
+                    scenarios[name] = await run_scenario(
+                        client, SCENARIOS[name], args.wallets,
+                        args.concurrency, args.duration, args.warmup
+                    )
+                    print_summary(name, scenarios[name])
+    return {"meta": run_meta(args), "scenarios": scenarios}
+
+
+def run_meta(args: argparse.Namespace) -> dict:
+    """
+    Describes the environment of the run.
+    :param args: command line arguments.
+    :return: parameters of the run.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "transport": args.transport,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "wallets": args.wallets,
+        "db_backend": settings.DB_BACKEND,
+        "cache_backend": settings.CACHE_BACKEND,
+    }
+
+
+def print_summary(name: str, summary: dict) -> None:
+    """
+    Prints one line of the scenario summary.
+    :param name: scenario name.
+    :param summary: summary of the run.
+    :return: None.
+    """
+    print(f"{name:>14}: {summary['throughput']:10.1f} req/s  "
+          f"p50 {summary['p50_ms']:7.2f} ms  "
+          f"p95 {summary['p95_ms']:7.2f} ms  "
+          f"p99 {summary['p99_ms']:7.2f} ms  "
+          f"errors {summary['errors']}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares the results with the baseline.
+    :param results: results of the run.
+    :param baseline: stored results of a previous run.
+    :param tolerance: allowed relative loss of throughput and p99 growth.
+    :return: descriptions of the regressions.
+    """
+    regressions = []
+    for name, current in results["scenarios"].items():
+        if current["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors")
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput']:.1f} req/s, "
+                f"baseline {base['throughput']:.1f} req/s"
+            )
+        if current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {current['p99_ms']:.2f} ms, "
+                f"baseline {base['p99_ms']:.2f} ms"
+            )
+    return regressions
+
+
+def main() -> int:
+    """
+    Runs the load test from the command line.
+    :return: exit code, 1 if a regression was found.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--transport", choices=("asgi", "uvicorn"),
+                        default="asgi")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--output", help="path of the JSON results")
+    parser.add_argument("--baseline", help="path of the JSON baseline")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--keep-db", action="store_true",
+                        help="do not drop the benchmark database")
+    args = parser.parse_args()
+
+    database_url = settings.get_db_url().replace("+asyncpg", "")
+    prepare_database(database_url)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if not args.keep_db:
+            drop_database(database_url)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline stored in {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
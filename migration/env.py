@@ -4,7 +4,15 @@ from logging.config import fileConfig
 from sqlalchemy import pool
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
-from wallet_app.models import Wallet
+from wallet_app.models import (
+    BalanceStorage,
+    IdempotencyKey,
+    Wallet,
+    WalletHold,
+    WalletOperation,
+    WalletSlot,
+    WalletSnapshot,
+)
 from wallet_app.database import Base, DATABASE_URL
 from alembic import context
 
@@ -0,0 +1,144 @@
+"""Store amounts as minor units
+
+Revision ID: 03d2a0c9b69f
+Revises: 66f50d1d7134
+Create Date: 2026-10-17 03:05:14.462846
+
+The float amount columns are replaced by BIGINT minor units without
+rewriting the tables under an exclusive lock:
+
+1. a nullable '<column>_minor' column is added to every table and kept
+   in sync with the float one by a trigger, so the running application
+   can go on writing;
+2. the new columns are filled in batches of 'BATCH_SIZE' rows by primary
+   key, each batch committed on its own;
+3. a NOT VALID check that the new column is set is validated, which
+   scans the table without blocking writes;
+4. in the final transaction the trigger and the float columns are
+   dropped and the new columns renamed, all catalog-only changes.
+   SET NOT NULL uses the validated check instead of another scan.
+
+The scale is 'MONEY_SCALE' of the settings. The downgrade rewrites
+the tables with ALTER COLUMN TYPE.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from wallet_app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '03d2a0c9b69f'
+down_revision: Union[str, Sequence[str], None] = '66f50d1d7134'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FACTOR = 10 ** settings.MONEY_SCALE
+BATCH_SIZE = 10000
+
+# Table, its primary key and its amount columns
+TABLES = (
+    ("wallets", ("uuid",), ("balance",)),
+    ("wallet_slots", ("wallet_uuid", "slot"), ("balance",)),
+    ("wallet_snapshots", ("wallet_uuid",), ("balance",)),
+    ("wallet_operations", ("id",), ("amount", "balance")),
+)
+NULLABLE = {("wallet_operations", "balance")}
+
+
+def expand(table: str, columns: Sequence[str]) -> None:
+    """Adds the minor unit columns and the trigger filling them."""
+    for column in columns:
+        op.add_column(table, sa.Column(f"{column}_minor", sa.BigInteger()))
+    assignments = "".join(
+        f"NEW.{column}_minor := round(NEW.{column} * {FACTOR});\n"
+        for column in columns
+    )
+    op.execute(
+        f"CREATE FUNCTION {table}_minor_units() RETURNS trigger AS $$\n"
+        f"BEGIN\n{assignments}RETURN NEW;\nEND\n$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        f"CREATE TRIGGER {table}_minor_units "
+        f"BEFORE INSERT OR UPDATE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {table}_minor_units()"
+    )
+
+
+def backfill(table: str, key: Sequence[str], columns: Sequence[str]) -> None:
+    """Fills the minor unit columns in batches, each in autocommit."""
+    keys = ", ".join(key)
+    assignments = ", ".join(
+        f"{column}_minor = round({column} * {FACTOR})" for column in columns
+    )
+    joined = ", ".join(f"{table}.{name}" for name in key)
+    batch_keys = ", ".join(f"batch.{name}" for name in key)
+    after = ", ".join(f":{name}" for name in key)
+    bind = op.get_bind()
+    params = None
+    while True:
+        where = f"WHERE ({keys}) > ({after})" if params else ""
+        last = bind.execute(sa.text(
+            f"WITH batch AS ("
+            f"SELECT {keys} FROM {table} {where} "
+            f"ORDER BY {keys} LIMIT {BATCH_SIZE}"
+            f"), updated AS ("
+            f"UPDATE {table} SET {assignments} FROM batch "
+            f"WHERE ({joined}) = ({batch_keys})"
+            f") SELECT {keys} FROM batch ORDER BY {keys} DESC LIMIT 1"
+        ), params or {}).first()
+        if last is None:
+            return
+        params = dict(zip(key, last))
+
+
+def validate(table: str, columns: Sequence[str]) -> None:
+    """Checks without blocking writes that required columns are filled."""
+    for column in columns:
+        if (table, column) in NULLABLE:
+            continue
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_minor_set "
+            f"CHECK ({column}_minor IS NOT NULL) NOT VALID"
+        )
+        op.execute(
+            f"ALTER TABLE {table} "
+            f"VALIDATE CONSTRAINT {table}_{column}_minor_set"
+        )
+
+
+def contract(table: str, columns: Sequence[str]) -> None:
+    """Replaces the float columns by the minor unit columns."""
+    op.execute(f"DROP TRIGGER {table}_minor_units ON {table}")
+    op.execute(f"DROP FUNCTION {table}_minor_units()")
+    for column in columns:
+        op.drop_column(table, column)
+        op.alter_column(table, f"{column}_minor", new_column_name=column)
+        if (table, column) not in NULLABLE:
+            op.alter_column(table, column, nullable=False)
+            op.drop_constraint(f"{table}_{column}_minor_set", table)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, _, columns in TABLES:
+        expand(table, columns)
+    with op.get_context().autocommit_block():
+        for table, key, columns in TABLES:
+            backfill(table, key, columns)
+            validate(table, columns)
+    for table, _, columns in TABLES:
+        contract(table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, _, columns in TABLES:
+        for column in columns:
+            op.alter_column(
+                table, column,
+                type_=sa.Float(),
+                postgresql_using=f"{column}::double precision / {FACTOR}",
+            )
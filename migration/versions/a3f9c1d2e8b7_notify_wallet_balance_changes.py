@@ -0,0 +1,67 @@
+"""Notify wallet balance changes
+
+Revision ID: a3f9c1d2e8b7
+Revises: 5e1c2b7a9d04
+Create Date: 2026-10-17 05:21:48.730164
+
+Every applied operation is recorded in 'wallet_operations', so a
+statement-level trigger on it sends one NOTIFY on the channel
+'wallet_balances' per changed wallet with the payload
+'<wallet uuid>:<balance in minor units>', the balance of the last
+entry of the statement. The balance is left empty for entries written
+without it (ledger mode and striped wallets). Notifications are
+delivered on commit, in commit order, and not at all on rollback.
+Connections that set 'wallet.balance_events' to 'off' do not notify,
+see 'BALANCE_EVENTS' of the settings, off by default. Enabling it
+serializes commits: every committing transaction that notifies takes
+the database-wide lock of the notification queue, whether or not
+anyone listens, which caps the write throughput of the database.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f9c1d2e8b7'
+down_revision: Union[str, Sequence[str], None] = '5e1c2b7a9d04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE FUNCTION notify_wallet_balances() RETURNS trigger AS $$
+        BEGIN
+            IF coalesce(
+                current_setting('wallet.balance_events', true), ''
+            ) <> 'off' THEN
+                PERFORM pg_notify(
+                    'wallet_balances',
+                    wallet_uuid::text || ':' || coalesce(balance::text, '')
+                )
+                FROM (
+                    SELECT DISTINCT ON (wallet_uuid) wallet_uuid, balance
+                    FROM inserted
+                    ORDER BY wallet_uuid, id DESC
+                ) AS latest;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER wallet_operations_notify
+        AFTER INSERT ON wallet_operations
+        REFERENCING NEW TABLE AS inserted
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_wallet_balances()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "DROP TRIGGER wallet_operations_notify ON wallet_operations"
+    )
+    op.execute("DROP FUNCTION notify_wallet_balances()")
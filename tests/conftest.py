@@ -3,22 +3,30 @@ This module describes fixtures for tests
 """
 
 import os
+from decimal import Decimal
+from typing import Awaitable, Callable
 
 import pytest
 import pytest_asyncio
 from alembic import command
 from alembic.config import Config
-from httpx import ASGITransport, AsyncClient
+from httpx import ASGITransport, AsyncClient, Response
 from sqlalchemy import NullPool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy_utils import create_database, drop_database
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
 
 # Set test supplement before loading settings
 # (settings depends on os.environ['TEST'])
 os.environ['TEST'] = '_test'
 
 # Local imports after setting env
-from wallet_app.deps import get_db, get_transaction_session
+from wallet_app import fastpath
+from wallet_app.deps import (
+    get_db,
+    get_pool,
+    get_session_factory,
+)
 from wallet_app.config import settings
 
 
@@ -30,6 +38,17 @@ def base_wallets_url() -> str:
     return "/api/v1/wallets"
 
 
+@pytest.fixture
+def ledger_mode(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Switches the application to ledger mode.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "LEDGER_MODE", True)
+    monkeypatch.setattr(settings, "LEDGER_SNAPSHOT_INTERVAL", 3)
+
+
 @pytest.fixture(scope='session')
 def temp_db() -> str:
     """
@@ -54,43 +73,58 @@ def temp_db() -> str:
 
 
 @pytest_asyncio.fixture
-async def async_client(temp_db: str) -> AsyncClient:
+async def session_factory(temp_db: str) -> async_sessionmaker:
+    """
+    Creates a session factory bound to the temporary database.
+    :param temp_db: temporary database.
+    :return: session factory.
+    """
+    engine = create_async_engine(temp_db, poolclass=NullPool)
+    yield async_sessionmaker(bind=engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(params=["orm", "asyncpg"])
+async def async_client(
+        request: pytest.FixtureRequest,
+        temp_db: str,
+        session_factory: async_sessionmaker,
+        monkeypatch: pytest.MonkeyPatch
+) -> AsyncClient:
     """
     Creates an asynchronous client.
 
+    Every test using the client runs with both data access backends,
+    see 'wallet_app.fastpath'.
     Overrides application's dependencies:
-    function 'get_db' and 'get_transaction_session'
-    for correct asynchronous tests.
+    function 'get_db', 'get_session_factory'
+    and 'get_pool' for correct asynchronous tests.
+    :param request: requested data access backend.
     :param temp_db: temporary database.
+    :param session_factory: session factory bound to the temporary database.
     :return: asynchronous client.
     """
     from wallet_app.main import app
 
-    engine = create_async_engine(temp_db, poolclass=NullPool)
-    test_session = async_sessionmaker(bind=engine, expire_on_commit=False)
+    monkeypatch.setattr(settings, "DB_BACKEND", request.param)
+    pool = None
+    if request.param == "asyncpg":
+        pool = await fastpath.create_pool(
+            settings, temp_db.replace('postgresql+asyncpg', 'postgresql')
+        )
 
-    async def override_get_db():
-        async with test_session() as session:
-            try:
-                yield session
-            finally:
-                await session.close()
+    test_session = session_factory
 
-    async def override_get_transaction_session():
+    async def override_get_db():
         async with test_session() as session:
             try:
                 yield session
-                await session.commit()
-            except Exception:
-                await session.rollback()
-                raise
             finally:
                 await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
-    app.dependency_overrides[get_transaction_session] = (
-        override_get_transaction_session
-    )
+    app.dependency_overrides[get_session_factory] = lambda: test_session
+    app.dependency_overrides[get_pool] = lambda: pool
 
     transport = ASGITransport(app=app, raise_app_exceptions=True)
     async with (AsyncClient(transport=transport, base_url="http://test")
@@ -98,3 +132,70 @@ async def async_client(temp_db: str) -> AsyncClient:
         yield client
 
     app.dependency_overrides.clear()
+    if pool is not None:
+        await pool.close()
+
+
+@pytest.fixture
+def create_wallet(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> Callable[..., Awaitable[str]]:
+    """
+    Returns a function creating a wallet through the client.
+    :param async_client: asynchronous client.
+    :param base_wallets_url: base URL of the wallets.
+    :return: coroutine function taking the initial balance
+    and returning the UUID of the wallet.
+    """
+    async def create(balance=0) -> str:
+        response = await async_client.post(
+            f"{base_wallets_url}/add", json={"balance": balance}
+        )
+        assert response.status_code == HTTP_201_CREATED
+        return response.json()["uuid"]
+
+    return create
+
+
+@pytest.fixture
+def get_balance(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> Callable[..., Awaitable[Decimal]]:
+    """
+    Returns a function reading the balance of a wallet through the client.
+    :param async_client: asynchronous client.
+    :param base_wallets_url: base URL of the wallets.
+    :return: coroutine function taking the UUID of the wallet
+    and returning its balance.
+    """
+    async def read(wallet_uuid) -> Decimal:
+        response = await async_client.get(
+            f"{base_wallets_url}/{wallet_uuid}"
+        )
+        assert response.status_code == HTTP_200_OK
+        return Decimal(response.json()["balance"])
+
+    return read
+
+
+@pytest.fixture
+def operate(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> Callable[..., Awaitable[Response]]:
+    """
+    Returns a function performing a wallet operation through the client.
+    :param async_client: asynchronous client.
+    :param base_wallets_url: base URL of the wallets.
+    :return: coroutine function taking the UUID of the wallet,
+    'DEPOSIT' or 'WITHDRAW' and the amount and returning the response.
+    """
+    async def perform(wallet_uuid, operation_type, amount) -> Response:
+        return await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/operation",
+            json={"operation_type": operation_type, "amount": amount},
+        )
+
+    return perform
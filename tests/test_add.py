@@ -1,5 +1,6 @@
 """This module provides tests for adding a new wallet"""
 
+from decimal import Decimal
 from uuid import UUID
 
 import pytest
@@ -37,7 +38,7 @@ async def test_add_wallet(
     assert response.status_code == HTTP_201_CREATED
     data = response.json()
 
-    assert data['balance'] >= 0
+    assert Decimal(data['balance']) >= 0
     assert isinstance(UUID(data['uuid']), UUID)
 
 
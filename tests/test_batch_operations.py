@@ -0,0 +1,220 @@
+"""This module provides tests for batch wallet operations"""
+
+import asyncio
+import uuid
+from typing import Awaitable, Callable
+
+import pytest
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_422_UNPROCESSABLE_ENTITY
+
+from wallet_app.money import MAX_MINOR_UNITS, from_minor
+from wallet_app.schemas import BatchItemStatus, OperationType
+
+
+@pytest.mark.asyncio
+async def test_batch_per_item(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Applying a batch where only some operations succeed.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    first = await create_wallet(100)
+    second = await create_wallet(10)
+    operations = [
+        (first, OperationType.WITHDRAW, 60),
+        (second, OperationType.DEPOSIT, 5),
+        (first, OperationType.WITHDRAW, 60),
+        (str(uuid.uuid4()), OperationType.DEPOSIT, 1),
+        (second, OperationType.DEPOSIT, 0),
+        (first, OperationType.DEPOSIT, 20),
+    ]
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch",
+        json={
+            "atomic": False,
+            "operations": [
+                {
+                    "wallet_uuid": wallet_uuid,
+                    "operation_type": operation_type,
+                    "amount": amount,
+                }
+                for wallet_uuid, operation_type, amount in operations
+            ],
+        }
+    )
+
+    assert response.status_code == HTTP_200_OK
+    data = response.json()
+    assert data["applied"] is True
+    assert data["results"] == [
+        {"status": BatchItemStatus.OK, "balance": "40.00"},
+        {"status": BatchItemStatus.OK, "balance": "15.00"},
+        {"status": BatchItemStatus.INSUFFICIENT_FUNDS, "balance": None},
+        {"status": BatchItemStatus.NOT_FOUND, "balance": None},
+        {"status": BatchItemStatus.INVALID_AMOUNT, "balance": None},
+        {"status": BatchItemStatus.OK, "balance": "60.00"},
+    ]
+    response_first = await async_client.get(f"{base_wallets_url}/{first}")
+    response_second = await async_client.get(f"{base_wallets_url}/{second}")
+    assert response_first.json()["balance"] == "60.00"
+    assert response_second.json()["balance"] == "15.00"
+
+
+@pytest.mark.asyncio
+async def test_batch_atomic_failure(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    An atomic batch with a failing operation changes nothing.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(100)
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch",
+        json={
+            "operations": [
+                {
+                    "wallet_uuid": wallet_uuid,
+                    "operation_type": OperationType.DEPOSIT,
+                    "amount": 50,
+                },
+                {
+                    "wallet_uuid": wallet_uuid,
+                    "operation_type": OperationType.WITHDRAW,
+                    "amount": 500,
+                },
+            ],
+        }
+    )
+
+    assert response.status_code == HTTP_200_OK
+    data = response.json()
+    assert data["applied"] is False
+    assert [result["status"] for result in data["results"]] == [
+        BatchItemStatus.OK, BatchItemStatus.INSUFFICIENT_FUNDS
+    ]
+    response_wallet = await async_client.get(
+        f"{base_wallets_url}/{wallet_uuid}"
+    )
+    assert response_wallet.json()["balance"] == "100.00"
+
+
+@pytest.mark.asyncio
+async def test_batch_concurrent_opposite_order(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Concurrent batches touching the same wallets in opposite order.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    first = await create_wallet(0)
+    second = await create_wallet(0)
+
+    async def batch(wallet_uuids: list[str]):
+        """Deposits to the wallets in the given order."""
+        return await async_client.post(
+            f"{base_wallets_url}/operations:batch",
+            json={
+                "operations": [
+                    {
+                        "wallet_uuid": wallet_uuid,
+                        "operation_type": OperationType.DEPOSIT,
+                        "amount": 1,
+                    }
+                    for wallet_uuid in wallet_uuids
+                ],
+            }
+        )
+
+    responses = await asyncio.gather(
+        *(batch([first, second] if i % 2 else [second, first])
+          for i in range(10))
+    )
+
+    assert all(response.json()["applied"] for response in responses)
+    for wallet_uuid in (first, second):
+        response_wallet = await async_client.get(
+            f"{base_wallets_url}/{wallet_uuid}"
+        )
+        assert response_wallet.json()["balance"] == "10.00"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "request_json",
+    [
+        {"operations": []},
+        {"operations": [{"wallet_uuid": "abc",
+                         "operation_type": "DEPOSIT",
+                         "amount": 1}]},
+        {"operations": [{"wallet_uuid": str(uuid.uuid4()),
+                         "operation_type": "plus",
+                         "amount": 1}]},
+    ]
+)
+async def test_batch_invalid(
+        async_client: AsyncClient,
+        request_json: dict,
+        base_wallets_url: str
+) -> None:
+    """
+    Trying to send a malformed batch.
+    :param async_client: asynchronous client.
+    :param request_json: invalid batch.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch", json=request_json
+    )
+
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_batch_balance_overflow(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    A deposit beyond the largest balance fails on its own item.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    maximum = from_minor(MAX_MINOR_UNITS)
+    wallet_uuid = await create_wallet(str(maximum - 1))
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch",
+        json={
+            "atomic": False,
+            "operations": [
+                {
+                    "wallet_uuid": wallet_uuid,
+                    "operation_type": OperationType.DEPOSIT,
+                    "amount": amount,
+                }
+                for amount in (2, 1)
+            ],
+        }
+    )
+
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["results"] == [
+        {"status": BatchItemStatus.BALANCE_OVERFLOW, "balance": None},
+        {"status": BatchItemStatus.OK, "balance": str(maximum)},
+    ]
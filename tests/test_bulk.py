@@ -0,0 +1,180 @@
+"""This module provides tests for bulk wallet creation"""
+
+from decimal import Decimal
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.status import (
+    HTTP_201_CREATED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from wallet_app import bulk
+from wallet_app.config import settings
+from wallet_app.models import Wallet
+
+
+async def check_created(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        response,
+        balances: list[float]
+) -> None:
+    """
+    Checks the streamed wallets against the stored ones.
+    :param async_client: asynchronous client.
+    :param response: response of the bulk endpoint.
+    :param balances: expected initial balances in order.
+    :return: None.
+    """
+    assert response.status_code == HTTP_201_CREATED
+    assert response.headers["content-type"] == "application/x-ndjson"
+    wallets = [json.loads(line) for line in response.text.splitlines()]
+    assert [
+        Decimal(wallet["balance"]) for wallet in wallets
+    ] == balances
+    assert len({wallet["uuid"] for wallet in wallets}) == len(balances)
+    for wallet in wallets:
+        stored = await async_client.get(
+            f"{base_wallets_url}/{wallet['uuid']}"
+        )
+        assert stored.json() == wallet
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "request_json, balances",
+    [
+        ({"count": 3}, [0, 0, 0]),
+        ({"count": 2, "balance": 7.5}, [7.5, 7.5]),
+        ({"balances": [1, 2, 3, 4, 5]}, [1, 2, 3, 4, 5]),
+    ]
+)
+async def test_bulk_create_json(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        request_json: dict,
+        balances: list[float],
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Creating wallets from a JSON request in several chunks.
+    :param async_client: asynchronous client.
+    :param request_json: bulk request.
+    :param balances: expected initial balances.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+
+    response = await async_client.post(
+        f"{base_wallets_url}/bulk", json=request_json
+    )
+
+    await check_created(async_client, base_wallets_url, response, balances)
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_csv_stream(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Creating wallets from a streamed CSV body split across lines,
+    the body is read completely before the transaction is opened.
+    :param async_client: asynchronous client.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+    sent = []
+    import_wallets = bulk.import_wallets
+
+    async def body():
+        for part in (b"balance\n1", b"0\n\n2.5\r\n", b"3"):
+            yield part
+        sent.append(True)
+
+    async def import_after_body(*args):
+        assert sent
+        return await import_wallets(*args)
+
+    monkeypatch.setattr(bulk, "import_wallets", import_after_body)
+
+    response = await async_client.post(
+        f"{base_wallets_url}/bulk",
+        content=body(),
+        headers={"Content-Type": "text/csv"},
+    )
+
+    await check_created(
+        async_client, base_wallets_url, response, [10, 2.5, 3]
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "request_json",
+    [
+        {},
+        {"count": 0},
+        {"count": 2, "balances": [1, 2]},
+        {"balances": []},
+        {"balances": [1, -1]},
+        {"count": 1, "balance": -5},
+    ]
+)
+async def test_bulk_create_invalid_json(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        request_json: dict
+) -> None:
+    """
+    Bulk requests with invalid parameters.
+    :param async_client: asynchronous client.
+    :param request_json: bulk request.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/bulk", json=request_json
+    )
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "content", [b"", b"balance\n", b"1\n2\n3\nabc\n", b"-1"]
+)
+async def test_bulk_create_invalid_csv(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        session_factory: async_sessionmaker,
+        content: bytes,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    CSV bodies without balances or with an invalid line create nothing.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :param content: CSV body.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+    async with session_factory() as session:
+        wallets = await session.scalar(select(func.count(Wallet.uuid)))
+
+    response = await async_client.post(
+        f"{base_wallets_url}/bulk",
+        content=content,
+        headers={"Content-Type": "text/csv"},
+    )
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    async with session_factory() as session:
+        assert await session.scalar(
+            select(func.count(Wallet.uuid))
+        ) == wallets
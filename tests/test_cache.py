@@ -0,0 +1,177 @@
+"""This module provides tests for the wallet balance cache"""
+
+import asyncio
+import uuid
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+
+from wallet_app.cache import (
+    BalanceCache,
+    MemoryCache,
+    RedisCache,
+    balance_cache,
+)
+from wallet_app.schemas import OperationType, SWalletCreated
+
+
+@pytest_asyncio.fixture
+async def fake_redis() -> tuple[str, int]:
+    """
+    Starts a fake server speaking the Redis protocol.
+
+    Supports GET, SET with PX and DEL on an in-memory dictionary.
+    :return: host and port of the server.
+    """
+    data = {}
+
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        while True:
+            try:
+                command = await RedisCache.read_reply(reader)
+            except asyncio.IncompleteReadError:
+                break
+            name = command[0].upper()
+            if name == b"GET":
+                value = data.get(command[1])
+                writer.write(b"$-1\r\n" if value is None else
+                             b"$%d\r\n%s\r\n" % (len(value), value))
+            elif name == b"SET":
+                data[command[1]] = command[2]
+                writer.write(b"+OK\r\n")
+            elif name == b"DEL":
+                deleted = sum(data.pop(key, None) is not None
+                              for key in command[1:])
+                writer.write(b":%d\r\n" % deleted)
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    yield server.sockets[0].getsockname()[:2]
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_lru_and_ttl() -> None:
+    """
+    The memory cache evicts least recently used and expired entries.
+    :return: None.
+    """
+    cache = MemoryCache(max_size=2)
+    await cache.set("a", b"1", ttl=60)
+    await cache.set("b", b"2", ttl=60)
+    assert await cache.get("a") == b"1"
+    await cache.set("c", b"3", ttl=60)
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == b"1"
+    assert await cache.get("c") == b"3"
+
+    await cache.set("d", b"4", ttl=0)
+    assert await cache.get("d") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_cache(fake_redis: tuple[str, int]) -> None:
+    """
+    The Redis protocol backend against a fake server.
+    :param fake_redis: host and port of the fake server.
+    :return: None.
+    """
+    host, port = fake_redis
+    cache = BalanceCache(RedisCache(host, port, max_connections=2), ttl=60)
+    wallet = SWalletCreated(uuid=uuid.uuid4(), balance=12.5)
+
+    assert await cache.get(wallet.uuid) is None
+    await cache.set(wallet)
+    assert await cache.get(wallet.uuid) == wallet
+    await cache.invalidate(wallet.uuid)
+    assert await cache.get(wallet.uuid) is None
+    assert cache.stats.get("errors") == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_unavailable() -> None:
+    """
+    An unavailable server is counted as an error and treated as a miss.
+    :return: None.
+    """
+    cache = BalanceCache(RedisCache("127.0.0.1", 1, max_connections=1), 60)
+
+    assert await cache.get(uuid.uuid4()) is None
+    assert cache.stats.get("errors") == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_timeout() -> None:
+    """
+    A server that does not reply is a miss within the timeout,
+    and the connection of the command is closed.
+    :return: None.
+    """
+    connections = []
+
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        connections.append(writer)
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    backend = RedisCache(host, port, max_connections=1, timeout=0.05)
+    cache = BalanceCache(backend, ttl=60)
+    try:
+        assert await asyncio.wait_for(cache.get(uuid.uuid4()), 1) is None
+        assert cache.stats.get("errors") == 1
+        assert cache.stats.get("misses") == 1
+        assert backend._idle == []
+        await asyncio.sleep(0.05)
+        assert len(connections) == 1
+        assert connections[0].is_closing()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_get_wallet_read_through(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Wallet reads are served from the cache and invalidated by operations.
+    :param async_client: asynchronous client.
+    :param base_wallets_url: base URL of the wallets.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(
+        balance_cache, "backend", MemoryCache(max_size=100)
+    )
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 100}
+    )
+    wallet_uuid = response.json()["uuid"]
+    hits = balance_cache.stats.get("hits")
+
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "100.00"
+    assert balance_cache.stats.get("hits") == hits + 1
+
+    await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": OperationType.DEPOSIT, "amount": 50}
+    )
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "150.00"
+
+    response = await async_client.get("/api/v1/stats")
+    assert response.json()["balance_cache"]["hits"] >= hits + 1
+    assert response.json()["balance_cache"]["invalidations"] >= 1
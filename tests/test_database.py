@@ -0,0 +1,101 @@
+"""This module provides tests for the engine and pool settings"""
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.status import HTTP_200_OK
+
+from wallet_app.config import settings
+from wallet_app.database import engine_options, pool_sizing, prewarm_pool
+
+
+@pytest.mark.parametrize(
+    "workers, max_connections, reserved, max_overflow, expected",
+    [
+        (1, 100, 10, 10, (80, 10)),
+        (4, 100, 10, 10, (12, 10)),
+        (16, 100, 10, 10, (1, 4)),
+        (200, 100, 10, 10, (1, 0)),
+    ]
+)
+def test_pool_sizing(
+        workers: int,
+        max_connections: int,
+        reserved: int,
+        max_overflow: int,
+        expected: tuple[int, int]
+) -> None:
+    """
+    Pools of all workers fit in the server connections.
+    :param workers: number of worker processes.
+    :param max_connections: 'max_connections' of the server.
+    :param reserved: reserved connections.
+    :param max_overflow: requested overflow.
+    :param expected: expected pool size and max overflow.
+    :return: None.
+    """
+    assert pool_sizing(
+        workers, max_connections, reserved, max_overflow
+    ) == expected
+
+
+def test_engine_options() -> None:
+    """
+    Explicit pool size and server-side timeouts are passed to the engine,
+    connections do not notify balance changes by default.
+    :return: None.
+    """
+    config = settings.model_copy(update={
+        "DB_POOL_SIZE": 5,
+        "DB_MAX_OVERFLOW": 2,
+        "DB_STATEMENT_CACHE_SIZE": 0,
+        "DB_STATEMENT_TIMEOUT": 5000,
+        "DB_LOCK_TIMEOUT": 1000,
+    })
+
+    options = engine_options(config)
+
+    assert options["pool_size"] == 5
+    assert options["max_overflow"] == 2
+    assert options["connect_args"] == {
+        "prepared_statement_cache_size": 0,
+        "statement_cache_size": 0,
+        "server_settings": {
+            "statement_timeout": "5000",
+            "lock_timeout": "1000",
+            "wallet.balance_events": "off",
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_pool_gauges(async_client: AsyncClient) -> None:
+    """
+    Getting the pool gauges from the stats endpoint.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.get("/api/v1/stats")
+
+    assert response.status_code == HTTP_200_OK
+    pool = response.json()["db_pool"]
+    assert set(pool) == {
+        "size", "checked_in", "checked_out", "overflow", "utilization"
+    }
+    assert 0 <= pool["utilization"] <= 1
+
+
+@pytest.mark.asyncio
+async def test_prewarm_pool(temp_db: str) -> None:
+    """
+    Prewarming opens connections kept by the pool, at most its size.
+    :param temp_db: temporary database.
+    :return: None.
+    """
+    engine = create_async_engine(temp_db, pool_size=2, max_overflow=5)
+    try:
+        assert await prewarm_pool(engine, 5) == 2
+        assert engine.pool.checkedin() == 2
+        assert engine.pool.checkedout() == 0
+    finally:
+        await engine.dispose()
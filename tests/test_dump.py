@@ -0,0 +1,251 @@
+"""This module provides tests for export and import of the wallets table"""
+
+from decimal import Decimal
+import json
+import uuid
+from typing import Awaitable, Callable
+from uuid import UUID
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+
+from wallet_app import dump
+from wallet_app.config import settings
+from wallet_app.models import Wallet
+from wallet_app.schemas import DumpFormat
+
+ADMIN_URL = "/api/v1/admin/wallets"
+
+
+async def read_dump(content: bytes, data_format: DumpFormat) -> dict:
+    """
+    Parses a dump.
+    :param content: dump.
+    :param data_format: format of the dump.
+    :return: mapping of wallet UUID to balance.
+    """
+    async def body():
+        yield content
+
+    return {
+        wallet_uuid: balance
+        async for wallet_uuid, balance in dump.read_records(
+            body(), data_format
+        )
+    }
+
+
+def csv_dump(balances: dict) -> bytes:
+    """
+    Builds a CSV dump.
+    :param balances: mapping of wallet UUID to balance.
+    :return: dump.
+    """
+    return b"uuid,balance\n" + b"".join(
+        f"{wallet_uuid},{balance}\n".encode()
+        for wallet_uuid, balance in balances.items()
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data_format", list(DumpFormat))
+async def test_export_import_round_trip(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        session_factory: async_sessionmaker,
+        data_format: DumpFormat,
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    A dump restores the full balances, slots of striped wallets included.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :param data_format: format of the dump.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    plain = (await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 2.5}
+    )).json()["uuid"]
+    striped = (await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 10}
+    )).json()["uuid"]
+    await async_client.put(
+        f"{ADMIN_URL}/{striped}/stripes", json={"stripes": 4}
+    )
+    await async_client.post(
+        f"{base_wallets_url}/{striped}/operation",
+        json={"operation_type": "DEPOSIT", "amount": 5},
+    )
+
+    response = await async_client.get(
+        f"{ADMIN_URL}/export", params={"format": data_format.value}
+    )
+
+    assert response.status_code == HTTP_200_OK
+    assert response.headers["content-type"].startswith(
+        dump.MEDIA_TYPES[data_format]
+    )
+    balances = await read_dump(response.content, data_format)
+    assert balances[UUID(plain)] == 2.5
+    assert balances[UUID(striped)] == 15
+
+    for wallet_uuid in (plain, striped):
+        await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/operation",
+            json={"operation_type": "DEPOSIT", "amount": 100},
+        )
+    response = await async_client.post(
+        f"{ADMIN_URL}/import",
+        params={"format": data_format.value},
+        content=response.content,
+    )
+
+    assert response.status_code == HTTP_200_OK
+    progress = [json.loads(line) for line in response.text.splitlines()]
+    assert progress[-1] == {"rows": len(balances)}
+    assert await get_balance(plain) == 2.5
+    assert await get_balance(striped) == 15
+    async with session_factory() as session:
+        wallet = await session.get(Wallet, UUID(striped))
+        assert wallet.stripes == 0
+
+
+@pytest.mark.asyncio
+async def test_import_resumes_from_skip(
+        async_client: AsyncClient,
+        session_factory: async_sessionmaker,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Importing in chunks with progress after every commit
+    and skipping the rows loaded before.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_SIZE", 2)
+    balances = {uuid.uuid4(): float(index) for index in range(5)}
+
+    response = await async_client.post(
+        f"{ADMIN_URL}/import",
+        params={"format": "csv", "skip": 1},
+        content=csv_dump(balances),
+    )
+
+    assert response.status_code == HTTP_200_OK
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"rows": 3}, {"rows": 5}
+    ]
+    async with session_factory() as session:
+        stored = dict((await session.execute(
+            select(Wallet.uuid, Wallet.balance)
+            .where(Wallet.uuid.in_(list(balances)))
+        )).all())
+    assert stored == dict(list(balances.items())[1:])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "data_format, content, error",
+    [
+        (DumpFormat.CSV, b"x,1\n", "Row 3: invalid UUID"),
+        (DumpFormat.CSV, b"%s,-1\n", "Row 3: balance must be >= 0"),
+        (DumpFormat.NDJSON, b"[1]\n", "Row 3: expected an object"),
+        (DumpFormat.BINARY, b"", "Not a binary COPY dump"),
+    ]
+)
+async def test_import_invalid_row(
+        async_client: AsyncClient,
+        data_format: DumpFormat,
+        content: bytes,
+        error: str,
+        monkeypatch: pytest.MonkeyPatch,
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    An invalid row ends the import, the chunks before it stay loaded.
+    :param async_client: asynchronous client.
+    :param data_format: format of the dump.
+    :param content: invalid row.
+    :param error: expected error.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_SIZE", 2)
+    balances = {uuid.uuid4(): 1.0, uuid.uuid4(): 2.0}
+    if data_format == DumpFormat.NDJSON:
+        body = b"".join(
+            json.dumps({"uuid": str(key), "balance": value}).encode() + b"\n"
+            for key, value in balances.items()
+        )
+    else:
+        body = csv_dump(balances)
+    if data_format != DumpFormat.BINARY:
+        body += content.replace(b"%s", str(uuid.uuid4()).encode())
+    rows = 0 if data_format == DumpFormat.BINARY else 2
+
+    response = await async_client.post(
+        f"{ADMIN_URL}/import",
+        params={"format": data_format.value},
+        content=body,
+    )
+
+    assert response.status_code == HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"rows": rows, "error": error}
+    if rows:
+        for wallet_uuid, balance in balances.items():
+            assert await get_balance(wallet_uuid) == balance
+
+
+@pytest.mark.asyncio
+async def test_dump_in_ledger_mode(
+        async_client: AsyncClient,
+        ledger_mode: None
+) -> None:
+    """
+    Export and import are not available in ledger mode.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.get(f"{ADMIN_URL}/export")
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    response = await async_client.post(f"{ADMIN_URL}/import", content=b"")
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_import_file_checkpoint(
+        session_factory: async_sessionmaker,
+        tmp_path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    The command line import resumes from the checkpoint file
+    and removes it when the dump is loaded.
+    :param session_factory: session factory bound to the test database.
+    :param tmp_path: temporary directory.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_SIZE", 2)
+    balances = {uuid.uuid4(): float(index) for index in range(3)}
+    path = tmp_path / "wallets.csv"
+    path.write_bytes(csv_dump(balances))
+    checkpoint = tmp_path / "wallets.csv.checkpoint"
+    dump.write_checkpoint(str(checkpoint), 1)
+
+    rows = await dump.import_file(
+        session_factory, DumpFormat.CSV, str(path), str(checkpoint)
+    )
+
+    assert rows == 3
+    assert not checkpoint.exists()
+    async with session_factory() as session:
+        stored = set((await session.scalars(
+            select(Wallet.uuid).where(Wallet.uuid.in_(list(balances)))
+        )).all())
+    assert stored == set(list(balances)[1:])
@@ -0,0 +1,312 @@
+"""This module provides tests for the balance change stream"""
+
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlencode
+
+import asyncpg
+import pytest
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+    WS_1008_POLICY_VIOLATION,
+)
+
+from wallet_app.config import settings
+from wallet_app.events import CHANNEL, balance_events
+
+EVENTS_URL = "/api/v1/wallets/events"
+# Seconds to wait for an expected event
+TIMEOUT = 5.0
+
+
+@pytest.fixture(autouse=True)
+def events_enabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Enables the balance events, which are off by default, before
+    the client fixture opens its pool.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "BALANCE_EVENTS", True)
+
+
+class Client:
+    """
+    Client of the event stream or WebSocket calling the application
+    directly, since the test transport reads the whole response first.
+    """
+
+    def __init__(self, scope_type: str, wallet_uuids: list[str]) -> None:
+        from wallet_app.main import app
+
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.left = asyncio.Event()
+        self.buffer = ""
+        scope = {
+            "type": scope_type,
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "http" if scope_type == "http" else "ws",
+            "method": "GET",
+            "path": EVENTS_URL,
+            "raw_path": EVENTS_URL.encode(),
+            "root_path": "",
+            "query_string": urlencode(
+                [("wallet_uuid", wallet_uuid) for wallet_uuid in wallet_uuids]
+            ).encode(),
+            "headers": [(b"host", b"test")],
+            "client": ("test", 1),
+            "server": ("test", 80),
+            "subprotocols": [],
+        }
+        self.first = {
+            "http": {"type": "http.request", "body": b""},
+            "websocket": {"type": "websocket.connect"},
+        }[scope_type]
+        self.last = {
+            "http": {"type": "http.disconnect"},
+            "websocket": {"type": "websocket.disconnect", "code": 1000},
+        }[scope_type]
+        self.task = asyncio.ensure_future(
+            app(scope, self.receive, self.messages.put)
+        )
+
+    async def receive(self) -> dict:
+        """Returns the request and then waits for the client to leave."""
+        if self.first is not None:
+            message, self.first = self.first, None
+            return message
+        await self.left.wait()
+        return self.last
+
+    async def message(self) -> dict:
+        """Returns the next message sent by the application."""
+        return await asyncio.wait_for(self.messages.get(), TIMEOUT)
+
+    async def event(self) -> dict:
+        """Returns the data of the next balance change."""
+        while True:
+            if "\n\n" in self.buffer:
+                event, self.buffer = self.buffer.split("\n\n", 1)
+                if event.startswith("event: balance"):
+                    return json.loads(event.split("data: ", 1)[1])
+                continue
+            message = await self.message()
+            if message["type"] == "http.response.body":
+                self.buffer += message["body"].decode()
+            elif message["type"] == "websocket.send":
+                return json.loads(message["text"])
+
+    async def leave(self) -> None:
+        """Disconnects and waits for the application to finish."""
+        self.left.set()
+        await asyncio.wait_for(self.task, TIMEOUT)
+
+
+async def deposit(
+        async_client: AsyncClient, base_wallets_url: str, wallet_uuid: str,
+        amount=1
+) -> None:
+    """
+    Deposits to a wallet.
+    :param async_client: asynchronous client.
+    :param wallet_uuid: UUID of the wallet.
+    :param amount: amount of the deposit.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": amount},
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scope_type", ["http", "websocket"])
+async def test_balance_changes(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        scope_type: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    The current balance is sent first, then every change.
+    The subscription is removed when the client leaves.
+    :param async_client: asynchronous client.
+    :param scope_type: 'http' for the event stream or 'websocket'.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(10)
+    client = Client(scope_type, [wallet_uuid])
+
+    first = await client.message()
+    assert first["type"] in ("http.response.start", "websocket.accept")
+    if scope_type == "http":
+        assert first["status"] == 200
+        assert (b"content-type", b"text/event-stream; charset=utf-8") in (
+            first["headers"]
+        )
+    assert await client.event() == {"uuid": wallet_uuid, "balance": "10.00"}
+    await deposit(async_client, base_wallets_url, wallet_uuid, 5)
+    assert await client.event() == {"uuid": wallet_uuid, "balance": "15.00"}
+
+    await client.leave()
+    assert len(balance_events) == 0
+
+
+@pytest.mark.asyncio
+async def test_changes_are_merged(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Changes arriving between two pushes are merged into the latest
+    balance, changes of transfers are sent for both wallets.
+    :param async_client: asynchronous client.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "EVENTS_COALESCE_INTERVAL", 0.5)
+    source = await create_wallet(10)
+    target = await create_wallet()
+    client = Client("http", [source, target])
+    initial = [await client.event(), await client.event()]
+    assert sorted(event["balance"] for event in initial) == ["0.00", "10.00"]
+    merged = balance_events.stats.get("merged")
+
+    for _ in range(3):
+        await deposit(async_client, base_wallets_url, source)
+    await async_client.post("/api/v1/transfers", json={
+        "from_wallet_uuid": source, "to_wallet_uuid": target, "amount": 4,
+    })
+
+    changes = [await client.event(), await client.event()]
+    assert sorted(changes, key=lambda event: event["balance"]) == [
+        {"uuid": target, "balance": "4.00"},
+        {"uuid": source, "balance": "9.00"},
+    ]
+    assert balance_events.stats.get("merged") == merged + 3
+    await client.leave()
+
+
+@pytest.mark.asyncio
+async def test_changes_without_balance(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        ledger_mode: None,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Balances not carried by the notification are read from the database.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(3)
+    client = Client("websocket", [wallet_uuid])
+    assert await client.event() == {"uuid": wallet_uuid, "balance": "3.00"}
+    reads = balance_events.stats.get("reads")
+
+    await deposit(async_client, base_wallets_url, wallet_uuid, 2)
+
+    assert await client.event() == {"uuid": wallet_uuid, "balance": "5.00"}
+    assert balance_events.stats.get("reads") == reads + 1
+    await client.leave()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "setting, value, status_code",
+    [
+        (None, None, HTTP_404_NOT_FOUND),
+        ("BALANCE_EVENTS", False, HTTP_400_BAD_REQUEST),
+        ("EVENTS_MAX_WALLETS", 1, HTTP_422_UNPROCESSABLE_ENTITY),
+    ]
+)
+async def test_subscription_errors(
+        async_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+        setting: Optional[str],
+        value,
+        status_code: int,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Subscriptions to missing wallets, to too many wallets or with
+    disabled events are rejected, WebSockets are closed instead.
+    :param async_client: asynchronous client.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :param setting: changed setting.
+    :param value: value of the setting.
+    :param status_code: expected status code.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    wallet_uuids = [str(uuid.uuid4())]
+    if setting is not None:
+        monkeypatch.setattr(settings, setting, value)
+        wallet_uuids = [
+            await create_wallet(),
+            await create_wallet(),
+        ]
+
+    response = await async_client.get(
+        EVENTS_URL, params={"wallet_uuid": wallet_uuids}
+    )
+    client = Client("websocket", wallet_uuids)
+
+    assert response.status_code == status_code
+    message = await client.message()
+    assert message["type"] == "websocket.close"
+    assert message["code"] == WS_1008_POLICY_VIOLATION
+    await client.leave()
+    assert len(balance_events) == 0
+
+
+@pytest.mark.asyncio
+async def test_events_disabled_on_connection(temp_db: str) -> None:
+    """
+    Connections with 'wallet.balance_events' off do not notify.
+    :param temp_db: temporary database.
+    :return: None.
+    """
+    dsn = temp_db.replace("+asyncpg", "")
+    listener = await asyncpg.connect(dsn)
+    writers = [
+        await asyncpg.connect(dsn),
+        await asyncpg.connect(
+            dsn, server_settings={"wallet.balance_events": "off"}
+        ),
+    ]
+    payloads = asyncio.Queue()
+    await listener.add_listener(
+        CHANNEL, lambda *args: payloads.put_nowait(args[-1])
+    )
+    try:
+        for writer in reversed(writers):
+            wallet_uuid = await writer.fetchval(
+                "INSERT INTO wallets (uuid, balance) VALUES ($1, 0) "
+                "RETURNING uuid", uuid.uuid4()
+            )
+            await writer.execute(
+                "INSERT INTO wallet_operations "
+                "(wallet_uuid, operation_type, amount, balance) "
+                "VALUES ($1, 'DEPOSIT', 250, 250), ($1, 'DEPOSIT', 1, 251)",
+                wallet_uuid
+            )
+
+        payload = await asyncio.wait_for(payloads.get(), TIMEOUT)
+        assert payload == f"{wallet_uuid}:251"
+        assert payloads.empty()
+    finally:
+        for connection in [listener, *writers]:
+            await connection.close()
@@ -0,0 +1,135 @@
+"""This module provides tests for group commit of wallet operations"""
+
+import asyncio
+from decimal import Decimal
+from typing import Awaitable, Callable
+import uuid
+
+import pytest
+from httpx import AsyncClient, Response
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+)
+
+from wallet_app.config import settings
+from wallet_app.groupcommit import wallet_queues
+from wallet_app.money import MAX_MINOR_UNITS, from_minor
+
+
+@pytest.fixture
+def group_commit(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Enables group commit of wallet operations.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "GROUP_COMMIT", True)
+    monkeypatch.setattr(settings, "GROUP_COMMIT_MAX_BATCH", 8)
+
+
+@pytest.mark.asyncio
+async def test_group_commit_deposits(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        group_commit: None,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Concurrent deposits to one wallet are committed in groups.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    commits = wallet_queues.stats.get("commits")
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, "DEPOSIT", 1)
+        for _ in range(40)
+    ))
+
+    assert all(r.status_code == HTTP_200_OK for r in responses)
+    balances = sorted(Decimal(r.json()["balance"]) for r in responses)
+    assert balances == list(range(1, 41))
+    assert wallet_queues.stats.get("commits") - commits < 40
+    assert len(wallet_queues) == 0
+    history = await async_client.get(
+        f"{base_wallets_url}/{wallet_uuid}/operations"
+    )
+    assert len(history.json()["operations"]) == 40
+
+
+@pytest.mark.asyncio
+async def test_group_commit_errors_per_caller(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        group_commit: None,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    A failed operation in a group fails only its own request.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 10}
+    )
+    wallet_uuid = response.json()["uuid"]
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, "WITHDRAW", 3)
+        for _ in range(5)
+    ))
+
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [HTTP_200_OK] * 3 + [HTTP_400_BAD_REQUEST] * 2
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "1.00"
+
+
+@pytest.mark.asyncio
+async def test_group_commit_not_found(
+        group_commit: None,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Operation on a missing wallet through the queue.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await operate(str(uuid.uuid4()), "DEPOSIT", 1)
+    assert response.status_code == HTTP_404_NOT_FOUND
+    assert len(wallet_queues) == 0
+
+
+@pytest.mark.asyncio
+async def test_group_commit_balance_overflow(
+        group_commit: None,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]],
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Deposits beyond the largest balance fail only their own requests.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    maximum = from_minor(MAX_MINOR_UNITS)
+    wallet_uuid = await create_wallet(str(maximum - 5))
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, "DEPOSIT", 2)
+        for _ in range(4)
+    ))
+
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [HTTP_200_OK] * 2 + [HTTP_400_BAD_REQUEST] * 2
+    assert await get_balance(wallet_uuid) == maximum - 1
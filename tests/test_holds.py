@@ -0,0 +1,259 @@
+"""This module provides tests for holds of wallet funds"""
+
+import asyncio
+from decimal import Decimal
+from typing import Awaitable, Callable
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from wallet_app.holds import read_hold, stats, sweep_expired
+from wallet_app.schemas import HoldStatus
+
+HOLDS_URL = "/api/v1/holds"
+
+
+@pytest.mark.asyncio
+async def test_hold_capture(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    A hold withdraws its amount at once, the capture leaves
+    the balance as it is and can be repeated.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(10)
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/holds", json={"amount": "7.5"}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    hold = response.json()
+    assert hold["wallet_uuid"] == wallet_uuid
+    assert hold["amount"] == "7.50"
+    assert hold["status"] == HoldStatus.ACTIVE
+    assert await get_balance(wallet_uuid) == Decimal("2.50")
+
+    for _ in range(2):
+        response = await async_client.post(
+            f"{HOLDS_URL}/{hold['id']}/capture"
+        )
+        assert response.status_code == HTTP_200_OK
+        assert response.json() == {**hold, "status": HoldStatus.CAPTURED}
+    assert await get_balance(wallet_uuid) == Decimal("2.50")
+
+    response = await async_client.post(f"{HOLDS_URL}/{hold['id']}/release")
+    assert response.status_code == HTTP_409_CONFLICT
+    assert response.json() == {"detail": "Hold is captured"}
+
+
+@pytest.mark.asyncio
+async def test_hold_release(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    Releasing a hold returns its amount, a released hold
+    cannot be captured.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(10)
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/holds", json={"amount": 4}
+    )
+    hold = response.json()
+
+    for _ in range(2):
+        response = await async_client.post(
+            f"{HOLDS_URL}/{hold['id']}/release"
+        )
+        assert response.status_code == HTTP_200_OK
+        assert response.json()["status"] == HoldStatus.RELEASED
+    assert await get_balance(wallet_uuid) == Decimal("10.00")
+
+    response = await async_client.post(f"{HOLDS_URL}/{hold['id']}/capture")
+    assert response.status_code == HTTP_409_CONFLICT
+    assert response.json() == {"detail": "Hold is released"}
+
+
+@pytest.mark.asyncio
+async def test_hold_limits_withdrawals(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Withdrawals, transfers and other holds see only the balance
+    not reserved by active holds.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(10)
+    other_uuid = await create_wallet(0)
+    await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/holds", json={"amount": 7}
+    )
+
+    responses = [
+        await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/operation",
+            json={"operation_type": "WITHDRAW", "amount": 5},
+        ),
+        await async_client.post("/api/v1/transfers", json={
+            "from_wallet_uuid": wallet_uuid,
+            "to_wallet_uuid": other_uuid,
+            "amount": 5,
+        }),
+        await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/holds", json={"amount": 5}
+        ),
+    ]
+
+    for response in responses:
+        assert response.status_code == HTTP_400_BAD_REQUEST
+        assert response.json() == {"detail": "Insufficient funds"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "path, json, status_code, detail",
+    [
+        ("wallet", {"amount": 0}, HTTP_400_BAD_REQUEST,
+         "Hold amount must be positive"),
+        ("missing_wallet", {"amount": 1}, HTTP_404_NOT_FOUND,
+         "Wallet not found"),
+        ("missing_hold/capture", None, HTTP_404_NOT_FOUND, "Hold not found"),
+        ("missing_hold/release", None, HTTP_404_NOT_FOUND, "Hold not found"),
+    ]
+)
+async def test_hold_errors(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        path: str,
+        json,
+        status_code: int,
+        detail: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Invalid amounts, missing wallets and missing holds are rejected.
+    :param async_client: asynchronous client.
+    :param path: target of the request.
+    :param json: request body.
+    :param status_code: expected status code.
+    :param detail: expected error.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    targets = {
+        "wallet": await create_wallet(1),
+        "missing_wallet": uuid.uuid4(),
+        "missing_hold": uuid.uuid4(),
+    }
+    target, _, step = path.partition("/")
+    if step:
+        url = f"{HOLDS_URL}/{targets[target]}/{step}"
+    else:
+        url = f"{base_wallets_url}/{targets[target]}/holds"
+
+    response = await async_client.post(url, json=json)
+
+    assert response.status_code == status_code
+    assert response.json() == {"detail": detail}
+
+
+@pytest.mark.asyncio
+async def test_hold_lifetime_is_limited(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Holds living longer than a week are rejected.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet(1)
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/holds",
+        json={"amount": 1, "ttl": 8 * 24 * 3600},
+    )
+
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["default", "ledger"])
+async def test_expired_holds_are_swept(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        session_factory: async_sessionmaker,
+        request: pytest.FixtureRequest,
+        mode: str,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    Expired holds cannot be captured and are released in batches
+    by the sweeper, also in ledger mode.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the temporary database.
+    :param request: pytest request to switch to ledger mode.
+    :param mode: 'default' or 'ledger'.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    if mode == "ledger":
+        request.getfixturevalue("ledger_mode")
+    wallet_uuids = [
+        await create_wallet(10),
+        await create_wallet(10),
+    ]
+    hold_ids = []
+    for wallet_uuid, amount in zip(wallet_uuids * 2, [1, 2, 3, 4]):
+        response = await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/holds",
+            json={"amount": amount, "ttl": 0.05},
+        )
+        hold_ids.append(response.json()["id"])
+    await asyncio.sleep(0.2)
+
+    response = await async_client.post(f"{HOLDS_URL}/{hold_ids[0]}/capture")
+    assert response.status_code == HTTP_409_CONFLICT
+    assert response.json() == {"detail": "Hold is expired"}
+    expired = stats.get("expired")
+
+    assert await sweep_expired(session_factory, batch_size=3) >= 4
+
+    assert stats.get("expired") >= expired + 4
+    async with session_factory() as session:
+        for hold_id in hold_ids:
+            hold = await read_hold(session, uuid.UUID(hold_id))
+            assert hold.status == HoldStatus.EXPIRED
+    for wallet_uuid in wallet_uuids:
+        assert await get_balance(wallet_uuid) == Decimal("10.00")
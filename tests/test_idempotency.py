@@ -0,0 +1,228 @@
+"""This module provides tests for idempotency keys of wallet operations"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from wallet_app import idempotency
+from wallet_app.models import IdempotencyKey
+from wallet_app.schemas import OperationType
+
+
+async def deposit(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        wallet_uuid: str,
+        amount: float,
+        key: str
+):
+    """
+    Deposits to the wallet with an idempotency key.
+    :param async_client: asynchronous client.
+    :param wallet_uuid: UUID of the wallet.
+    :param amount: amount of the deposit.
+    :param key: idempotency key.
+    :return: response.
+    """
+    return await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": OperationType.DEPOSIT, "amount": amount},
+        headers={"Idempotency-Key": key}
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cached", [True, False])
+async def test_retry_applied_once(
+        async_client: AsyncClient,
+        cached: bool,
+        base_wallets_url: str
+) -> None:
+    """
+    Retrying a deposit with the same key returns the first response.
+    :param async_client: asynchronous client.
+    :param cached: whether the retry is answered from the in-process cache.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 100}
+    )
+    wallet_uuid = response.json()["uuid"]
+    key = str(uuid.uuid4())
+
+    first = await deposit(async_client, base_wallets_url, wallet_uuid, 50, key)
+    if not cached:
+        idempotency.cache.clear()
+    retry = await deposit(async_client, base_wallets_url, wallet_uuid, 50, key)
+
+    assert first.status_code == retry.status_code == HTTP_200_OK
+    assert retry.json() == first.json() == {
+        "uuid": wallet_uuid, "balance": "150.00"
+    }
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "150.00"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Concurrent requests with the same key are applied once.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    key = str(uuid.uuid4())
+
+    responses = await asyncio.gather(*(
+        deposit(async_client, base_wallets_url, wallet_uuid, 10, key)
+        for _ in range(5)
+    ))
+
+    assert all(response.status_code == HTTP_200_OK for response in responses)
+    assert {response.json()["balance"] for response in responses} == {"10.00"}
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "10.00"
+
+
+@pytest.mark.asyncio
+async def test_key_reused_for_different_request(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Reusing a key for a different request is rejected.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    key = str(uuid.uuid4())
+
+    await deposit(async_client, base_wallets_url, wallet_uuid, 10, key)
+    response = await deposit(
+        async_client, base_wallets_url, wallet_uuid, 20, key
+    )
+
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_key_reused_concurrently(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    A request reusing a key committed concurrently with a different
+    request is rejected and rolled back.
+
+    The first lookup misses as if the other request had not committed
+    yet, so the key is found taken when the response is saved.
+    :param async_client: asynchronous client.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    key = str(uuid.uuid4())
+    await deposit(async_client, base_wallets_url, wallet_uuid, 10, key)
+    lookup = idempotency.lookup
+    missed = []
+
+    async def lookup_after_miss(session, idempotency_key):
+        if not missed:
+            missed.append(idempotency_key)
+            return None
+        return await lookup(session, idempotency_key)
+
+    monkeypatch.setattr(idempotency, "lookup", lookup_after_miss)
+
+    response = await deposit(
+        async_client, base_wallets_url, wallet_uuid, 20, key
+    )
+
+    assert missed == [key]
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "10.00"
+
+
+@pytest.mark.asyncio
+async def test_failed_operation_not_stored(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    A failed operation does not use up the key.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    key = str(uuid.uuid4())
+    operation = {"operation_type": OperationType.WITHDRAW, "amount": 10}
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json=operation, headers={"Idempotency-Key": key}
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+    await deposit(async_client, base_wallets_url, wallet_uuid, 10,
+                  str(uuid.uuid4()))
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json=operation, headers={"Idempotency-Key": key}
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["balance"] == "0.00"
+
+
+@pytest.mark.asyncio
+async def test_purge_expired(session_factory: async_sessionmaker) -> None:
+    """
+    Expired keys are purged in batches, live keys are kept.
+    :param session_factory: session factory bound to the test database.
+    :return: None.
+    """
+    now = datetime.now(timezone.utc)
+    prefix = str(uuid.uuid4())
+    async with session_factory() as session:
+        for i in range(5):
+            session.add(IdempotencyKey(
+                key=f"{prefix}-{i}",
+                request_hash="",
+                response={},
+                expires_at=now + timedelta(hours=1 if i == 0 else -1),
+            ))
+        await session.commit()
+
+    assert await idempotency.purge_expired(session_factory, 2) >= 4
+
+    async with session_factory() as session:
+        remaining = await session.scalar(
+            select(func.count()).where(IdempotencyKey.key.like(f"{prefix}%"))
+        )
+    assert remaining == 1
@@ -0,0 +1,268 @@
+"""This module provides tests for the wallet ledger"""
+
+import asyncio
+from typing import Awaitable, Callable
+import uuid
+
+import pytest
+from httpx import AsyncClient, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+)
+
+from wallet_app.config import settings
+from wallet_app.exceptions import StorageModeError
+from wallet_app.ledger import (
+    LEDGER_STORAGE,
+    ROW_STORAGE,
+    check_storage,
+    compact_once,
+    convert_storage,
+)
+from wallet_app.models import Wallet, WalletOperation, WalletSnapshot
+from wallet_app.schemas import OperationType
+
+
+@pytest.mark.asyncio
+async def test_operations_recorded(
+        async_client: AsyncClient,
+        session_factory: async_sessionmaker,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Applied operations are recorded in the ledger with their balance.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 100}
+    )
+    wallet_uuid = response.json()["uuid"]
+    await operate(wallet_uuid, OperationType.DEPOSIT, 50)
+    await operate(wallet_uuid, OperationType.WITHDRAW, 500)
+    await operate(wallet_uuid, OperationType.WITHDRAW, 30)
+
+    async with session_factory() as session:
+        result = await session.execute(
+            select(WalletOperation.operation_type, WalletOperation.amount,
+                   WalletOperation.balance)
+            .where(WalletOperation.wallet_uuid == uuid.UUID(wallet_uuid))
+            .order_by(WalletOperation.id)
+        )
+        assert [tuple(row) for row in result] == [
+            (OperationType.DEPOSIT, 50, 150),
+            (OperationType.WITHDRAW, 30, 120),
+        ]
+
+
+@pytest.mark.asyncio
+async def test_ledger_mode_operations(
+        ledger_mode: None,
+        async_client: AsyncClient,
+        session_factory: async_sessionmaker,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Deposits and withdrawals in ledger mode leave the wallet row intact.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 100}
+    )
+    wallet_uuid = response.json()["uuid"]
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, OperationType.DEPOSIT, 10)
+        for _ in range(5)
+    ))
+    assert all(response.status_code == HTTP_200_OK for response in responses)
+
+    response = await operate(wallet_uuid, OperationType.WITHDRAW, 120)
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["balance"] == "30.00"
+
+    response = await operate(wallet_uuid, OperationType.WITHDRAW, 31)
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "30.00"
+
+    async with session_factory() as session:
+        wallet = await session.get(Wallet, uuid.UUID(wallet_uuid))
+        assert wallet.balance == 100
+
+
+@pytest.mark.asyncio
+async def test_ledger_mode_not_exist_wallet(
+        ledger_mode: None,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Operations on a wallet that does not exist in ledger mode.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    for operation_type in OperationType:
+        response = await operate(str(uuid.uuid4()), operation_type, 10)
+        assert response.status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_ledger_compaction(
+        ledger_mode: None,
+        async_client: AsyncClient,
+        session_factory: async_sessionmaker,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    The compactor rolls the ledger tail into a snapshot.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 5}
+    )
+    wallet_uuid = response.json()["uuid"]
+    for amount in (1, 2, 3, 4):
+        await operate(wallet_uuid, OperationType.DEPOSIT, amount)
+
+    compacted, after_id = await compact_once(session_factory)
+    assert compacted >= 1
+    async with session_factory() as session:
+        snapshot = await session.get(WalletSnapshot, uuid.UUID(wallet_uuid))
+        last_id = await session.scalar(
+            select(func.max(WalletOperation.id))
+            .where(WalletOperation.wallet_uuid == uuid.UUID(wallet_uuid))
+        )
+    assert snapshot.balance == 15
+    assert snapshot.operation_id == last_id
+    assert after_id >= last_id
+
+    await operate(wallet_uuid, OperationType.WITHDRAW, 6)
+    compacted, _ = await compact_once(session_factory, after_id)
+    assert compacted == 0
+
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "9.00"
+
+
+@pytest.mark.asyncio
+async def test_ledger_mode_batch(
+        ledger_mode: None,
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Batch operations in ledger mode.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 10}
+    )
+    wallet_uuid = response.json()["uuid"]
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch",
+        json={
+            "atomic": False,
+            "operations": [
+                {"wallet_uuid": wallet_uuid,
+                 "operation_type": OperationType.DEPOSIT,
+                 "amount": 5},
+                {"wallet_uuid": wallet_uuid,
+                 "operation_type": OperationType.WITHDRAW,
+                 "amount": 20},
+                {"wallet_uuid": wallet_uuid,
+                 "operation_type": OperationType.WITHDRAW,
+                 "amount": 15},
+            ],
+        }
+    )
+    assert [result["balance"] for result in response.json()["results"]] == [
+        "15.00", None, "0.00"
+    ]
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "0.00"
+
+
+@pytest.mark.asyncio
+async def test_storage_conversion(
+        async_client: AsyncClient,
+        session_factory: async_sessionmaker,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Balances written in row mode, striped ones included, are the same
+    after the conversion to the ledger and ledger balances after the
+    conversion back, the app only starts in the stored mode.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the test database.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    wallet_uuids = []
+    for balance in (100, 10):
+        response = await async_client.post(
+            f"{base_wallets_url}/add", json={"balance": balance}
+        )
+        wallet_uuids.append(response.json()["uuid"])
+    response = await async_client.put(
+        f"/api/v1/admin/wallets/{wallet_uuids[1]}/stripes",
+        json={"stripes": 2},
+    )
+    assert response.status_code == HTTP_200_OK
+    for wallet_uuid in wallet_uuids:
+        await operate(wallet_uuid, OperationType.DEPOSIT, 50)
+        await operate(wallet_uuid, OperationType.WITHDRAW, 30)
+
+    async def balances() -> list[str]:
+        return [
+            (await async_client.get(
+                f"{base_wallets_url}/{wallet_uuid}"
+            )).json()["balance"]
+            for wallet_uuid in wallet_uuids
+        ]
+
+    await check_storage(session_factory)
+    try:
+        assert await convert_storage(session_factory, LEDGER_STORAGE)
+        assert not await convert_storage(session_factory, LEDGER_STORAGE)
+        with pytest.raises(StorageModeError):
+            await check_storage(session_factory)
+
+        monkeypatch.setattr(settings, "LEDGER_MODE", True)
+        await check_storage(session_factory)
+        assert await balances() == ["120.00", "30.00"]
+        await operate(wallet_uuids[0], OperationType.DEPOSIT, 5)
+        assert await balances() == ["125.00", "30.00"]
+    finally:
+        await convert_storage(session_factory, ROW_STORAGE)
+
+    monkeypatch.setattr(settings, "LEDGER_MODE", False)
+    await check_storage(session_factory)
+    async with session_factory() as session:
+        result = await session.execute(
+            select(Wallet.balance, Wallet.stripes)
+            .where(Wallet.uuid.in_([uuid.UUID(u) for u in wallet_uuids]))
+            .order_by(Wallet.balance.desc())
+        )
+        assert [tuple(row) for row in result] == [(125, 0), (30, 0)]
+    await operate(wallet_uuids[1], OperationType.WITHDRAW, 30)
+    assert await balances() == ["125.00", "0.00"]
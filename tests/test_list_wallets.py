@@ -0,0 +1,207 @@
+"""This module provides tests for the wallet listing"""
+
+import random
+from decimal import Decimal
+
+import pytest
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_422_UNPROCESSABLE_ENTITY
+
+ADMIN_URL = "/api/v1/admin/wallets"
+
+
+def unique_balance() -> Decimal:
+    """
+    Returns a balance no other wallet of the test database has,
+    so filters on it find only the wallets of the test.
+    :return: balance.
+    """
+    return Decimal(random.randrange(10 ** 9, 10 ** 12))
+
+
+async def create_wallets(
+        async_client: AsyncClient, base_wallets_url: str, balances: list
+) -> list[str]:
+    """
+    Creates wallets with the given balances.
+    :param async_client: asynchronous client.
+    :param balances: initial balances.
+    :return: UUIDs of the wallets.
+    """
+    uuids = []
+    for balance in balances:
+        response = await async_client.post(
+            f"{base_wallets_url}/add", json={"balance": balance}
+        )
+        uuids.append(response.json()["uuid"])
+    return uuids
+
+
+async def list_all(
+        async_client: AsyncClient, base_wallets_url: str, **params
+) -> tuple[list[dict], int]:
+    """
+    Reads every page of the listing.
+    :param async_client: asynchronous client.
+    :param params: query parameters.
+    :return: wallets and number of pages.
+    """
+    wallets = []
+    pages = 0
+    cursor = None
+    while True:
+        if cursor:
+            params["cursor"] = cursor
+        response = await async_client.get(base_wallets_url, params=params)
+        assert response.status_code == HTTP_200_OK
+        data = response.json()
+        wallets += data["wallets"]
+        pages += 1
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return wallets, pages
+
+
+@pytest.mark.asyncio
+async def test_list_wallets_pages(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Pages follow each other in UUID order without gaps or repeats.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    uuids = await create_wallets(
+        async_client, base_wallets_url, [1, 2, 3, 4, 5]
+    )
+
+    wallets, pages = await list_all(
+        async_client, base_wallets_url, limit=2
+    )
+
+    listed = [wallet["uuid"] for wallet in wallets]
+    assert listed == sorted(set(listed))
+    assert set(uuids) <= set(listed)
+    assert pages == (len(listed) + 1) // 2
+    assert set(wallets[0]) == {"uuid", "balance", "stripes", "version"}
+
+
+@pytest.mark.asyncio
+async def test_list_wallets_balance_range(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Filtering by an inclusive range of the full balance,
+    slots of striped wallets included.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    base = unique_balance()
+    _, middle, _ = await create_wallets(
+        async_client, base_wallets_url,
+        [str(base + Decimal("0.01")), str(base + Decimal("0.02")),
+         str(base + 5)]
+    )
+    striped, = await create_wallets(async_client, base_wallets_url, [0])
+    await async_client.put(
+        f"{ADMIN_URL}/{striped}/stripes", json={"stripes": 2}
+    )
+    await async_client.post(
+        f"{base_wallets_url}/{striped}/operation",
+        json={"operation_type": "DEPOSIT",
+              "amount": str(base + Decimal("0.03"))},
+    )
+
+    wallets, _ = await list_all(
+        async_client, base_wallets_url, limit=1,
+        min_balance=str(base + Decimal("0.02")),
+        max_balance=str(base + Decimal("0.03")),
+    )
+
+    assert sorted(wallet["uuid"] for wallet in wallets) == sorted(
+        [middle, striped]
+    )
+    assert {Decimal(wallet["balance"]) for wallet in wallets} == {
+        base + Decimal("0.02"), base + Decimal("0.03")
+    }
+
+
+@pytest.mark.asyncio
+async def test_list_wallets_fields(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Only the requested fields are returned.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    balance = str(unique_balance() + Decimal("0.5"))
+    await create_wallets(async_client, base_wallets_url, [balance])
+
+    response = await async_client.get(base_wallets_url, params={
+        "fields": "balance", "min_balance": balance, "max_balance": balance,
+    })
+
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {
+        "wallets": [{"balance": f"{balance}0"}], "next_cursor": None
+    }
+
+
+@pytest.mark.asyncio
+async def test_list_wallets_in_ledger_mode(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        ledger_mode: None
+) -> None:
+    """
+    In ledger mode the balances are read from the ledger.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    balance = unique_balance()
+    wallet_uuid, = await create_wallets(
+        async_client, base_wallets_url, [str(balance)]
+    )
+    await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": 1},
+    )
+
+    wallets, _ = await list_all(
+        async_client, base_wallets_url,
+        min_balance=str(balance + 1), max_balance=str(balance + 1),
+        fields="uuid,balance",
+    )
+
+    assert wallets == [{"uuid": wallet_uuid, "balance": f"{balance + 1}.00"}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"fields": "uuid,owner"},
+        {"limit": 0},
+        {"cursor": "abc"},
+        {"min_balance": -1},
+        {"max_balance": "0.001"},
+    ]
+)
+async def test_list_wallets_invalid(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        params: dict
+) -> None:
+    """
+    Invalid listing parameters are rejected.
+    :param async_client: asynchronous client.
+    :param params: invalid query parameters.
+    :return: None.
+    """
+    response = await async_client.get(base_wallets_url, params=params)
+
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,243 @@
+"""This module provides tests for the lookups of missing wallets"""
+
+import json
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_204_NO_CONTENT,
+    HTTP_404_NOT_FOUND,
+)
+
+from wallet_app.config import settings
+from wallet_app import lookups
+from wallet_app.lookups import BloomFilter, NegativeCache, wallet_lookups
+
+
+@pytest.fixture
+def wallet_filter(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Sizes the Bloom filter of wallet UUIDs for the tests
+    and removes it afterwards.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "WALLET_FILTER_CAPACITY", 10 ** 6)
+    monkeypatch.setattr(settings, "WALLET_FILTER_SINGLE_WRITER", True)
+    yield
+    wallet_lookups.filter = None
+
+
+def test_negative_cache_lru_and_ttl() -> None:
+    """
+    The negative cache evicts least recently added and expired entries.
+    :return: None.
+    """
+    first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    cache = NegativeCache(max_size=2, ttl=60)
+    cache.add(first)
+    cache.add(second)
+    cache.add(first)
+    cache.add(third)
+
+    assert second not in cache
+    assert first in cache and third in cache
+    cache.discard(first)
+    assert first not in cache
+
+    cache.ttl = 0
+    cache.add(second)
+    assert second not in cache
+    assert len(cache) == 1
+
+
+def test_bloom_filter() -> None:
+    """
+    Added UUIDs are always found, others at about the error rate.
+    :return: None.
+    """
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    added = [uuid.uuid4() for _ in range(10000)]
+    for wallet_uuid in added:
+        bloom.add(wallet_uuid)
+
+    assert all(wallet_uuid in bloom for wallet_uuid in added)
+    false_positives = sum(uuid.uuid4() in bloom for _ in range(10000))
+    assert false_positives < 200
+    assert bloom.error_rate() == pytest.approx(0.01, rel=0.1)
+
+
+def test_bloom_filter_size_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    A filter over the addressable size is cut down with fewer hashes.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(lookups, "MAX_BITS", 1024)
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [uuid.uuid4() for _ in range(1000)]
+    for wallet_uuid in added:
+        bloom.add(wallet_uuid)
+
+    assert bloom.size == 1024
+    assert bloom.hashes == 1
+    assert len(bloom._bits) == 128
+    assert all(wallet_uuid in bloom for wallet_uuid in added)
+
+
+@pytest.mark.asyncio
+async def test_missing_wallet_is_remembered(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    A wallet the database did not find is answered from the negative
+    cache by reads, operations and deletes.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    wallet_uuid = uuid.uuid4()
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.status_code == HTTP_404_NOT_FOUND
+    hits = wallet_lookups.stats.get("negative_hits")
+
+    responses = [
+        await async_client.get(f"{base_wallets_url}/{wallet_uuid}"),
+        await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/operation",
+            json={"operation_type": "DEPOSIT", "amount": 1},
+        ),
+        await async_client.delete(f"{base_wallets_url}/{wallet_uuid}"),
+    ]
+
+    assert [response.status_code for response in responses] == [
+        HTTP_404_NOT_FOUND
+    ] * 3
+    assert responses[0].json() == {"detail": "Wallet not found"}
+    assert wallet_lookups.stats.get("negative_hits") == hits + 3
+
+
+@pytest.mark.asyncio
+async def test_deleted_wallet_is_remembered(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    A deleted wallet is answered from the negative cache.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    response = await async_client.delete(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.status_code == HTTP_204_NO_CONTENT
+    hits = wallet_lookups.stats.get("negative_hits")
+
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+
+    assert response.status_code == HTTP_404_NOT_FOUND
+    assert wallet_lookups.stats.get("negative_hits") == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_negative_cache_disabled(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    With the negative cache disabled every lookup reads the database.
+    :param async_client: asynchronous client.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "NEGATIVE_CACHE", False)
+    wallet_uuid = uuid.uuid4()
+    hits = wallet_lookups.stats.get("negative_hits")
+
+    for _ in range(2):
+        response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+        assert response.status_code == HTTP_404_NOT_FOUND
+
+    assert wallet_lookups.stats.get("negative_hits") == hits
+    assert wallet_uuid not in wallet_lookups.missing
+
+
+@pytest.mark.asyncio
+async def test_wallet_filter(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        session_factory: async_sessionmaker,
+        wallet_filter: None
+) -> None:
+    """
+    The filter holds existing wallets and the ones created later,
+    UUIDs missing in it are rejected without the database.
+    :param async_client: asynchronous client.
+    :param session_factory: session factory bound to the temporary database.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    existing = response.json()["uuid"]
+    await wallet_lookups.build_filter(session_factory)
+    assert wallet_lookups.filter.items >= 1
+
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    created = response.json()["uuid"]
+    response = await async_client.post(
+        f"{base_wallets_url}/bulk", json={"balances": [1, 2]}
+    )
+    bulk_created = [
+        json.loads(line)["uuid"] for line in response.text.splitlines()
+    ]
+    for wallet_uuid in [existing, created, *bulk_created]:
+        response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+        assert response.status_code == HTTP_200_OK
+
+    rejected = wallet_lookups.stats.get("rejected")
+    missing = [uuid.uuid4() for _ in range(10)]
+    for wallet_uuid in missing:
+        response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+        assert response.status_code == HTTP_404_NOT_FOUND
+    assert wallet_lookups.stats.get("rejected") == rejected + 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "workers, single_writer", [(2, True), (1, False)]
+)
+async def test_wallet_filter_with_several_writers(
+        session_factory: async_sessionmaker,
+        monkeypatch: pytest.MonkeyPatch,
+        wallet_filter: None,
+        workers: int,
+        single_writer: bool
+) -> None:
+    """
+    The filter is not built with several workers or
+    unless the worker is asserted to be the only writer.
+    :param session_factory: session factory bound to the temporary database.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :param workers: value of 'WEB_CONCURRENCY'.
+    :param single_writer: value of 'WALLET_FILTER_SINGLE_WRITER'.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", workers)
+    monkeypatch.setattr(
+        settings, "WALLET_FILTER_SINGLE_WRITER", single_writer
+    )
+
+    await wallet_lookups.build_filter(session_factory)
+
+    assert wallet_lookups.filter is None
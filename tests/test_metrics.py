@@ -0,0 +1,195 @@
+"""This module provides tests for the metrics exposition"""
+
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+)
+
+from wallet_app import metrics
+from wallet_app.config import settings
+from wallet_app.database import db_timings, engine_options
+
+OPERATION_ROUTE = (
+    'method="POST",route="/api/v1/wallets/{wallet_uuid}/operation",'
+    'status="200"'
+)
+
+
+async def scrape(async_client: AsyncClient) -> dict[str, float]:
+    """
+    Reads the metrics endpoint.
+    :param async_client: asynchronous client.
+    :return: mapping of sample name with labels to its value.
+    """
+    response = await async_client.get("/metrics")
+    assert response.status_code == HTTP_200_OK
+    assert response.headers["content-type"] == metrics.EXPOSITION_MEDIA_TYPE
+    samples = {}
+    for line in response.text.splitlines():
+        if not line.startswith("#"):
+            sample, value = line.rsplit(" ", 1)
+            samples[sample] = float(value)
+    return samples
+
+
+def test_histogram_exposition() -> None:
+    """
+    Buckets are cumulative and every series has its sum and count.
+    :return: None.
+    """
+    histograms = metrics.Histograms(
+        "seconds", labels=("route",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histograms.observe("seconds", value, 'a "b"')
+
+    assert histograms.expose("test") == [
+        "# TYPE wallet_test_seconds histogram",
+        'wallet_test_seconds_bucket{route="a \\"b\\"",le="0.1"} 2',
+        'wallet_test_seconds_bucket{route="a \\"b\\"",le="1.0"} 3',
+        'wallet_test_seconds_bucket{route="a \\"b\\"",le="+Inf"} 4',
+        'wallet_test_seconds_sum{route="a \\"b\\""} 2.65',
+        'wallet_test_seconds_count{route="a \\"b\\""} 4',
+    ]
+    assert histograms.snapshot() == {
+        "seconds_count": 4, "seconds_sum": 2.65
+    }
+
+
+@pytest.mark.asyncio
+async def test_request_metrics(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Requests are timed by route with the database time split out.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 10}
+    )
+    wallet_uuid = response.json()["uuid"]
+    before = await scrape(async_client)
+    backend = "asyncpg" if settings.DB_BACKEND == "asyncpg" else "orm"
+    statement = (
+        f'wallet_db_operation_statement_seconds_count{{backend="{backend}"}}'
+    )
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": 1},
+    )
+
+    assert response.status_code == HTTP_200_OK
+    after = await scrape(async_client)
+    count = f"wallet_http_request_seconds_count{{{OPERATION_ROUTE}}}"
+    assert after[count] == before.get(count, 0) + 1
+    db_seconds = f"wallet_http_db_seconds_sum{{{OPERATION_ROUTE}}}"
+    assert after[db_seconds] > before.get(db_seconds, 0)
+    assert f"wallet_http_python_seconds_sum{{{OPERATION_ROUTE}}}" in after
+    assert after[statement] == before.get(statement, 0) + 1
+    assert after["wallet_http_requests_in_flight"] == 1
+
+
+@pytest.mark.asyncio
+async def test_outcome_counters(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Insufficient funds and missing wallets are counted,
+    also for items of a batch.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 1}
+    )
+    wallet_uuid = response.json()["uuid"]
+    before = await scrape(async_client)
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "WITHDRAW", "amount": 5},
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    response = await async_client.get(f"{base_wallets_url}/{uuid.uuid4()}")
+    assert response.status_code == HTTP_404_NOT_FOUND
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch",
+        json={"operations": [
+            {"wallet_uuid": str(uuid.uuid4()),
+             "operation_type": "DEPOSIT", "amount": 1},
+        ]},
+    )
+    assert response.status_code == HTTP_200_OK
+
+    after = await scrape(async_client)
+    for name, count in (("insufficient_funds", 1), ("wallet_not_found", 2)):
+        sample = f"wallet_outcomes_{name}_total"
+        assert after[sample] == before[sample] + count
+
+
+@pytest.mark.asyncio
+async def test_pool_wait(temp_db: str) -> None:
+    """
+    Checkouts of the application pool are timed.
+    :param temp_db: temporary database.
+    :return: None.
+    """
+    engine = create_async_engine(temp_db, **engine_options(settings))
+    count = db_timings.count("pool_wait_seconds")
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    finally:
+        await engine.dispose()
+
+    assert db_timings.count("pool_wait_seconds") == count + 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_disabled(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        temp_db: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Nothing is observed with 'METRICS_ENABLED' off.
+    :param async_client: asynchronous client.
+    :param temp_db: temporary database.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 10}
+    )
+    wallet_uuid = response.json()["uuid"]
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    counts = {
+        name: db_timings.count(name)
+        for name in ("pool_wait_seconds", "operation_statement_seconds")
+    }
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": 1},
+    )
+    engine = create_async_engine(temp_db, **engine_options(settings))
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    finally:
+        await engine.dispose()
+
+    assert response.status_code == HTTP_200_OK
+    assert {name: db_timings.count(name) for name in counts} == counts
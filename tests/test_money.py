@@ -0,0 +1,180 @@
+"""This module provides tests for the fixed-point money representation"""
+
+import os
+import uuid
+from decimal import Decimal
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from httpx import AsyncClient
+from sqlalchemy import create_engine, text
+from sqlalchemy_utils import create_database, drop_database
+from starlette.status import HTTP_200_OK, HTTP_422_UNPROCESSABLE_ENTITY
+
+from wallet_app import database
+from wallet_app.money import from_minor, to_decimal, to_minor
+
+# Revision before the amounts were stored as minor units
+FLOAT_REVISION = "66f50d1d7134"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1, Decimal("1.00")),
+        (0.1, Decimal("0.10")),
+        ("15.5", Decimal("15.50")),
+        (b"0.01", Decimal("0.01")),
+        (Decimal("2.500"), Decimal("2.50")),
+    ]
+)
+def test_to_decimal(value, expected: Decimal) -> None:
+    """
+    Amounts are quantized to the scale without rounding drift.
+    :param value: amount.
+    :param expected: quantized amount.
+    :return: None.
+    """
+    amount = to_decimal(value)
+
+    assert amount == expected
+    assert str(amount) == str(expected)
+    assert from_minor(to_minor(value)) == expected
+
+
+@pytest.mark.parametrize(
+    "value, error",
+    [
+        ("0.001", "Amount has more than 2 decimal places"),
+        ("abc", "Amount is not a number"),
+        (float("nan"), "Amount is not a number"),
+        ("1e20", "Amount is out of range"),
+    ]
+)
+def test_to_decimal_invalid(value, error: str) -> None:
+    """
+    Amounts that are not exact in minor units are rejected.
+    :param value: invalid amount.
+    :param error: expected error.
+    :return: None.
+    """
+    with pytest.raises(ValueError, match=error):
+        to_decimal(value)
+
+
+@pytest.mark.asyncio
+async def test_decimal_amounts(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Decimal amounts add up exactly and are returned as decimal strings.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": "0.2"}
+    )
+    wallet_uuid = response.json()["uuid"]
+    assert response.json()["balance"] == "0.20"
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": 0.1},
+    )
+
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["balance"] == "0.30"
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "WITHDRAW", "amount": "0.30"},
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["balance"] == "0.00"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("amount", ["0.001", "1e30", "Infinity"])
+async def test_invalid_amount(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        amount: str
+) -> None:
+    """
+    Amounts not representable in minor units are rejected.
+    :param async_client: asynchronous client.
+    :param amount: invalid amount.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 1}
+    )
+    wallet_uuid = response.json()["uuid"]
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": amount},
+    )
+
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_minor_units_migration(
+        temp_db: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    The migration converts float amounts to minor units and back.
+    :param temp_db: temporary database, its URL names the new one.
+    :return: None.
+    """
+    database_url = temp_db.replace("+asyncpg", "") + "_migration"
+    create_database(database_url)
+    monkeypatch.setattr(
+        database, "DATABASE_URL",
+        database_url.replace("postgresql", "postgresql+asyncpg")
+    )
+    base_dir = os.path.dirname(os.path.dirname(__file__))
+    alembic_cfg = Config(os.path.join(base_dir, "alembic.ini"))
+    engine = create_engine(database_url)
+    wallet_uuid = uuid.uuid4()
+    try:
+        command.upgrade(alembic_cfg, FLOAT_REVISION)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO wallets (uuid, balance, stripes, version) "
+                "VALUES (:uuid, 0.3, 2, 0)"
+            ), {"uuid": wallet_uuid})
+            connection.execute(text(
+                "INSERT INTO wallet_slots (wallet_uuid, slot, balance) "
+                "VALUES (:uuid, 0, 0.1), (:uuid, 1, 12.35)"
+            ), {"uuid": wallet_uuid})
+            connection.execute(text(
+                "INSERT INTO wallet_operations "
+                "(wallet_uuid, operation_type, amount) "
+                "VALUES (:uuid, 'DEPOSIT', 0.1)"
+            ), {"uuid": wallet_uuid})
+
+        command.upgrade(alembic_cfg, "head")
+
+        with engine.connect() as connection:
+            assert connection.execute(text(
+                "SELECT balance FROM wallets WHERE uuid = :uuid"
+            ), {"uuid": wallet_uuid}).scalar_one() == 30
+            assert connection.execute(text(
+                "SELECT balance FROM wallet_slots ORDER BY slot"
+            )).scalars().all() == [10, 1235]
+            assert connection.execute(text(
+                "SELECT amount, balance FROM wallet_operations"
+            )).one() == (10, None)
+
+        command.downgrade(alembic_cfg, FLOAT_REVISION)
+
+        with engine.connect() as connection:
+            assert connection.execute(text(
+                "SELECT balance FROM wallet_slots ORDER BY slot"
+            )).scalars().all() == [0.1, 12.35]
+    finally:
+        engine.dispose()
+        drop_database(database_url)
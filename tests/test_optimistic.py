@@ -0,0 +1,231 @@
+"""This module provides tests for optimistic wallet operations"""
+
+import asyncio
+from decimal import Decimal
+from typing import Awaitable, Callable
+import uuid
+
+import pytest
+from httpx import AsyncClient, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+)
+
+from wallet_app import optimistic
+from wallet_app.config import settings
+from wallet_app.exceptions import WalletRaceLostError
+from wallet_app.models import Wallet
+from wallet_app.money import MAX_MINOR_UNITS, from_minor
+from wallet_app.schemas import OperationType
+from wallet_app.transactions import TransactionRunner
+
+
+@pytest.fixture
+def optimistic_mode(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Switches wallet operations to compare-and-swap updates.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "CONCURRENCY_MODE", "optimistic")
+    monkeypatch.setattr(settings, "OPTIMISTIC_RETRIES", 100)
+
+
+@pytest.mark.asyncio
+async def test_optimistic_concurrent_deposits(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        optimistic_mode: None,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Concurrent optimistic deposits are all applied after retries.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 100}
+    )
+    wallet_uuid = response.json()["uuid"]
+    applied = optimistic.stats.get("applied")
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, "DEPOSIT", 10)
+        for _ in range(20)
+    ))
+
+    assert all(r.status_code == HTTP_200_OK for r in responses)
+    assert optimistic.stats.get("applied") - applied == 20
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "300.00"
+
+
+@pytest.mark.asyncio
+async def test_optimistic_errors(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        optimistic_mode: None,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Optimistic withdrawal without funds and operation on a missing wallet.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 5}
+    )
+    wallet_uuid = response.json()["uuid"]
+
+    response = await operate(wallet_uuid, "WITHDRAW", 6)
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    response = await operate(str(uuid.uuid4()), "DEPOSIT", 1)
+    assert response.status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_optimistic_aborts(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        optimistic_mode: None,
+        monkeypatch: pytest.MonkeyPatch,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Operations that keep losing races are aborted with a conflict.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "OPTIMISTIC_RETRIES", 0)
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+    aborts = optimistic.stats.get("aborts")
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, "DEPOSIT", 1)
+        for _ in range(20)
+    ))
+
+    statuses = [r.status_code for r in responses]
+    assert set(statuses) <= {HTTP_200_OK, HTTP_409_CONFLICT}
+    assert optimistic.stats.get("aborts") - aborts == statuses.count(
+        HTTP_409_CONFLICT
+    )
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert Decimal(response.json()["balance"]) == statuses.count(HTTP_200_OK)
+
+
+@pytest.mark.asyncio
+async def test_swap_statement_stale_version(
+        session_factory: async_sessionmaker
+) -> None:
+    """
+    A compare-and-swap update with a stale version changes nothing.
+    :param session_factory: session factory bound to the test database.
+    :return: None.
+    """
+    async with session_factory() as session:
+        wallet = Wallet(balance=10)
+        session.add(wallet)
+        await session.commit()
+        wallet_uuid = uuid.UUID(str(wallet.uuid))
+
+        balance = await session.scalar(optimistic.swap_statement(
+            wallet_uuid, 0, OperationType.DEPOSIT, 5, 15
+        ))
+        assert balance == 15
+        balance = await session.scalar(optimistic.swap_statement(
+            wallet_uuid, 0, OperationType.DEPOSIT, 5, 20
+        ))
+        assert balance is None
+        await session.commit()
+
+        await session.refresh(wallet)
+        assert (wallet.balance, wallet.version) == (15, 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("retries, attempts", [(5, 3), (1, 2)])
+async def test_lost_race_rerun(
+        temp_db: str,
+        monkeypatch: pytest.MonkeyPatch,
+        retries: int,
+        attempts: int
+) -> None:
+    """
+    A lost race reruns the whole transaction, no connection is held
+    during the pause before the rerun, and the rerun is aborted
+    after 'OPTIMISTIC_RETRIES' retries.
+    :param temp_db: temporary database.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :param retries: value of 'OPTIMISTIC_RETRIES'.
+    :param attempts: expected number of runs of the unit of work.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "OPTIMISTIC_RETRIES", retries)
+    engine = create_async_engine(temp_db, pool_size=1, max_overflow=0)
+    runner = TransactionRunner(async_sessionmaker(engine))
+    held = []
+    runs = []
+    sleep = asyncio.sleep
+
+    async def pause(delay: float) -> None:
+        held.append(engine.pool.checkedout())
+        await sleep(0)
+
+    async def work(session) -> int:
+        await session.execute(select(1))
+        runs.append(engine.pool.checkedout())
+        if len(runs) < 3:
+            raise WalletRaceLostError(uuid.uuid4())
+        return len(runs)
+
+    monkeypatch.setattr(asyncio, "sleep", pause)
+    aborts = optimistic.stats.get("aborts")
+    try:
+        if attempts == 3:
+            assert await runner.run(work) == 3
+        else:
+            with pytest.raises(WalletRaceLostError):
+                await runner.run(work)
+            assert optimistic.stats.get("aborts") == aborts + 1
+    finally:
+        await engine.dispose()
+
+    assert runs == [1] * attempts
+    assert held == [0] * (attempts - 1)
+
+
+@pytest.mark.asyncio
+async def test_optimistic_balance_overflow(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        optimistic_mode: None,
+        create_wallet: Callable[..., Awaitable[str]],
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    A deposit beyond the largest balance is rejected before the update.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    maximum = from_minor(MAX_MINOR_UNITS)
+    wallet_uuid = await create_wallet(str(maximum))
+
+    response = await operate(wallet_uuid, "DEPOSIT", 1)
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert Decimal(response.json()["balance"]) == maximum
@@ -0,0 +1,151 @@
+"""This module provides tests for the serialization of responses"""
+
+import random
+
+import pytest
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+
+from wallet_app.responses import (
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    negotiate,
+    pack,
+)
+
+MSGPACK_HEADERS = {"Accept": MSGPACK_MEDIA_TYPE}
+
+
+@pytest.mark.parametrize(
+    "value, packed",
+    [
+        (None, "c0"),
+        (True, "c3"),
+        (False, "c2"),
+        (0, "00"),
+        (127, "7f"),
+        (128, "cc80"),
+        (256, "cd0100"),
+        (1 << 16, "ce00010000"),
+        (1 << 32, "cf0000000100000000"),
+        (-1, "ff"),
+        (-32, "e0"),
+        (-33, "d0df"),
+        (-129, "d1ff7f"),
+        (-(1 << 15) - 1, "d2ffff7fff"),
+        (-(1 << 31) - 1, "d3ffffffff7fffffff"),
+        (1.5, "cb3ff8000000000000"),
+        ("", "a0"),
+        ("ü", "a2c3bc"),
+        ("a" * 32, "d920" + "61" * 32),
+        ("a" * 256, "da0100" + "61" * 256),
+        ([1, "a"], "9201a161"),
+        ([None] * 16, "dc0010" + "c0" * 16),
+        ({"a": [1]}, "81a1619101"),
+        (dict.fromkeys("abcdefghijklmnop"),
+         "de0010" + "".join(f"a1{key.encode().hex()}c0"
+                            for key in "abcdefghijklmnop")),
+    ]
+)
+def test_pack(value, packed: str) -> None:
+    """
+    Values are packed in the shortest MessagePack format.
+    :param value: JSON data.
+    :param packed: expected encoding in hex.
+    :return: None.
+    """
+    assert pack(value) == bytes.fromhex(packed)
+
+
+@pytest.mark.parametrize(
+    "accept, media_type",
+    [
+        ("", JSON_MEDIA_TYPE),
+        ("*/*", JSON_MEDIA_TYPE),
+        ("application/json", JSON_MEDIA_TYPE),
+        ("application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/json;q=0.9, application/x-msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/json, application/x-msgpack;q=0.9", JSON_MEDIA_TYPE),
+        ("*/*;q=0.5, application/msgpack;q=0.5", MSGPACK_MEDIA_TYPE),
+        ("application/msgpack;q=0", JSON_MEDIA_TYPE),
+        ("application/msgpack; q=0.0, */*", JSON_MEDIA_TYPE),
+        ("application/msgpack;q=high", JSON_MEDIA_TYPE),
+    ]
+)
+def test_negotiate(accept: str, media_type: str) -> None:
+    """
+    MessagePack is chosen if the 'Accept' header names it
+    with a quality above zero and not below that of JSON.
+    :param accept: 'Accept' request header.
+    :param media_type: expected media type.
+    :return: None.
+    """
+    assert negotiate(accept) == media_type
+
+
+@pytest.mark.asyncio
+async def test_wallet_msgpack(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Wallets are returned as MessagePack when it is accepted.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": "1.5"},
+        headers=MSGPACK_HEADERS,
+    )
+    assert response.status_code == HTTP_201_CREATED
+    assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE
+    # After the map header, the 'uuid' key and the str 8 header
+    wallet_uuid = response.content[8:44].decode()
+    assert response.content == pack({"uuid": wallet_uuid, "balance": "1.50"})
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet_uuid}/operation",
+        json={"operation_type": "DEPOSIT", "amount": 1},
+        headers=MSGPACK_HEADERS,
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.content == pack({"uuid": wallet_uuid, "balance": "2.50"})
+
+    for _ in range(2):
+        response = await async_client.get(
+            f"{base_wallets_url}/{wallet_uuid}", headers=MSGPACK_HEADERS
+        )
+        assert response.status_code == HTTP_200_OK
+        assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE
+        assert response.content == pack(
+            {"uuid": wallet_uuid, "balance": "2.50"}
+        )
+
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.headers["content-type"] == JSON_MEDIA_TYPE
+    assert response.json() == {"uuid": wallet_uuid, "balance": "2.50"}
+
+
+@pytest.mark.asyncio
+async def test_page_msgpack(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Fields not selected are left out of MessagePack pages as well.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    balance = f"{random.randrange(10 ** 9, 10 ** 12)}.25"
+    await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": balance}
+    )
+
+    response = await async_client.get(base_wallets_url, params={
+        "fields": "balance", "min_balance": balance, "max_balance": balance,
+    }, headers=MSGPACK_HEADERS)
+
+    assert response.status_code == HTTP_200_OK
+    assert response.content == pack(
+        {"wallets": [{"balance": balance}], "next_cursor": None}
+    )
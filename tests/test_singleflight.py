@@ -0,0 +1,85 @@
+"""This module provides tests for coalescing concurrent wallet reads"""
+
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from wallet_app.cache import balance_cache
+from wallet_app.singleflight import SingleFlight, wallet_reads
+
+
+@pytest.mark.asyncio
+async def test_single_flight_collapses_calls() -> None:
+    """
+    Concurrent calls with the same key share one call.
+    :return: None.
+    """
+    flight = SingleFlight()
+    started = 0
+
+    async def call() -> int:
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.05)
+        return started
+
+    results = await asyncio.gather(
+        *(flight.do("a", call) for _ in range(10)), flight.do("b", call)
+    )
+
+    assert started == 2
+    assert results[:10] == [results[0]] * 10
+    assert flight.stats.snapshot() == {"calls": 2, "collapsed": 9}
+    assert await flight.do("a", call) == 3
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors() -> None:
+    """
+    An error of the shared call is raised to every caller.
+    :return: None.
+    """
+    flight = SingleFlight()
+
+    async def call() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    results = await asyncio.gather(
+        *(flight.do("a", call) for _ in range(3)), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats.get("calls") == 1
+
+
+@pytest.mark.asyncio
+async def test_get_wallet_concurrent(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Concurrent reads of an uncached wallet are collapsed.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 42}
+    )
+    wallet = response.json()
+    await balance_cache.invalidate(wallet["uuid"])
+    calls = wallet_reads.stats.get("calls")
+    collapsed = wallet_reads.stats.get("collapsed")
+
+    responses = await asyncio.gather(*(
+        async_client.get(f"{base_wallets_url}/{wallet['uuid']}")
+        for _ in range(20)
+    ))
+
+    assert all(r.status_code == HTTP_200_OK for r in responses)
+    assert all(r.json() == wallet for r in responses)
+    new_calls = wallet_reads.stats.get("calls") - calls
+    assert new_calls >= 1
+    assert wallet_reads.stats.get("collapsed") - collapsed == 20 - new_calls
@@ -0,0 +1,95 @@
+"""This module provides tests for the startup of the app"""
+
+import logging
+
+import pytest
+
+from wallet_app import database, fastpath, main
+from wallet_app.config import settings
+from wallet_app.startup import StartupProfile
+
+
+def test_startup_profile() -> None:
+    """
+    Steps are timed in the order they ran, also when they fail.
+    :return: None.
+    """
+    profile = StartupProfile()
+
+    with profile.step("first"):
+        pass
+    with pytest.raises(ValueError):
+        with profile.step("second_step"):
+            raise ValueError
+
+    assert list(profile.steps) == ["first", "second_step"]
+    assert profile.total() == sum(profile.steps.values())
+    lines = profile.report().splitlines()
+    assert [line.split()[0] for line in lines] == ["first", "second_step"]
+    assert all(line.endswith(" ms") for line in lines)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("create_db", [False, True])
+async def test_lifespan(
+        temp_db: str,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture,
+        create_db: bool
+) -> None:
+    """
+    The lifespan creates the database only if 'CREATE_DB' is on,
+    prewarms the pool before the app serves requests, logs
+    the startup profile and forgets the engine on shutdown.
+    :param temp_db: temporary database, the one of the settings.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :param caplog: pytest log capture fixture.
+    :param create_db: value of 'CREATE_DB'.
+    :return: None.
+    """
+    calls = []
+
+    async def fake_create_db() -> None:
+        calls.append(True)
+
+    monkeypatch.setattr(main, "create_db", fake_create_db)
+    monkeypatch.setattr(settings, "CREATE_DB", create_db)
+    monkeypatch.setattr(settings, "STARTUP_PROFILE", True)
+    monkeypatch.setattr(settings, "DB_POOL_PREWARM", 3)
+    # Disabled by the logging configuration of the alembic migrations
+    monkeypatch.setattr(main.logger, "disabled", False)
+
+    with caplog.at_level(logging.INFO, logger=main.__name__):
+        async with main.lifespan(main.app):
+            assert database.get_engine().pool.checkedin() == 3
+
+    assert len(calls) == int(create_db)
+    steps = main.app.state.startup_profile.steps
+    assert ("create_db" in steps) == create_db
+    assert {"engine", "pool_budget", "pool_prewarm"} <= set(steps)
+    assert "Startup took" in caplog.text
+    assert database._engine is None
+
+
+@pytest.mark.asyncio
+async def test_fastpath_pool_prewarm(
+        temp_db: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    The asyncpg pool opens 'DB_POOL_PREWARM' connections at once.
+    :param temp_db: temporary database.
+    :param monkeypatch: pytest monkeypatch fixture.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 2)
+    monkeypatch.setattr(settings, "DB_POOL_PREWARM", 5)
+
+    pool = await fastpath.create_pool(
+        settings, temp_db.replace("postgresql+asyncpg", "postgresql")
+    )
+    try:
+        assert pool.get_size() == 2
+        assert pool.get_idle_size() == 2
+    finally:
+        await pool.close()
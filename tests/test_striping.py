@@ -0,0 +1,214 @@
+"""This module provides tests for striped wallet balances"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+import pytest
+from httpx import AsyncClient, Response
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+ADMIN_URL = "/api/v1/admin/wallets"
+
+
+async def create_striped_wallet(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        balance: int,
+        stripes: int
+) -> str:
+    """
+    Creates a wallet and converts it to balance slots.
+    :param async_client: asynchronous client.
+    :param balance: initial balance.
+    :param stripes: number of slots.
+    :return: wallet UUID.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": balance}
+    )
+    wallet_uuid = response.json()["uuid"]
+    response = await async_client.put(
+        f"{ADMIN_URL}/{wallet_uuid}/stripes", json={"stripes": stripes}
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {
+        "uuid": wallet_uuid, "balance": f"{balance}.00", "stripes": stripes
+    }
+    return wallet_uuid
+
+
+@pytest.mark.asyncio
+async def test_striped_concurrent_deposits(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Concurrent deposits to a striped wallet are all applied.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    wallet_uuid = await create_striped_wallet(
+        async_client, base_wallets_url, 100, 4
+    )
+
+    responses = await asyncio.gather(*(
+        operate(wallet_uuid, "DEPOSIT", 10)
+        for _ in range(20)
+    ))
+
+    assert all(r.status_code == HTTP_200_OK for r in responses)
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "300.00"
+    history = await async_client.get(
+        f"{base_wallets_url}/{wallet_uuid}/operations"
+    )
+    assert len(history.json()["operations"]) == 20
+
+
+@pytest.mark.asyncio
+async def test_striped_withdraw_consolidates(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    A withdrawal larger than any slot is covered by the full balance.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    wallet_uuid = await create_striped_wallet(
+        async_client, base_wallets_url, 0, 4
+    )
+    for _ in range(4):
+        await operate(wallet_uuid, "DEPOSIT", 25)
+
+    response = await operate(wallet_uuid, "WITHDRAW", 90)
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["balance"] == "10.00"
+
+    response = await operate(wallet_uuid, "WITHDRAW", 11)
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+    assert response.json()["balance"] == "10.00"
+
+
+@pytest.mark.asyncio
+async def test_unstripe_keeps_balance(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Turning striping off moves the slot balances to the wallet.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    wallet_uuid = await create_striped_wallet(
+        async_client, base_wallets_url, 5, 8
+    )
+    await asyncio.gather(*(
+        operate(wallet_uuid, "DEPOSIT", 1)
+        for _ in range(10)
+    ))
+
+    response = await async_client.put(
+        f"{ADMIN_URL}/{wallet_uuid}/stripes", json={"stripes": 0}
+    )
+
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["balance"] == "15.00"
+    response = await operate(wallet_uuid, "WITHDRAW", 15)
+    assert response.json()["balance"] == "0.00"
+
+
+@pytest.mark.asyncio
+async def test_striped_transfer_and_batch(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        operate: Callable[..., Awaitable[Response]]
+) -> None:
+    """
+    Transfers and batches see the full balance of a striped wallet.
+    :param async_client: asynchronous client.
+    :param operate: performs a wallet operation.
+    :return: None.
+    """
+    striped = await create_striped_wallet(
+        async_client, base_wallets_url, 0, 2
+    )
+    for _ in range(2):
+        await operate(striped, "DEPOSIT", 30)
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    plain = response.json()["uuid"]
+
+    response = await async_client.post("/api/v1/transfers", json={
+        "from_wallet_uuid": striped, "to_wallet_uuid": plain, "amount": 50,
+    })
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["from_wallet"]["balance"] == "10.00"
+    assert response.json()["to_wallet"]["balance"] == "50.00"
+
+    response = await async_client.post(
+        f"{base_wallets_url}/operations:batch",
+        json={"operations": [
+            {"wallet_uuid": plain, "operation_type": "WITHDRAW",
+             "amount": 20},
+            {"wallet_uuid": striped, "operation_type": "DEPOSIT",
+             "amount": 20},
+        ]},
+    )
+    assert response.json()["applied"]
+    response = await async_client.get(f"{base_wallets_url}/{striped}")
+    assert response.json()["balance"] == "30.00"
+
+
+@pytest.mark.asyncio
+async def test_set_stripes_errors(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        ledger_mode: None
+) -> None:
+    """
+    Converting a missing wallet, with an invalid number of slots
+    or in ledger mode.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/add", json={"balance": 0}
+    )
+    wallet_uuid = response.json()["uuid"]
+
+    response = await async_client.put(
+        f"{ADMIN_URL}/{wallet_uuid}/stripes", json={"stripes": 1000}
+    )
+    assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+    response = await async_client.put(
+        f"{ADMIN_URL}/{wallet_uuid}/stripes", json={"stripes": 4}
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_set_stripes_not_found(async_client: AsyncClient) -> None:
+    """
+    Converting a wallet that does not exist.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.put(
+        f"{ADMIN_URL}/00000000-0000-0000-0000-000000000000/stripes",
+        json={"stripes": 4},
+    )
+    assert response.status_code == HTTP_404_NOT_FOUND
@@ -0,0 +1,170 @@
+"""This module provides tests for the transaction runner"""
+
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.status import HTTP_200_OK
+
+from wallet_app import transactions
+from wallet_app.config import settings
+from wallet_app.models import Wallet
+from wallet_app.transactions import TransactionRunner
+
+
+async def create_wallets(
+        session_factory: async_sessionmaker, count: int
+) -> list[uuid.UUID]:
+    """
+    Creates wallets with zero balance.
+    :param session_factory: session factory bound to the test database.
+    :param count: number of wallets.
+    :return: wallet UUIDs.
+    """
+    async with session_factory() as session:
+        wallets = [Wallet(balance=0) for _ in range(count)]
+        session.add_all(wallets)
+        await session.commit()
+    return [uuid.UUID(str(wallet.uuid)) for wallet in wallets]
+
+
+async def run_opposing(
+        runner: TransactionRunner, wallet_uuids: list[uuid.UUID]
+) -> list:
+    """
+    Runs two transactions locking the same wallets in opposite order.
+    :param runner: transaction runner.
+    :param wallet_uuids: UUIDs of two wallets.
+    :return: results or errors of both transactions.
+    """
+    both_locked = asyncio.Barrier(2)
+
+    async def lock_in_order(order: list[uuid.UUID]):
+        first_attempt = True
+
+        async def work(session: AsyncSession) -> int:
+            nonlocal first_attempt
+            for wallet_uuid in order:
+                await session.execute(
+                    select(Wallet.uuid)
+                    .where(Wallet.uuid == wallet_uuid)
+                    .with_for_update()
+                )
+                if first_attempt:
+                    first_attempt = False
+                    await both_locked.wait()
+            return 1
+
+        return await runner.run(work)
+
+    return await asyncio.gather(
+        lock_in_order(wallet_uuids),
+        lock_in_order(wallet_uuids[::-1]),
+        return_exceptions=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_deadlock_is_retried(
+        session_factory: async_sessionmaker
+) -> None:
+    """
+    A transaction aborted by a deadlock is run again and succeeds.
+    :param session_factory: session factory bound to the test database.
+    :return: None.
+    """
+    wallet_uuids = await create_wallets(session_factory, 2)
+    deadlocks = transactions.stats.get("deadlocks")
+    retries = transactions.stats.get("retries")
+
+    results = await run_opposing(
+        TransactionRunner(session_factory), wallet_uuids
+    )
+
+    assert results == [1, 1]
+    assert transactions.stats.get("deadlocks") - deadlocks == 1
+    assert transactions.stats.get("retries") - retries == 1
+
+
+@pytest.mark.asyncio
+async def test_give_up_after_retries(
+        session_factory: async_sessionmaker,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    The error is raised when no retries are left.
+    :param session_factory: session factory bound to the test database.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "TX_MAX_RETRIES", 0)
+    wallet_uuids = await create_wallets(session_factory, 2)
+    give_ups = transactions.stats.get("give_ups")
+
+    results = await run_opposing(
+        TransactionRunner(session_factory), wallet_uuids
+    )
+
+    errors = [r for r in results if isinstance(r, DBAPIError)]
+    assert len(errors) == 1
+    assert transactions.is_retryable(errors[0])
+    assert transactions.stats.get("give_ups") - give_ups == 1
+
+
+@pytest.mark.asyncio
+async def test_runner_isolation_level(
+        session_factory: async_sessionmaker
+) -> None:
+    """
+    The runner raises the isolation level when configured.
+    :param session_factory: session factory bound to the test database.
+    :return: None.
+    """
+    async def isolation(session: AsyncSession) -> str:
+        return await session.scalar(text("SHOW transaction_isolation"))
+
+    assert await TransactionRunner(session_factory).run(
+        isolation
+    ) == "read committed"
+    assert await TransactionRunner(session_factory, "SERIALIZABLE").run(
+        isolation
+    ) == "serializable"
+
+
+@pytest.mark.asyncio
+async def test_serializable_endpoint(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Concurrent serializable transfers between the same wallets all succeed.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    monkeypatch.setattr(settings, "SERIALIZABLE_ENDPOINTS", {"transfer"})
+    monkeypatch.setattr(settings, "TX_MAX_RETRIES", 100)
+    monkeypatch.setattr(settings, "TX_RETRY_DEADLINE", 30.0)
+    wallets = []
+    for _ in range(2):
+        response = await async_client.post(
+            f"{base_wallets_url}/add", json={"balance": 100}
+        )
+        wallets.append(response.json()["uuid"])
+
+    responses = await asyncio.gather(*(
+        async_client.post("/api/v1/transfers", json={
+            "from_wallet_uuid": wallets[i % 2],
+            "to_wallet_uuid": wallets[1 - i % 2],
+            "amount": 1,
+        })
+        for i in range(10)
+    ))
+
+    assert all(r.status_code == HTTP_200_OK for r in responses)
+    for wallet_uuid in wallets:
+        response = await async_client.get(f"{base_wallets_url}/{wallet_uuid}")
+        assert response.json()["balance"] == "100.00"
@@ -0,0 +1,214 @@
+"""This module provides tests for transfers between wallets"""
+
+import asyncio
+from decimal import Decimal
+from typing import Awaitable, Callable
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+)
+
+from wallet_app.money import MAX_MINOR_UNITS, from_minor
+
+TRANSFERS_URL = "/api/v1/transfers"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["row", "ledger"])
+async def test_transfer(
+        async_client: AsyncClient,
+        base_wallets_url: str,
+        mode: str,
+        request: pytest.FixtureRequest,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    Transferring funds between two wallets.
+    :param async_client: asynchronous client.
+    :param mode: storage of balances.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    if mode == "ledger":
+        request.getfixturevalue("ledger_mode")
+    source = await create_wallet(100)
+    target = await create_wallet(5)
+
+    response = await async_client.post(TRANSFERS_URL, json={
+        "from_wallet_uuid": source, "to_wallet_uuid": target, "amount": 30
+    })
+
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {
+        "from_wallet": {"uuid": source, "balance": "70.00"},
+        "to_wallet": {"uuid": target, "balance": "35.00"},
+    }
+    assert await get_balance(source) == 70
+    assert await get_balance(target) == 35
+    response = await async_client.get(
+        f"{base_wallets_url}/{target}/operations"
+    )
+    assert [
+        (entry["operation_type"], entry["amount"])
+        for entry in response.json()["operations"]
+    ] == [("DEPOSIT", "30.00")]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["row", "ledger"])
+async def test_transfer_insufficient_funds(
+        async_client: AsyncClient,
+        mode: str,
+        request: pytest.FixtureRequest,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    Trying to transfer more than the source balance.
+    :param async_client: asynchronous client.
+    :param mode: storage of balances.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    if mode == "ledger":
+        request.getfixturevalue("ledger_mode")
+    source = await create_wallet(10)
+    target = await create_wallet(0)
+
+    response = await async_client.post(TRANSFERS_URL, json={
+        "from_wallet_uuid": source, "to_wallet_uuid": target, "amount": 11
+    })
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert await get_balance(source) == 10
+    assert await get_balance(target) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["row", "ledger", "striped"])
+async def test_transfer_balance_overflow(
+        async_client: AsyncClient,
+        mode: str,
+        request: pytest.FixtureRequest,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    A transfer that would push the destination beyond the largest
+    balance is rejected and changes nothing.
+    :param async_client: asynchronous client.
+    :param mode: storage of balances, 'striped' stripes the destination.
+    :param request: pytest request to switch to ledger mode.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    if mode == "ledger":
+        request.getfixturevalue("ledger_mode")
+    maximum = from_minor(MAX_MINOR_UNITS)
+    source = await create_wallet(10)
+    target = await create_wallet(str(maximum))
+    if mode == "striped":
+        response = await async_client.put(
+            f"/api/v1/admin/wallets/{target}/stripes", json={"stripes": 2}
+        )
+        assert response.status_code == HTTP_200_OK
+
+    response = await async_client.post(TRANSFERS_URL, json={
+        "from_wallet_uuid": source, "to_wallet_uuid": target, "amount": 1
+    })
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Balance would exceed the maximum"
+    assert await get_balance(source) == 10
+    assert await get_balance(target) == maximum
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("missing", ["from_wallet_uuid", "to_wallet_uuid"])
+async def test_transfer_not_exist_wallet(
+        async_client: AsyncClient,
+        missing: str,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    Trying to transfer from or to a wallet that does not exist.
+    :param async_client: asynchronous client.
+    :param missing: field with the UUID of a missing wallet.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    wallet = await create_wallet(10)
+    data = {"from_wallet_uuid": wallet, "to_wallet_uuid": wallet, "amount": 1}
+    data[missing] = str(uuid.uuid4())
+
+    response = await async_client.post(TRANSFERS_URL, json=data)
+
+    assert response.status_code == HTTP_404_NOT_FOUND
+    assert await get_balance(wallet) == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("amount, same_wallet", [(0, False), (5, True)])
+async def test_transfer_invalid(
+        async_client: AsyncClient,
+        amount: float,
+        same_wallet: bool,
+        create_wallet: Callable[..., Awaitable[str]]
+) -> None:
+    """
+    Trying to transfer a non-positive amount or to the same wallet.
+    :param async_client: asynchronous client.
+    :param amount: amount of the transfer.
+    :param same_wallet: whether the source is also the destination.
+    :param create_wallet: creates a wallet.
+    :return: None.
+    """
+    source = await create_wallet(10)
+    target = source if same_wallet else await create_wallet(10)
+
+    response = await async_client.post(TRANSFERS_URL, json={
+        "from_wallet_uuid": source, "to_wallet_uuid": target, "amount": amount
+    })
+
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_transfer_concurrent_opposing(
+        async_client: AsyncClient,
+        create_wallet: Callable[..., Awaitable[str]],
+        get_balance: Callable[..., Awaitable[Decimal]]
+) -> None:
+    """
+    Concurrent transfers in both directions neither deadlock
+    nor lose funds.
+    :param async_client: asynchronous client.
+    :param create_wallet: creates a wallet.
+    :param get_balance: reads the balance of a wallet.
+    :return: None.
+    """
+    first = await create_wallet(1000)
+    second = await create_wallet(1000)
+
+    responses = await asyncio.gather(*(
+        async_client.post(TRANSFERS_URL, json={
+            "from_wallet_uuid": source, "to_wallet_uuid": target, "amount": 1
+        })
+        for _ in range(10)
+        for source, target in ((first, second), (second, first))
+    ))
+
+    assert all(r.status_code == HTTP_200_OK for r in responses)
+    assert await get_balance(first) == 1000
+    assert await get_balance(second) == 1000
@@ -0,0 +1,152 @@
+"""This module provides tests for the wallet operation history"""
+
+from decimal import Decimal
+import json
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from wallet_app.schemas import OperationType
+
+
+async def create_wallet_with_history(
+        async_client: AsyncClient, base_wallets_url: str, deposits: int
+) -> str:
+    """
+    Creates a wallet and deposits 1, 2, ... 'deposits' into it.
+    :param async_client: asynchronous client.
+    :param deposits: number of deposits.
+    :return: wallet UUID.
+    """
+    response = await async_client.post(f"{base_wallets_url}/add", json={})
+    wallet_uuid = response.json()["uuid"]
+    for amount in range(1, deposits + 1):
+        await async_client.post(
+            f"{base_wallets_url}/{wallet_uuid}/operation",
+            json={"operation_type": OperationType.DEPOSIT, "amount": amount}
+        )
+    return wallet_uuid
+
+
+@pytest.mark.asyncio
+async def test_history_pages(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Reading the whole history page by page.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet_with_history(
+        async_client, base_wallets_url, 7
+    )
+    amounts = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = await async_client.get(
+            f"{base_wallets_url}/{wallet_uuid}/operations", params=params
+        )
+        assert response.status_code == HTTP_200_OK
+        data = response.json()
+        amounts += [
+            Decimal(entry["amount"]) for entry in data["operations"]
+        ]
+        pages += 1
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert amounts == [7, 6, 5, 4, 3, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_history_stream(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Streaming the history as NDJSON.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    wallet_uuid = await create_wallet_with_history(
+        async_client, base_wallets_url, 4
+    )
+    response = await async_client.get(
+        f"{base_wallets_url}/{wallet_uuid}/operations",
+        headers={"Accept": "application/x-ndjson"}
+    )
+
+    assert response.status_code == HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    assert [entry["amount"] for entry in entries] == [
+        "4.00", "3.00", "2.00", "1.00"
+    ]
+    assert [entry["balance"] for entry in entries] == [
+        "10.00", "6.00", "3.00", "1.00"
+    ]
+    assert all(
+        entry["operation_type"] == OperationType.DEPOSIT for entry in entries
+    )
+
+
+@pytest.mark.asyncio
+async def test_history_not_exist_wallet(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    Trying to get the history of a wallet that does not exist.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    response = await async_client.get(
+        f"{base_wallets_url}/{uuid.uuid4()}/operations"
+    )
+
+    assert response.status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "params, status_code",
+    [
+        ({"cursor": "abc"}, HTTP_400_BAD_REQUEST),
+        ({"limit": 0}, HTTP_422_UNPROCESSABLE_ENTITY),
+        ({"limit": 100000}, HTTP_422_UNPROCESSABLE_ENTITY),
+    ]
+)
+async def test_history_invalid_params(
+        async_client: AsyncClient,
+        params: dict,
+        status_code: int,
+        base_wallets_url: str
+) -> None:
+    """
+    Trying to get the history with invalid parameters.
+    :param async_client: asynchronous client.
+    :param params: invalid query parameters.
+    :param status_code: expected status code.
+    :return: None.
+    """
+    response = await async_client.post(f"{base_wallets_url}/add", json={})
+    response = await async_client.get(
+        f"{base_wallets_url}/{response.json()['uuid']}/operations",
+        params=params
+    )
+
+    assert response.status_code == status_code
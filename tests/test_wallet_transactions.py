@@ -1,15 +1,19 @@
 """This module provides tests for transactions"""
 
 import asyncio
+from decimal import Decimal
+import uuid
 
 import pytest
 from httpx import AsyncClient
 from starlette.status import (
     HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
     HTTP_422_UNPROCESSABLE_ENTITY,
     HTTP_200_OK
 )
 
+from wallet_app.money import MAX_MINOR_UNITS, from_minor
 from wallet_app.schemas import OperationType
 
 
@@ -40,7 +44,7 @@ async def test_wallet_deposit(
     assert response_deposit.status_code == HTTP_200_OK
     data = response_deposit.json()
     assert data['uuid'] == wallet['uuid']
-    assert data['balance'] == wallet['balance'] + 100
+    assert Decimal(data['balance']) == Decimal(wallet['balance']) + 100
 
 
 @pytest.mark.asyncio
@@ -92,8 +96,8 @@ async def test_wallet_concurrent_deposit(
         f"{base_wallets_url}/{wallet['uuid']}"
     )
     assert response_wallet.status_code == HTTP_200_OK
-    assert response_wallet.json()['balance'] == (
-            wallet['balance'] + amount_1 + amount_2
+    assert Decimal(response_wallet.json()['balance']) == (
+            Decimal(wallet['balance']) + amount_1 + amount_2
     )
 
 
@@ -125,7 +129,7 @@ async def test_wallet_withdraw(
     assert response_withdraw.status_code == HTTP_200_OK
     data = response_withdraw.json()
     assert data['uuid'] == wallet['uuid']
-    assert data['balance'] == wallet['balance'] - 100
+    assert Decimal(data['balance']) == Decimal(wallet['balance']) - 100
 
 
 @pytest.mark.asyncio
@@ -176,8 +180,8 @@ async def test_wallet_concurrent_withdraw(
         f"{base_wallets_url}/{wallet['uuid']}"
     )
     assert response_wallet.status_code == HTTP_200_OK
-    assert response_wallet.json()['balance'] == (
-            wallet['balance'] - amount_1 - amount_2
+    assert Decimal(response_wallet.json()['balance']) == (
+            Decimal(wallet['balance']) - amount_1 - amount_2
     )
 
 
@@ -225,7 +229,8 @@ async def test_wallet_concurrent_deposit_withdraw(
     response_wallet = await async_client.get(
         f"{base_wallets_url}/{wallet['uuid']}"
     )
-    data = response_wallet.json()
+    balance = Decimal(response_wallet.json()['balance'])
+    initial = Decimal(wallet['balance'])
     match success_operations:
         case 1:
             assert response_codes == [
@@ -233,7 +238,7 @@ async def test_wallet_concurrent_deposit_withdraw(
                 HTTP_400_BAD_REQUEST,
                 HTTP_400_BAD_REQUEST
             ]
-            assert data['balance'] == wallet['balance'] + deposit_amount
+            assert balance == initial + deposit_amount
 
         case 2:
             assert response_codes == [
@@ -241,13 +246,13 @@ async def test_wallet_concurrent_deposit_withdraw(
                 HTTP_200_OK,
                 HTTP_400_BAD_REQUEST
             ]
-            assert data['balance'] == (
-                    wallet['balance'] + deposit_amount - withdraw_amount
+            assert balance == (
+                    initial + deposit_amount - withdraw_amount
             )
 
         case _:
             assert response_codes == [HTTP_400_BAD_REQUEST] * 3
-            assert data['balance'] == wallet['balance']
+            assert balance == initial
 
 
 @pytest.mark.asyncio
@@ -360,3 +365,54 @@ async def test_insufficient_funds(
         json=request_withdraw
     )
     assert response_deposit.status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_balance_overflow(
+        async_client: AsyncClient,
+        base_wallets_url: str
+) -> None:
+    """
+    A deposit beyond the largest balance is rejected
+    and leaves the balance as it is.
+    :param async_client: asynchronous client.
+    :return: None.
+    """
+    maximum = from_minor(MAX_MINOR_UNITS)
+    response = await async_client.post(
+        f"{base_wallets_url}/add",
+        json={'balance': str(maximum)}
+    )
+    wallet = response.json()
+
+    response = await async_client.post(
+        f"{base_wallets_url}/{wallet['uuid']}/operation",
+        json={"operation_type": OperationType.DEPOSIT, "amount": 1}
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Balance would exceed the maximum"
+
+    response = await async_client.get(f"{base_wallets_url}/{wallet['uuid']}")
+    assert Decimal(response.json()["balance"]) == maximum
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "operation_type", [OperationType.DEPOSIT, OperationType.WITHDRAW]
+)
+async def test_operation_not_exist_wallet(
+        async_client: AsyncClient,
+        operation_type: OperationType,
+        base_wallets_url: str
+) -> None:
+    """
+    Trying to perform an operation on a wallet that does not exist.
+    :param async_client: asynchronous client.
+    :param operation_type: correct operation type.
+    :return: None.
+    """
+    response = await async_client.post(
+        f"{base_wallets_url}/{uuid.uuid4()}/operation",
+        json={"operation_type": operation_type, "amount": 10}
+    )
+    assert response.status_code == HTTP_404_NOT_FOUND
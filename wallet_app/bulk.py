@@ -0,0 +1,209 @@
+"""
+This module provides bulk creation of wallets with COPY.
+
+UUIDs are generated in process and the rows are sent with the binary
+COPY protocol of asyncpg, 'BULK_CHUNK_SIZE' rows per COPY, all in one
+transaction. Initial balances come from a JSON request or a CSV body.
+A CSV body is spooled before the transaction is opened, so a slow
+client cannot keep the transaction and its connection open. Spooled
+bodies and the created wallets, written as NDJSON, are kept
+in temporary files held in memory up to 'SPOOL_MAX_SIZE' bytes,
+the created wallets are streamed back after the commit
+"""
+
+import uuid
+from decimal import Decimal
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Optional, TypeVar
+
+import asyncpg
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from wallet_app.config import settings
+from wallet_app.lookups import wallet_lookups
+from wallet_app.money import to_decimal, to_minor
+from wallet_app.schemas import SWalletBulkCreate, SWalletCreated
+
+COPY_COLUMNS = ("uuid", "balance")
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+
+class CSVFormatError(ValueError):
+    """A line of the CSV body is not a valid initial balance."""
+
+
+async def request_balances(
+        data: SWalletBulkCreate
+) -> AsyncIterator[Decimal]:
+    """
+    Returns the initial balances of a JSON bulk request.
+    :param data: request in format 'SWalletBulkCreate'.
+    :return: asynchronous iterator of initial balances.
+    """
+    if data.balances is not None:
+        for balance in data.balances:
+            yield balance
+    else:
+        for _ in range(data.count):
+            yield data.balance
+
+
+async def csv_balances(
+        body: AsyncIterable[bytes]
+) -> AsyncIterator[Decimal]:
+    """
+    Parses initial balances from a CSV body, one per line.
+
+    An optional 'balance' header line and empty lines are skipped.
+    :param body: request body chunks.
+    :return: asynchronous iterator of initial balances.
+    :raises CSVFormatError: if a line is not a non-negative number.
+    """
+    line_number = 0
+    async for line in lines(body):
+        line_number += 1
+        balance = parse_csv_line(line, line_number)
+        if balance is not None:
+            yield balance
+
+
+async def lines(body: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """
+    Splits a streamed body into lines.
+    :param body: body chunks.
+    :return: asynchronous iterator of lines without the line break.
+    """
+    tail = b""
+    async for chunk in body:
+        parts = (tail + chunk).split(b"\n")
+        tail = parts.pop()
+        for line in parts:
+            yield line
+    yield tail
+
+
+def parse_csv_line(line: bytes, line_number: int) -> Optional[Decimal]:
+    """
+    Parses one line of the CSV body.
+    :param line: line without the line break.
+    :param line_number: number of the line, starting from 1.
+    :return: initial balance or None for a skipped line.
+    :raises CSVFormatError: if the line is not a non-negative number.
+    """
+    line = line.strip()
+    if not line or (line_number == 1 and line == b"balance"):
+        return None
+    try:
+        balance = to_decimal(line)
+    except ValueError as error:
+        raise CSVFormatError(f"Line {line_number}: {error}")
+    if balance < 0:
+        raise CSVFormatError(f"Line {line_number}: balance must be >= 0")
+    return balance
+
+
+async def copy_wallets(
+        connection: asyncpg.Connection, balances: list[Decimal]
+) -> list[SWalletCreated]:
+    """
+    Creates wallets with one COPY.
+    :param connection: asyncpg connection.
+    :param balances: initial balances.
+    :return: created wallets in format 'SWalletCreated'.
+    """
+    wallet_uuids = [uuid.uuid4() for _ in balances]
+    await connection.copy_records_to_table(
+        "wallets",
+        records=zip(wallet_uuids, map(to_minor, balances)),
+        columns=COPY_COLUMNS,
+    )
+    return [
+        SWalletCreated(uuid=wallet_uuid, balance=balance)
+        for wallet_uuid, balance in zip(wallet_uuids, balances)
+    ]
+
+
+async def chunks(
+        items: AsyncIterable[T], size: int
+) -> AsyncIterator[list[T]]:
+    """
+    Splits streamed items into chunks.
+    :param items: asynchronous iterator of items.
+    :param size: number of items in a full chunk.
+    :return: asynchronous iterator of chunks.
+    """
+    chunk: list[T] = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def import_wallets(
+        session_factory: async_sessionmaker,
+        balances: AsyncIterable[Decimal],
+        output: BinaryIO
+) -> int:
+    """
+    Creates wallets in one transaction and writes them as NDJSON lines.
+    :param session_factory: session factory.
+    :param balances: asynchronous iterator of initial balances.
+    :param output: file the NDJSON lines of 'SWalletCreated' are written to.
+    :return: number of created wallets.
+    :raises CSVFormatError: if a line of a CSV body is invalid,
+    nothing is created then.
+    """
+    created = 0
+    async with session_factory() as session:
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        # COPY bypasses the session, so the transaction is opened
+        # on the asyncpg connection itself
+        driver_connection = raw_connection.driver_connection
+        async with driver_connection.transaction():
+            async for chunk in chunks(balances, settings.BULK_CHUNK_SIZE):
+                wallets = await copy_wallets(driver_connection, chunk)
+                for wallet in wallets:
+                    output.write(wallet.model_dump_json().encode() + b"\n")
+                wallet_lookups.add_existing(
+                    *(wallet.uuid for wallet in wallets)
+                )
+                created += len(chunk)
+    return created
+
+
+async def spool(body: AsyncIterable[bytes]) -> BinaryIO:
+    """
+    Reads a streamed body into a temporary file.
+    :param body: body chunks.
+    :return: file with the body, positioned at the start.
+    """
+    file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        async for chunk in body:
+            file.write(chunk)
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+async def stream_file(file: BinaryIO) -> AsyncIterator[bytes]:
+    """
+    Streams the file from the start and closes it.
+    :param file: file to stream.
+    :return: asynchronous iterator of file blocks.
+    """
+    try:
+        file.seek(0)
+        while block := file.read(READ_SIZE):
+            yield block
+    finally:
+        file.close()
@@ -0,0 +1,332 @@
+"""
+This module provides the read-through cache of wallet balances.
+
+The backend is selected by 'CACHE_BACKEND': 'none' (the default)
+disables caching, 'memory' keeps entries in process, 'redis' stores
+them in a server speaking the Redis protocol. Writers invalidate
+entries after commit, so the worker that wrote sees the change at once,
+while with 'memory' other workers may serve the old balance for up to
+'CACHE_TTL' seconds
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+from uuid import UUID
+
+from wallet_app.config import settings
+from wallet_app.metrics import Counters, register
+from wallet_app.schemas import SWalletCreated
+
+
+class CacheBackend(ABC):
+    """Interface of a key-value cache backend."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the cached value.
+        :param key: cache key.
+        :return: value or None if it is missing or expired.
+        """
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        """
+        Caches the value.
+        :param key: cache key.
+        :param value: value.
+        :param ttl: lifetime in seconds.
+        :return: None.
+        """
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """
+        Removes the values.
+        :param keys: cache keys.
+        :return: None.
+        """
+
+
+class NullCache(CacheBackend):
+    """Backend that caches nothing."""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+    async def delete(self, *keys: str) -> None:
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process cache with per-entry TTL and LRU eviction.
+
+    Least recently used entries are evicted when 'max_size' is reached,
+    expired entries are dropped on access.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, bytes]] = (
+            OrderedDict()
+        )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+
+class RedisError(Exception):
+    """Error reply of a Redis protocol server."""
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache stored in a server speaking the Redis protocol (RESP).
+
+    Keeps up to 'max_connections' idle connections for reuse,
+    a broken connection is closed and replaced by a new one.
+    A command not answered within 'timeout' seconds fails with
+    'TimeoutError', its connection is closed as well.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            max_connections: int,
+            timeout: float = 1.0
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle: list[
+            tuple[asyncio.StreamReader, asyncio.StreamWriter]
+        ] = []
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.execute(b"GET", key.encode())
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.execute(
+            b"SET", key.encode(), value, b"PX", str(int(ttl * 1000)).encode()
+        )
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.execute(b"DEL", *(key.encode() for key in keys))
+
+    async def execute(self, *args: bytes):
+        """
+        Sends a command and returns the server reply.
+        :param args: command name and arguments.
+        :return: decoded reply.
+        :raises RedisError: if the server replies with an error.
+        :raises TimeoutError: if there is no reply within 'timeout'.
+        """
+        reply = await asyncio.wait_for(self.roundtrip(args), self.timeout)
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def roundtrip(self, args: tuple[bytes, ...]):
+        """
+        Sends a command over an idle or a new connection and reads
+        the reply, the connection is closed on any failure,
+        including cancellation.
+        :param args: command name and arguments.
+        :return: decoded reply, error replies are returned as 'RedisError'.
+        """
+        if self._idle:
+            reader, writer = self._idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        try:
+            writer.write(self.encode(args))
+            await writer.drain()
+            reply = await self.read_reply(reader)
+        except BaseException:
+            writer.close()
+            raise
+        if len(self._idle) < self.max_connections:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return reply
+
+    @staticmethod
+    def encode(args: tuple[bytes, ...]) -> bytes:
+        """
+        Encodes a command as a RESP array of bulk strings.
+        :param args: command name and arguments.
+        :return: encoded command.
+        """
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    async def read_reply(cls, reader: asyncio.StreamReader):
+        """
+        Reads one RESP reply.
+        :param reader: connection reader.
+        :return: decoded reply, error replies are returned as 'RedisError'.
+        """
+        line = await reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await cls.read_reply(reader) for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+
+# Failures of a backend that are treated as misses, 'TimeoutError'
+# is raised by a Redis command without a reply in time
+BACKEND_ERRORS = (
+    OSError, TimeoutError, asyncio.IncompleteReadError, RedisError
+)
+
+
+class BalanceCache:
+    """
+    Read-through cache of 'SWalletCreated' responses by wallet UUID.
+
+    Backend errors and timeouts are counted and treated as misses,
+    so an unavailable or slow cache only costs database reads.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = Counters("hits", "misses", "invalidations", "errors")
+
+    @staticmethod
+    def key(wallet_uuid: UUID) -> str:
+        """
+        Returns the cache key of the wallet.
+        :param wallet_uuid: UUID of the wallet.
+        :return: cache key.
+        """
+        return f"wallet:{wallet_uuid}"
+
+    async def get(self, wallet_uuid: UUID) -> Optional[SWalletCreated]:
+        """
+        Returns the cached wallet.
+        :param wallet_uuid: UUID of the wallet.
+        :return: wallet in format 'SWalletCreated' or None on a miss.
+        """
+        value = await self.get_json(wallet_uuid)
+        if value is None:
+            return None
+        return SWalletCreated.model_validate_json(value)
+
+    async def get_json(self, wallet_uuid: UUID) -> Optional[bytes]:
+        """
+        Returns the cached wallet serialized as JSON.
+        :param wallet_uuid: UUID of the wallet.
+        :return: JSON of 'SWalletCreated' or None on a miss.
+        """
+        try:
+            value = await self.backend.get(self.key(wallet_uuid))
+        except BACKEND_ERRORS:
+            self.stats.inc("errors")
+            value = None
+        if value is None:
+            self.stats.inc("misses")
+            return None
+        self.stats.inc("hits")
+        return value
+
+    async def set(self, wallet: SWalletCreated) -> None:
+        """
+        Caches the wallet.
+        :param wallet: wallet in format 'SWalletCreated'.
+        :return: None.
+        """
+        await self.set_json(wallet.uuid, wallet.model_dump_json().encode())
+
+    async def set_json(self, wallet_uuid: UUID, value: bytes) -> None:
+        """
+        Caches the wallet serialized as JSON.
+        :param wallet_uuid: UUID of the wallet.
+        :param value: JSON of 'SWalletCreated'.
+        :return: None.
+        """
+        try:
+            await self.backend.set(self.key(wallet_uuid), value, self.ttl)
+        except BACKEND_ERRORS:
+            self.stats.inc("errors")
+
+    async def invalidate(self, *wallet_uuids: UUID) -> None:
+        """
+        Removes the wallets from the cache.
+        :param wallet_uuids: UUIDs of the wallets.
+        :return: None.
+        """
+        try:
+            await self.backend.delete(*map(self.key, wallet_uuids))
+            self.stats.inc("invalidations", len(wallet_uuids))
+        except BACKEND_ERRORS:
+            self.stats.inc("errors")
+
+
+def create_backend() -> CacheBackend:
+    """
+    Creates the cache backend selected in the settings.
+    :return: cache backend.
+    """
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryCache(settings.CACHE_MAX_SIZE)
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(
+            settings.CACHE_REDIS_HOST,
+            settings.CACHE_REDIS_PORT,
+            settings.CACHE_REDIS_MAX_CONNECTIONS,
+            settings.CACHE_REDIS_TIMEOUT,
+        )
+    return NullCache()
+
+
+balance_cache = BalanceCache(create_backend(), settings.CACHE_TTL)
+register("balance_cache", balance_cache.stats)
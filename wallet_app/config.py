@@ -1,5 +1,7 @@
 """Configuration for connecting to the database"""
 
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -15,6 +17,125 @@ class Settings(BaseSettings):
         DB_PORT (int): The database port.
         DB_NAME (str): The database name.
         TEST (str): Adding a database to the name of the test.
+        DB_BACKEND (str): Data access of the hot wallet endpoints:
+        'orm' or 'asyncpg' for prepared statements on a raw pool.
+        DB_POOL_SIZE (int): Number of connections kept in the pool,
+        sized by 'wallet_app.database.pool_sizing' if not set.
+        DB_MAX_OVERFLOW (int): Number of connections opened
+        above the pool size under load.
+        DB_POOL_TIMEOUT (float): Seconds to wait for a free connection
+        before failing the request.
+        DB_POOL_RECYCLE (int): Seconds after which a connection
+        is replaced, -1 keeps connections forever.
+        DB_POOL_PRE_PING (bool): Check a connection before handing it out.
+        DB_STATEMENT_CACHE_SIZE (int): Number of prepared statements
+        cached per connection, 0 for transaction-mode PgBouncer.
+        DB_STATEMENT_TIMEOUT (int): Server-side statement timeout
+        in milliseconds, 0 disables it.
+        DB_LOCK_TIMEOUT (int): Server-side lock wait timeout
+        in milliseconds, 0 disables it.
+        DB_MAX_CONNECTIONS (int): 'max_connections' of the Postgres server.
+        DB_RESERVED_CONNECTIONS (int): Server connections left
+        for migrations, maintenance and superusers.
+        DB_POOL_PREWARM (int): Number of pool connections each worker
+        opens at startup before it serves requests, at most the pool size.
+        CREATE_DB (bool): Create the database at the startup of every
+        worker if it does not exist, see 'wallet_app.initdb'.
+        STARTUP_PROFILE (bool): Log the duration of every startup step,
+        see 'wallet_app.startup'.
+        WEB_CONCURRENCY (int): Number of application worker processes,
+        the variable is also read by uvicorn.
+        CONCURRENCY_MODE (str): Concurrency control of wallet operations:
+        'pessimistic' for updates waiting on the row lock or 'optimistic'
+        for compare-and-swap updates on the row version.
+        OPTIMISTIC_RETRIES (int): Number of retries of an optimistic
+        operation that lost a race before it is aborted.
+        OPTIMISTIC_BACKOFF (float): Base pause in seconds before
+        a retry, doubled on every retry and jittered.
+        MONEY_SCALE (int): Number of decimal places of amounts,
+        which are stored as integer minor units, e.g. 2 for cents.
+        Fixed for the lifetime of a deployment.
+        BULK_CHUNK_SIZE (int): Number of wallets created by one COPY
+        and committed together by the bulk endpoint.
+        IMPORT_CHUNK_SIZE (int): Number of rows of a wallets table dump
+        loaded and committed in one transaction, see 'wallet_app.dump'.
+        GROUP_COMMIT (bool): Queue operations on the same wallet in process
+        and apply each queued group in one transaction.
+        GROUP_COMMIT_MAX_BATCH (int): Maximum number of operations
+        committed in one group.
+        TX_MAX_RETRIES (int): Number of reruns of a transaction aborted
+        by a serialization failure or a deadlock.
+        TX_RETRY_BACKOFF (float): Base pause in seconds before a rerun,
+        doubled on every rerun and jittered.
+        TX_RETRY_DEADLINE (float): Seconds after the first attempt
+        after which a transaction is no longer rerun.
+        SERIALIZABLE_ENDPOINTS (set[str]): Write endpoints running
+        at the SERIALIZABLE isolation level: 'operation', 'batch',
+        'transfer', 'hold' or 'stripes'.
+        LEDGER_MODE (bool): Keep balances in the append-only ledger
+        instead of updating the wallet row on every operation.
+        LEDGER_SNAPSHOT_INTERVAL (int): Number of ledger entries
+        after which the wallet balance is rolled into a snapshot.
+        LEDGER_COMPACT_PERIOD (float): Pause in seconds between
+        passes of the ledger compactor.
+        LEDGER_COMPACT_BATCH (int): Maximum number of wallets
+        compacted in one pass.
+        IDEMPOTENCY_KEY_TTL (int): Lifetime of an idempotency key in seconds.
+        IDEMPOTENCY_CACHE_SIZE (int): Maximum number of stored responses
+        cached in process.
+        IDEMPOTENCY_PURGE_PERIOD (float): Pause in seconds between purges
+        of expired idempotency keys.
+        IDEMPOTENCY_PURGE_BATCH (int): Number of expired keys deleted
+        per transaction.
+        CACHE_BACKEND (str): Balance cache backend:
+        'none', 'memory' or 'redis'. Off by default, with 'memory'
+        each worker may serve a balance changed by another worker
+        for up to 'CACHE_TTL' seconds.
+        CACHE_TTL (float): Lifetime of a cached balance in seconds,
+        the bound on staleness seen by other workers.
+        CACHE_MAX_SIZE (int): Maximum number of balances in the memory cache.
+        CACHE_REDIS_HOST (str): Host of the Redis protocol server.
+        CACHE_REDIS_PORT (int): Port of the Redis protocol server.
+        CACHE_REDIS_MAX_CONNECTIONS (int): Maximum number of idle
+        connections kept to the Redis protocol server.
+        CACHE_REDIS_TIMEOUT (float): Seconds to wait for a reply
+        of the Redis protocol server, a timeout is a cache miss.
+        SINGLE_FLIGHT (bool): Share one database read between
+        concurrent requests for the same wallet.
+        METRICS_ENABLED (bool): Time requests and database queries
+        for the Prometheus metrics endpoint.
+        BALANCE_EVENTS (bool): Notify balance changes on commit
+        and stream them to subscribers, see 'wallet_app.events'.
+        Off by default, as the notifications serialize the commits
+        of all write transactions of the database.
+        EVENTS_MAX_WALLETS (int): Maximum number of wallets
+        of one subscription.
+        EVENTS_COALESCE_INTERVAL (float): Minimum pause in seconds
+        between two pushes to a subscriber, changes of a wallet
+        in between are merged into the latest balance.
+        EVENTS_HEARTBEAT (float): Seconds without changes after which
+        a comment is sent on an event stream to keep it open.
+        NEGATIVE_CACHE (bool): Remember UUIDs of missing wallets in process
+        and answer requests for them without the database.
+        NEGATIVE_CACHE_TTL (float): Seconds a missing wallet is remembered.
+        NEGATIVE_CACHE_MAX_SIZE (int): Maximum number of remembered
+        missing wallets.
+        WALLET_FILTER (bool): Reject UUIDs missing in a Bloom filter
+        of all wallets built at startup, single writer only,
+        see 'wallet_app.lookups'.
+        WALLET_FILTER_SINGLE_WRITER (bool): Asserts that the worker
+        is the only writer of wallets: no other workers, hosts
+        or command line imports. 'WALLET_FILTER' is ignored without it.
+        WALLET_FILTER_CAPACITY (int): Number of wallets the Bloom filter
+        is sized for.
+        WALLET_FILTER_ERROR_RATE (float): False positive rate
+        of the Bloom filter at its capacity.
+        HOLD_TTL (float): Lifetime of a hold in seconds
+        if the request does not set it.
+        HOLD_SWEEP_PERIOD (float): Pause in seconds between releases
+        of expired holds.
+        HOLD_SWEEP_BATCH (int): Number of expired holds released
+        per transaction.
     """
 
     DB_USER: str
@@ -23,6 +144,64 @@ class Settings(BaseSettings):
     DB_PORT: int
     DB_NAME: str
     TEST: str = ""
+    DB_BACKEND: Literal["orm", "asyncpg"] = "orm"
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = False
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_STATEMENT_TIMEOUT: int = 0
+    DB_LOCK_TIMEOUT: int = 0
+    DB_MAX_CONNECTIONS: int = 100
+    DB_RESERVED_CONNECTIONS: int = 10
+    DB_POOL_PREWARM: int = 0
+    CREATE_DB: bool = True
+    STARTUP_PROFILE: bool = False
+    WEB_CONCURRENCY: int = 1
+    CONCURRENCY_MODE: Literal["pessimistic", "optimistic"] = "pessimistic"
+    OPTIMISTIC_RETRIES: int = 5
+    OPTIMISTIC_BACKOFF: float = 0.002
+    MONEY_SCALE: int = 2
+    BULK_CHUNK_SIZE: int = 10000
+    IMPORT_CHUNK_SIZE: int = 10000
+    GROUP_COMMIT: bool = False
+    GROUP_COMMIT_MAX_BATCH: int = 100
+    TX_MAX_RETRIES: int = 5
+    TX_RETRY_BACKOFF: float = 0.005
+    TX_RETRY_DEADLINE: float = 2.0
+    SERIALIZABLE_ENDPOINTS: set[str] = set()
+    LEDGER_MODE: bool = False
+    LEDGER_SNAPSHOT_INTERVAL: int = 100
+    LEDGER_COMPACT_PERIOD: float = 5.0
+    LEDGER_COMPACT_BATCH: int = 100
+    IDEMPOTENCY_KEY_TTL: int = 86400
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_PURGE_PERIOD: float = 60.0
+    IDEMPOTENCY_PURGE_BATCH: int = 1000
+    CACHE_BACKEND: Literal["none", "memory", "redis"] = "none"
+    CACHE_TTL: float = 1.0
+    CACHE_MAX_SIZE: int = 100000
+    CACHE_REDIS_HOST: str = "localhost"
+    CACHE_REDIS_PORT: int = 6379
+    CACHE_REDIS_MAX_CONNECTIONS: int = 16
+    CACHE_REDIS_TIMEOUT: float = 0.1
+    SINGLE_FLIGHT: bool = True
+    METRICS_ENABLED: bool = True
+    BALANCE_EVENTS: bool = False
+    EVENTS_MAX_WALLETS: int = 1000
+    EVENTS_COALESCE_INTERVAL: float = 0.1
+    EVENTS_HEARTBEAT: float = 15.0
+    NEGATIVE_CACHE: bool = True
+    NEGATIVE_CACHE_TTL: float = 1.0
+    NEGATIVE_CACHE_MAX_SIZE: int = 100000
+    WALLET_FILTER: bool = False
+    WALLET_FILTER_SINGLE_WRITER: bool = False
+    WALLET_FILTER_CAPACITY: int = 10_000_000
+    WALLET_FILTER_ERROR_RATE: float = 0.01
+    HOLD_TTL: float = 900.0
+    HOLD_SWEEP_PERIOD: float = 5.0
+    HOLD_SWEEP_BATCH: int = 1000
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", load_dotenv=True
@@ -1,14 +1,237 @@
 """
 This module creates an asynchronous engine and asynchronous session,
-as well as a declarative database for models
+as well as a declarative database for models.
+The engine is created on first use rather than on import, so tools
+importing the models do not build it and the app builds it
+in its lifespan.
+Queries and pool checkouts are timed for 'wallet_app.metrics'
 """
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from typing import Callable, Optional
+
+from sqlalchemy import Engine, event, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+from wallet_app.config import Settings, settings
+from wallet_app.metrics import Gauges, Histograms, add_query_time, register
+
+logger = logging.getLogger(__name__)
+
+# Labeled by the data access backend, 'orm' or 'asyncpg'.
+# 'operation_statement_seconds' is the whole statement of a wallet
+# operation, the wait for the row lock included
+db_timings = register("db", Histograms(
+    "query_seconds", "pool_wait_seconds", "operation_statement_seconds",
+    labels=("backend",),
+))
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """
+    Connection pool recording how long checkouts wait.
+
+    The wait includes opening a new connection within the overflow.
+    Used only with 'METRICS_ENABLED', see 'engine_options'.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_timings.observe(
+                "pool_wait_seconds", time.perf_counter() - started, "orm"
+            )
+
+
+def start_query(connection, *args) -> None:
+    """Remembers when a query of the connection started."""
+    connection.info["query_started"] = time.perf_counter()
+
+
+def end_query(connection, *args) -> None:
+    """Records the duration of a query of the connection."""
+    elapsed = time.perf_counter() - connection.info["query_started"]
+    db_timings.observe("query_seconds", elapsed, "orm")
+    add_query_time(elapsed)
+
+
+def pool_sizing(
+        workers: int,
+        max_connections: int,
+        reserved: int,
+        max_overflow: int
+) -> tuple[int, int]:
+    """
+    Splits the server connections between the worker pools.
+
+    Each worker gets an equal share of 'max_connections' minus the
+    reserved connections, so all pools at their overflow limit
+    still fit on the server.
+    :param workers: number of application worker processes.
+    :param max_connections: 'max_connections' of the Postgres server.
+    :param reserved: connections left for other clients.
+    :param max_overflow: requested overflow of each pool.
+    :return: pool size and max overflow of each worker.
+    """
+    share = max(1, (max_connections - reserved) // max(1, workers))
+    max_overflow = max(0, min(max_overflow, share - 1))
+    return share - max_overflow, max_overflow
+
+
+def engine_options(config: Settings) -> dict:
+    """
+    Returns the engine arguments from the settings.
+    :param config: application settings.
+    :return: keyword arguments of 'create_async_engine'.
+    """
+    if config.DB_POOL_SIZE is None:
+        pool_size, max_overflow = pool_sizing(
+            config.WEB_CONCURRENCY,
+            config.DB_MAX_CONNECTIONS,
+            config.DB_RESERVED_CONNECTIONS,
+            config.DB_MAX_OVERFLOW,
+        )
+    else:
+        pool_size, max_overflow = config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW
+    server_settings = {}
+    if config.DB_STATEMENT_TIMEOUT:
+        server_settings["statement_timeout"] = str(config.DB_STATEMENT_TIMEOUT)
+    if config.DB_LOCK_TIMEOUT:
+        server_settings["lock_timeout"] = str(config.DB_LOCK_TIMEOUT)
+    if not config.BALANCE_EVENTS:
+        # Checked by the trigger notifying balance changes
+        server_settings["wallet.balance_events"] = "off"
+    return {
+        "poolclass": (
+            TimedPool if config.METRICS_ENABLED else AsyncAdaptedQueuePool
+        ),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "connect_args": {
+            "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        },
+    }
+
+
+async def check_pool_budget(engine: AsyncEngine, capacity: int) -> None:
+    """
+    Warns if the pools of all workers can exceed the server connections.
+    :param engine: asynchronous engine.
+    :param capacity: pool size plus max overflow of one worker.
+    :return: None.
+    """
+    async with engine.connect() as connection:
+        max_connections = int(
+            await connection.scalar(text("SHOW max_connections"))
+        )
+    budget = settings.WEB_CONCURRENCY * capacity
+    if budget > max_connections - settings.DB_RESERVED_CONNECTIONS:
+        logger.warning(
+            "%s workers may open %s connections, the server allows %s "
+            "with %s reserved", settings.WEB_CONCURRENCY, budget,
+            max_connections, settings.DB_RESERVED_CONNECTIONS
+        )
+
+
+async def prewarm_pool(engine: AsyncEngine, connections: int) -> int:
+    """
+    Opens pool connections before the first requests need them.
+
+    The connections are opened concurrently and checked back in,
+    so the pool keeps them. At most the pool size is opened,
+    connections of the overflow would be closed on check in.
+    :param engine: asynchronous engine.
+    :param connections: number of connections to open.
+    :return: number of opened connections.
+    """
+    connections = max(0, min(connections, engine.pool.size()))
+    async with AsyncExitStack() as stack:
+        async with asyncio.TaskGroup() as group:
+            for _ in range(connections):
+                group.create_task(
+                    stack.enter_async_context(engine.connect())
+                )
+    return connections
 
-from wallet_app.config import settings
 
 DATABASE_URL = settings.get_db_url()
-engine = create_async_engine(DATABASE_URL)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+ENGINE_OPTIONS = engine_options(settings)
+POOL_CAPACITY = ENGINE_OPTIONS["pool_size"] + ENGINE_OPTIONS["max_overflow"]
 Base = declarative_base()
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_engine() -> AsyncEngine:
+    """
+    Returns the application engine, created on the first call.
+    :return: asynchronous engine.
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = create_async_engine(DATABASE_URL, **ENGINE_OPTIONS)
+        _session_factory = async_sessionmaker(
+            _engine, expire_on_commit=False
+        )
+    return _engine
+
+
+def get_sessionmaker() -> async_sessionmaker:
+    """
+    Returns the session factory of the application engine.
+    :return: session factory.
+    """
+    get_engine()
+    return _session_factory
+
+
+async def dispose_engine() -> None:
+    """
+    Closes the connections of the application engine if it is created.
+
+    The next call of 'get_engine' creates a new engine.
+    :return: None.
+    """
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = _session_factory = None
+
+
+def pool_gauge(read: Callable[[Pool], float]) -> Callable[[], float]:
+    """
+    Returns a gauge of the application pool, 0 until the engine is created.
+    :param read: function reading the value from the pool.
+    :return: gauge function.
+    """
+    return lambda: 0 if _engine is None else read(_engine.pool)
+
+
+register("db_pool", Gauges(
+    size=pool_gauge(lambda pool: pool.size()),
+    checked_in=pool_gauge(lambda pool: pool.checkedin()),
+    checked_out=pool_gauge(lambda pool: pool.checkedout()),
+    overflow=pool_gauge(lambda pool: max(0, pool.overflow())),
+    utilization=pool_gauge(lambda pool: pool.checkedout() / POOL_CAPACITY),
+))
+
+if settings.METRICS_ENABLED:
+    event.listen(Engine, "before_cursor_execute", start_query)
+    event.listen(Engine, "after_cursor_execute", end_query)
@@ -1,36 +1,78 @@
 """This module provides asynchronous session generators for database access"""
 
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Callable, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, AsyncTransaction
+import asyncpg
+from fastapi import Depends, Header
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from wallet_app.database import async_session
+from wallet_app import fastpath
+from wallet_app.config import settings
+from wallet_app.database import get_sessionmaker
+from wallet_app.responses import negotiate
+from wallet_app.transactions import TransactionRunner
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Asynchronous database session generator.
 
     The session is automatically closed after use."""
-    db = async_session()
+    db = get_sessionmaker()()
     try:
         yield db
     finally:
         await db.close()
 
 
-async def get_transaction_session() -> AsyncGenerator[AsyncTransaction, None]:
-    """Asynchronous database session generator for transactions.
+def get_idempotency_key(
+        idempotency_key: Optional[str] = Header(default=None, max_length=255)
+) -> Optional[str]:
+    """Returns the value of the 'Idempotency-Key' request header.
 
-    Allows you to perform operations within a transaction.
-    After the work, a commit is performed if there are no exceptions,
-    otherwise, the transaction will be rolled back.
-    The session is automatically closed after use."""
-    async with async_session() as session:
-        try:
-            yield session
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            raise e
-        finally:
-            await session.close()
+    Requests retried with the same key are applied only once,
+    see 'wallet_app.idempotency'."""
+    return idempotency_key
+
+
+def get_media_type(accept: str = Header(default="")) -> str:
+    """Returns the media type of the response body.
+
+    Negotiated from the 'Accept' request header: JSON by default
+    or MessagePack, see 'wallet_app.responses'."""
+    return negotiate(accept)
+
+
+def get_session_factory() -> async_sessionmaker:
+    """Returns the database session factory.
+
+    Used by handlers that outlive the request dependencies,
+    such as streaming responses, to open their own session."""
+    return get_sessionmaker()
+
+
+def get_pool() -> Optional[asyncpg.Pool]:
+    """Returns the asyncpg pool of the fast path.
+
+    The pool is open only when 'DB_BACKEND' is 'asyncpg',
+    see 'wallet_app.fastpath'."""
+    return fastpath.pool
+
+
+def transaction_runner(
+        endpoint: str
+) -> Callable[[async_sessionmaker], TransactionRunner]:
+    """Returns a dependency providing the transaction runner of an endpoint.
+
+    The unit of work is rerun on serialization failures and deadlocks,
+    see 'wallet_app.transactions'. Endpoints named in
+    'SERIALIZABLE_ENDPOINTS' run at the SERIALIZABLE isolation level."""
+
+    def get_transaction_runner(
+            session_factory: async_sessionmaker = Depends(get_session_factory)
+    ) -> TransactionRunner:
+        isolation_level = None
+        if endpoint in settings.SERIALIZABLE_ENDPOINTS:
+            isolation_level = "SERIALIZABLE"
+        return TransactionRunner(session_factory, isolation_level)
+
+    return get_transaction_runner
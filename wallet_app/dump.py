@@ -0,0 +1,534 @@
+"""
+This module provides streaming export and import of the wallets table.
+
+A dump holds the UUID and the full balance of every wallet, slots of
+striped wallets included, as CSV with a header line or NDJSON with
+decimal balances, or in the binary COPY format of Postgres with
+balances in minor units, see 'wallet_app.money'. Export runs one
+'COPY TO STDOUT', so all rows come from one snapshot, and passes
+the data on through a bounded queue, which keeps memory constant
+however large the table.
+Import parses the dump as it is read and loads it with 'COPY FROM'
+into a temporary table, 'IMPORT_CHUNK_SIZE' rows per transaction,
+then upserts the chunk into 'wallets'. The number of rows loaded
+after each commit is the checkpoint an interrupted import
+is resumed from. Also usable from the command line:
+
+    python -m wallet_app.dump export --format binary --output wallets.bin
+    python -m wallet_app.dump import wallets.bin --format binary
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from contextlib import suppress
+from decimal import Decimal
+from typing import AsyncIterable, AsyncIterator, BinaryIO
+from uuid import UUID
+
+from sqlalchemy import BigInteger, Numeric, String, cast, func, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from wallet_app.bulk import chunks, lines, stream_file
+from wallet_app.cache import balance_cache
+from wallet_app.config import settings
+from wallet_app.database import dispose_engine, get_sessionmaker
+from wallet_app.lookups import wallet_lookups
+from wallet_app.metrics import Counters, register
+from wallet_app.models import Wallet
+from wallet_app.money import from_minor, to_decimal, to_minor
+from wallet_app.schemas import DumpFormat, SImportProgress
+from wallet_app.striping import total_balance
+
+MEDIA_TYPES = {
+    DumpFormat.CSV: "text/csv",
+    DumpFormat.NDJSON: "application/x-ndjson",
+    DumpFormat.BINARY: "application/octet-stream",
+}
+CSV_HEADER = b"uuid,balance"
+BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+EXPORT_QUEUE_SIZE = 16
+STAGING_TABLE = "wallets_import"
+
+CREATE_STAGING = f"""
+CREATE TEMPORARY TABLE {STAGING_TABLE} (
+    id bigint GENERATED ALWAYS AS IDENTITY,
+    uuid uuid NOT NULL,
+    balance bigint NOT NULL
+) ON COMMIT DROP
+"""
+
+# Slots of an overwritten wallet are removed, the imported balance
+# being its full balance. Of rows repeating a UUID the last one wins.
+UPSERT_STAGING = f"""
+WITH rows AS (
+    SELECT DISTINCT ON (uuid) uuid, balance
+    FROM {STAGING_TABLE}
+    ORDER BY uuid, id DESC
+), cleared AS (
+    DELETE FROM wallet_slots USING rows
+    WHERE wallet_slots.wallet_uuid = rows.uuid
+)
+INSERT INTO wallets (uuid, balance, stripes, version)
+SELECT uuid, balance, 0, 0 FROM rows
+ON CONFLICT (uuid) DO UPDATE
+SET balance = excluded.balance,
+    stripes = 0,
+    version = wallets.version + 1
+"""
+
+Record = tuple[UUID, Decimal]
+
+stats = register(
+    "dump", Counters("exported_rows", "imported_rows", "imported_chunks")
+)
+
+
+class DumpFormatError(ValueError):
+    """A row of an imported dump is not a valid wallet."""
+
+
+def export_query(data_format: DumpFormat) -> str:
+    """
+    Returns the query the wallets are copied out with.
+    :param data_format: format of the dump.
+    :return: SQL query.
+    """
+    balance = total_balance()
+    if data_format == DumpFormat.BINARY:
+        # Sums of slots are NUMERIC, the binary dump has int8 minor units
+        balance = cast(balance, BigInteger)
+    else:
+        balance = func.round(
+            cast(balance, Numeric) / 10 ** settings.MONEY_SCALE,
+            settings.MONEY_SCALE,
+        )
+    if data_format == DumpFormat.NDJSON:
+        # Text COPY escapes backslashes only, which UUIDs
+        # and numbers do not contain, so every row is a JSON line
+        statement = select(func.json_build_object(
+            "uuid", Wallet.uuid, "balance", cast(balance, String)
+        ))
+    else:
+        statement = select(Wallet.uuid, balance.label("balance"))
+    return str(statement.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True},
+    ))
+
+
+async def export_wallets(
+        session_factory: async_sessionmaker, data_format: DumpFormat
+) -> AsyncIterator[bytes]:
+    """
+    Streams the dump of the wallets table.
+
+    The COPY runs in a task that waits while the queue
+    of unsent blocks is full and is cancelled if the stream is closed.
+    :param session_factory: session factory.
+    :param data_format: format of the dump.
+    :return: asynchronous iterator of dump blocks.
+    """
+    queue: asyncio.Queue = asyncio.Queue(EXPORT_QUEUE_SIZE)
+    options = {"format": "text"}
+    if data_format == DumpFormat.CSV:
+        options = {"format": "csv", "header": True}
+    elif data_format == DumpFormat.BINARY:
+        options = {"format": "binary"}
+
+    async with session_factory() as session:
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+
+        async def copy() -> None:
+            try:
+                # asyncpg hands the data over as a bytearray
+                status = await driver_connection.copy_from_query(
+                    export_query(data_format),
+                    output=lambda data: queue.put(bytes(data)),
+                    **options,
+                )
+                stats.inc("exported_rows", int(status.split()[-1]))
+            finally:
+                await queue.put(None)
+
+        task = asyncio.ensure_future(copy())
+        try:
+            while (block := await queue.get()) is not None:
+                yield block
+            await task
+        finally:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+
+def parse_record(uuid_value, balance_value, row: int) -> Record:
+    """
+    Validates one row of a dump.
+    :param uuid_value: UUID of the wallet as text or bytes.
+    :param balance_value: balance of the wallet.
+    :param row: number of the row, starting from 1.
+    :return: UUID and balance of the wallet.
+    :raises DumpFormatError: if the UUID or the balance is invalid.
+    """
+    try:
+        wallet_uuid = (
+            UUID(bytes=uuid_value) if isinstance(uuid_value, bytes)
+            else UUID(uuid_value)
+        )
+    except (TypeError, ValueError, AttributeError):
+        raise DumpFormatError(f"Row {row}: invalid UUID")
+    try:
+        balance = to_decimal(balance_value)
+    except ValueError as error:
+        raise DumpFormatError(f"Row {row}: {error}")
+    if balance < 0:
+        raise DumpFormatError(f"Row {row}: balance must be >= 0")
+    return wallet_uuid, balance
+
+
+async def csv_records(body: AsyncIterable[bytes]) -> AsyncIterator[Record]:
+    """
+    Parses a CSV dump, an optional header line and empty lines skipped.
+    :param body: dump chunks.
+    :return: asynchronous iterator of records.
+    :raises DumpFormatError: if a row is invalid.
+    """
+    line_number = 0
+    row = 0
+    async for line in lines(body):
+        line_number += 1
+        line = line.strip()
+        if not line or (line_number == 1 and line == CSV_HEADER):
+            continue
+        row += 1
+        fields = line.split(b",")
+        if len(fields) != 2:
+            raise DumpFormatError(f"Row {row}: expected uuid,balance")
+        yield parse_record(fields[0].decode(errors="replace"), fields[1], row)
+
+
+async def ndjson_records(
+        body: AsyncIterable[bytes]
+) -> AsyncIterator[Record]:
+    """
+    Parses an NDJSON dump with an object per line.
+    :param body: dump chunks.
+    :return: asynchronous iterator of records.
+    :raises DumpFormatError: if a row is invalid.
+    """
+    row = 0
+    async for line in lines(body):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            wallet = json.loads(line, parse_float=Decimal)
+        except ValueError:
+            raise DumpFormatError(f"Row {row}: invalid JSON")
+        if not isinstance(wallet, dict):
+            raise DumpFormatError(f"Row {row}: expected an object")
+        yield parse_record(wallet.get("uuid"), wallet.get("balance"), row)
+
+
+async def binary_records(
+        body: AsyncIterable[bytes]
+) -> AsyncIterator[Record]:
+    """
+    Parses a dump in the binary COPY format with a uuid
+    and a bigint column of minor units.
+    :param body: dump chunks.
+    :return: asynchronous iterator of records.
+    :raises DumpFormatError: if the dump is malformed or a row is invalid.
+    """
+    blocks = aiter(body)
+    buffer = bytearray()
+
+    async def read(size: int) -> bytes:
+        while len(buffer) < size:
+            block = await anext(blocks, None)
+            if block is None:
+                raise DumpFormatError("Binary dump is truncated")
+            buffer.extend(block)
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        return data
+
+    if await read(len(BINARY_SIGNATURE)) != BINARY_SIGNATURE:
+        raise DumpFormatError("Not a binary COPY dump")
+    _, extension = struct.unpack("!ii", await read(8))
+    await read(extension)
+    row = 0
+    while True:
+        (fields,) = struct.unpack("!h", await read(2))
+        if fields == -1:
+            return
+        row += 1
+        if fields != 2:
+            raise DumpFormatError(f"Row {row}: expected uuid,balance")
+        (length,) = struct.unpack("!i", await read(4))
+        if length != 16:
+            raise DumpFormatError(f"Row {row}: invalid UUID")
+        wallet_uuid = await read(length)
+        (length,) = struct.unpack("!i", await read(4))
+        if length != 8:
+            raise DumpFormatError(f"Row {row}: balance is not a number")
+        (balance,) = struct.unpack("!q", await read(length))
+        yield parse_record(wallet_uuid, from_minor(balance), row)
+
+
+def read_records(
+        body: AsyncIterable[bytes], data_format: DumpFormat
+) -> AsyncIterator[Record]:
+    """
+    Returns the parser of the dump format.
+    :param body: dump chunks.
+    :param data_format: format of the dump.
+    :return: asynchronous iterator of records.
+    """
+    if data_format == DumpFormat.CSV:
+        return csv_records(body)
+    if data_format == DumpFormat.NDJSON:
+        return ndjson_records(body)
+    return binary_records(body)
+
+
+async def skip_records(
+        records: AsyncIterable[Record], skip: int
+) -> AsyncIterator[Record]:
+    """
+    Drops the records loaded before the checkpoint.
+    :param records: asynchronous iterator of records.
+    :param skip: number of leading records to drop.
+    :return: asynchronous iterator of the remaining records.
+    """
+    async for record in records:
+        if skip:
+            skip -= 1
+            continue
+        yield record
+
+
+async def import_wallets(
+        session_factory: async_sessionmaker,
+        records: AsyncIterable[Record],
+        skip: int = 0
+) -> AsyncIterator[int]:
+    """
+    Loads the records, each chunk in its own transaction.
+
+    Existing wallets are overwritten, so loading a chunk
+    a second time after a crash changes nothing.
+    :param session_factory: session factory.
+    :param records: asynchronous iterator of records.
+    :param skip: number of leading records loaded by an earlier import.
+    :return: asynchronous iterator of the number of rows loaded so far,
+    the skipped ones included, after each commit.
+    :raises DumpFormatError: if a row is invalid, the chunks before
+    the row stay loaded then.
+    """
+    rows = skip
+    async with session_factory() as session:
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        # COPY bypasses the session, so every chunk is committed
+        # on the asyncpg connection itself
+        driver_connection = raw_connection.driver_connection
+        async for chunk in chunks(
+                skip_records(records, skip), settings.IMPORT_CHUNK_SIZE
+        ):
+            async with driver_connection.transaction():
+                await driver_connection.execute(CREATE_STAGING)
+                await driver_connection.copy_records_to_table(
+                    STAGING_TABLE,
+                    records=[
+                        (wallet_uuid, to_minor(balance))
+                        for wallet_uuid, balance in chunk
+                    ],
+                    columns=("uuid", "balance"),
+                )
+                await driver_connection.execute(UPSERT_STAGING)
+            rows += len(chunk)
+            stats.inc("imported_rows", len(chunk))
+            stats.inc("imported_chunks")
+            wallet_uuids = {wallet_uuid for wallet_uuid, _ in chunk}
+            wallet_lookups.add_existing(*wallet_uuids)
+            await balance_cache.invalidate(*wallet_uuids)
+            yield rows
+
+
+async def stream_import(
+        session_factory: async_sessionmaker,
+        body: BinaryIO,
+        data_format: DumpFormat,
+        skip: int = 0
+) -> AsyncIterator[bytes]:
+    """
+    Loads a spooled dump and streams the progress as NDJSON lines.
+
+    A line of 'SImportProgress' follows every committed chunk,
+    an invalid row ends the stream with a line holding the error.
+    :param session_factory: session factory.
+    :param body: file with the dump, closed when it is read.
+    :param data_format: format of the dump.
+    :param skip: number of leading records loaded by an earlier import.
+    :return: asynchronous iterator of NDJSON lines.
+    """
+    rows = skip
+    records = read_records(stream_file(body), data_format)
+    try:
+        async for rows in import_wallets(session_factory, records, skip):
+            progress = SImportProgress(rows=rows)
+            yield progress.model_dump_json(exclude_none=True).encode() + b"\n"
+    except DumpFormatError as error:
+        progress = SImportProgress(rows=rows, error=str(error))
+        yield progress.model_dump_json().encode() + b"\n"
+    finally:
+        body.close()
+
+
+def read_checkpoint(path: str) -> int:
+    """
+    Reads the number of rows loaded by an interrupted import.
+    :param path: path of the checkpoint file.
+    :return: number of loaded rows, 0 if there is no checkpoint.
+    """
+    try:
+        with open(path) as file:
+            return int(file.read())
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path: str, rows: int) -> None:
+    """
+    Atomically replaces the checkpoint file.
+    :param path: path of the checkpoint file.
+    :param rows: number of loaded rows.
+    :return: None.
+    """
+    with open(f"{path}.tmp", "w") as file:
+        file.write(str(rows))
+    os.replace(f"{path}.tmp", path)
+
+
+async def export_file(
+        session_factory: async_sessionmaker,
+        data_format: DumpFormat,
+        output: BinaryIO
+) -> int:
+    """
+    Writes the dump of the wallets table to a file.
+    :param session_factory: session factory.
+    :param data_format: format of the dump.
+    :param output: file the dump is written to.
+    :return: number of exported rows.
+    """
+    exported = stats.get("exported_rows")
+    started = time.perf_counter()
+    async for block in export_wallets(session_factory, data_format):
+        output.write(block)
+    output.flush()
+    rows = stats.get("exported_rows") - exported
+    logging.info(
+        "Exported %s rows, %.0f rows/sec",
+        rows, rows / (time.perf_counter() - started),
+    )
+    return rows
+
+
+async def import_file(
+        session_factory: async_sessionmaker,
+        data_format: DumpFormat,
+        path: str,
+        checkpoint: str
+) -> int:
+    """
+    Loads a dump file, resuming from the checkpoint file if it exists.
+
+    The checkpoint is written after every committed chunk
+    and removed once the whole file is loaded.
+    :param session_factory: session factory.
+    :param data_format: format of the dump.
+    :param path: path of the dump file.
+    :param checkpoint: path of the checkpoint file.
+    :return: number of rows in the dump.
+    :raises DumpFormatError: if a row is invalid.
+    """
+    skip = read_checkpoint(checkpoint)
+    if skip:
+        logging.info("Resuming after row %s", skip)
+    rows = skip
+    started = time.perf_counter()
+    records = read_records(stream_file(open(path, "rb")), data_format)
+    async for rows in import_wallets(session_factory, records, skip):
+        write_checkpoint(checkpoint, rows)
+        logging.info(
+            "Imported %s rows, %.0f rows/sec",
+            rows, (rows - skip) / (time.perf_counter() - started),
+        )
+    with suppress(FileNotFoundError):
+        os.remove(checkpoint)
+    return rows
+
+
+async def main(args: argparse.Namespace) -> int:
+    """
+    Runs the command line export or import.
+    :param args: parsed command line arguments.
+    :return: exit code.
+    """
+    if settings.LEDGER_MODE:
+        logging.error("Dump is not available in ledger mode")
+        return 1
+    data_format = DumpFormat(args.format)
+    async_session = get_sessionmaker()
+    try:
+        if args.command == "export":
+            if args.output == "-":
+                await export_file(
+                    async_session, data_format, sys.stdout.buffer
+                )
+            else:
+                with open(args.output, "wb") as output:
+                    await export_file(async_session, data_format, output)
+        else:
+            await import_file(
+                async_session, data_format, args.input,
+                args.checkpoint or f"{args.input}.checkpoint",
+            )
+    except DumpFormatError as error:
+        logging.error("%s", error)
+        return 1
+    finally:
+        await dispose_engine()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("--output", default="-")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--checkpoint")
+    for command_parser in (export_parser, import_parser):
+        command_parser.add_argument(
+            "--format",
+            choices=[data_format.value for data_format in DumpFormat],
+            default=DumpFormat.CSV.value,
+        )
+    sys.exit(asyncio.run(main(parser.parse_args())))
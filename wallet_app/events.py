@@ -0,0 +1,400 @@
+"""
+This module provides the stream of wallet balance changes.
+
+Commits of wallet operations send NOTIFY on the channel
+'wallet_balances', see the migration 'a3f9c1d2e8b7'. Each worker holds
+one LISTEN connection, opened with the first subscription and closed
+after the last one, and fans the changes out to its subscribers.
+A subscriber keeps only the latest balance of each of its wallets
+until it is pushed, so a slow client gets fewer, merged updates
+instead of a growing queue. Changes notified without a balance are
+read from the database, one query for all wallets waiting to be read.
+'balance_events' is the hub of the worker
+"""
+
+import asyncio
+import logging
+from contextlib import suppress
+from decimal import Decimal
+from typing import AsyncIterator, Iterable, Optional
+from uuid import UUID
+
+import asyncpg
+from fastapi import WebSocket, WebSocketDisconnect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from wallet_app.config import settings
+from wallet_app.exceptions import WalletNotFoundError
+from wallet_app.metrics import Counters, register
+from wallet_app.models import Wallet
+from wallet_app.money import from_minor
+from wallet_app.operations import wallets_statement
+from wallet_app.schemas import SWalletCreated, WalletField
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "wallet_balances"
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+# Pause in seconds before reconnecting a lost LISTEN connection
+RECONNECT_DELAY = 1.0
+
+
+async def read_balances(
+        session: AsyncSession, wallet_uuids: Iterable[UUID]
+) -> dict[UUID, Decimal]:
+    """
+    Reads the current balances of wallets.
+    :param session: asynchronous database session.
+    :param wallet_uuids: UUIDs of the wallets.
+    :return: mapping of wallet UUID to its balance,
+    missing wallets are absent.
+    """
+    result = await session.execute(
+        wallets_statement([WalletField.BALANCE])
+        .where(Wallet.uuid.in_(list(wallet_uuids)))
+    )
+    return {row.uuid: row.balance for row in result}
+
+
+class Subscription:
+    """
+    Balance changes of a set of wallets awaiting a client.
+
+    Only the latest balance of every wallet is kept until the client
+    takes the changes, so the memory held for a client is bounded
+    by the number of its wallets however slowly it reads.
+    """
+
+    def __init__(self, wallet_uuids: frozenset[UUID]) -> None:
+        self.wallet_uuids = wallet_uuids
+        self._changes: dict[UUID, Decimal] = {}
+        self._ready = asyncio.Event()
+
+    def push(
+            self, wallet_uuid: UUID, balance: Decimal, replace: bool = True
+    ) -> bool:
+        """
+        Stores the latest balance of the wallet.
+        :param wallet_uuid: UUID of the wallet.
+        :param balance: new balance.
+        :param replace: whether to replace a balance not taken yet.
+        :return: True if a balance not taken yet was there.
+        """
+        merged = wallet_uuid in self._changes
+        if replace or not merged:
+            self._changes[wallet_uuid] = balance
+        self._ready.set()
+        return merged
+
+    async def changes(
+            self, timeout: Optional[float] = None
+    ) -> dict[UUID, Decimal]:
+        """
+        Waits for changes and takes them.
+        :param timeout: seconds to wait, None waits until a change.
+        :return: mapping of wallet UUID to its latest balance,
+        empty if nothing changed before the timeout.
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        changes, self._changes = self._changes, {}
+        return changes
+
+
+class BalanceEvents:
+    """
+    Fans balance change notifications out to subscriptions.
+
+    A lost LISTEN connection is reopened and the balances of all
+    subscribed wallets are read again, so no change stays unseen.
+    A balance read for a notification without one is dropped
+    if a notification with the balance arrived in the meantime.
+    """
+
+    def __init__(self) -> None:
+        self._connection: Optional[asyncpg.Connection] = None
+        self._connecting = asyncio.Lock()
+        self._subscriptions: dict[UUID, set[Subscription]] = {}
+        # Number of balances received per subscribed wallet
+        self._received: dict[UUID, int] = {}
+        self._unread: set[UUID] = set()
+        self._reader: Optional[asyncio.Task] = None
+        self._reconnect: Optional[asyncio.Task] = None
+        self._session_factory: Optional[async_sessionmaker] = None
+        self.stats = Counters(
+            "notifications", "pushes", "merged", "reads", "reconnects"
+        )
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    async def subscribe(
+            self,
+            session_factory: async_sessionmaker,
+            wallet_uuids: Iterable[UUID]
+    ) -> Subscription:
+        """
+        Subscribes to the balance changes of wallets.
+
+        The current balances are the first changes of the subscription.
+        :param session_factory: session factory to read balances with.
+        :param wallet_uuids: UUIDs of the wallets.
+        :return: subscription.
+        :raises WalletNotFoundError: if a wallet does not exist.
+        """
+        self._session_factory = session_factory
+        subscription = Subscription(frozenset(wallet_uuids))
+        await self._listen()
+        for wallet_uuid in subscription.wallet_uuids:
+            self._subscriptions.setdefault(wallet_uuid, set()).add(
+                subscription
+            )
+        try:
+            async with session_factory() as session:
+                balances = await read_balances(
+                    session, subscription.wallet_uuids
+                )
+            missing = subscription.wallet_uuids - balances.keys()
+            if missing:
+                raise WalletNotFoundError(min(missing))
+        except BaseException:
+            await self.unsubscribe(subscription)
+            raise
+        for wallet_uuid, balance in balances.items():
+            # A notification received meanwhile is at least as recent
+            subscription.push(wallet_uuid, balance, replace=False)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes the subscription, closing the LISTEN connection
+        after the last one. Removing it again does nothing.
+        :param subscription: subscription.
+        :return: None.
+        """
+        for wallet_uuid in subscription.wallet_uuids:
+            subscriptions = self._subscriptions.get(wallet_uuid)
+            if subscriptions is None:
+                continue
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[wallet_uuid]
+                self._received.pop(wallet_uuid, None)
+                self._unread.discard(wallet_uuid)
+        if not self._subscriptions:
+            await self.close()
+
+    async def close(self) -> None:
+        """
+        Closes the LISTEN connection and stops reading balances.
+        :return: None.
+        """
+        for task in (self._reader, self._reconnect):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+        self._reader = self._reconnect = None
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.remove_termination_listener(self._on_termination)
+            await connection.close()
+
+    async def _listen(self) -> None:
+        """
+        Opens the LISTEN connection if it is not open.
+        :return: None.
+        """
+        async with self._connecting:
+            if self._connection is not None:
+                return
+            connection = await asyncpg.connect(
+                settings.get_db_url().replace("+asyncpg", "")
+            )
+            await connection.add_listener(CHANNEL, self._on_notification)
+            connection.add_termination_listener(self._on_termination)
+            self._connection = connection
+
+    def _on_notification(
+            self,
+            connection: asyncpg.Connection,
+            pid: int,
+            channel: str,
+            payload: str
+    ) -> None:
+        """
+        Pushes the balance of a notification to the subscriptions
+        of the wallet or schedules reading it.
+        :param payload: '<wallet uuid>:<balance in minor units>',
+        the balance may be empty.
+        :return: None.
+        """
+        wallet_uuid, _, units = payload.partition(":")
+        wallet_uuid = UUID(wallet_uuid)
+        if wallet_uuid not in self._subscriptions:
+            return
+        self.stats.inc("notifications")
+        if units:
+            self._publish(wallet_uuid, from_minor(int(units)))
+        else:
+            self._read_later([wallet_uuid])
+
+    def _on_termination(self, connection: asyncpg.Connection) -> None:
+        """
+        Reconnects after the LISTEN connection was lost.
+        :param connection: lost connection.
+        :return: None.
+        """
+        if connection is not self._connection:
+            return
+        self._connection = None
+        self.stats.inc("reconnects")
+        self._reconnect = asyncio.ensure_future(self._relisten())
+
+    async def _relisten(self) -> None:
+        """
+        Reopens the LISTEN connection and reads all subscribed balances,
+        since notifications were missed while it was down.
+        :return: None.
+        """
+        while self._subscriptions:
+            try:
+                await self._listen()
+            except (OSError, asyncpg.PostgresError) as error:
+                logger.warning("Cannot listen to %s: %s", CHANNEL, error)
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            self._read_later(list(self._subscriptions))
+            return
+
+    def _publish(self, wallet_uuid: UUID, balance: Decimal) -> None:
+        """
+        Pushes a balance to the subscriptions of the wallet.
+        :param wallet_uuid: UUID of the wallet.
+        :param balance: new balance.
+        :return: None.
+        """
+        self._received[wallet_uuid] = self._received.get(wallet_uuid, 0) + 1
+        for subscription in self._subscriptions.get(wallet_uuid, ()):
+            self.stats.inc("pushes")
+            if subscription.push(wallet_uuid, balance):
+                self.stats.inc("merged")
+
+    def _read_later(self, wallet_uuids: list[UUID]) -> None:
+        """
+        Schedules reading the balances of wallets.
+        :param wallet_uuids: UUIDs of the wallets.
+        :return: None.
+        """
+        self._unread.update(wallet_uuids)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self) -> None:
+        """
+        Reads the balances scheduled for reading and pushes them,
+        until none are left.
+        :return: None.
+        """
+        while self._unread:
+            wallet_uuids, self._unread = self._unread, set()
+            received = {
+                wallet_uuid: self._received.get(wallet_uuid)
+                for wallet_uuid in wallet_uuids
+            }
+            self.stats.inc("reads")
+            try:
+                async with self._session_factory() as session:
+                    balances = await read_balances(session, wallet_uuids)
+            except (OSError, SQLAlchemyError) as error:
+                logger.warning("Cannot read balances: %s", error)
+                self._unread.update(
+                    wallet_uuids & self._subscriptions.keys()
+                )
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            for wallet_uuid, balance in balances.items():
+                if self._received.get(wallet_uuid) == received[wallet_uuid]:
+                    self._publish(wallet_uuid, balance)
+
+
+balance_events = BalanceEvents()
+register("balance_events", balance_events.stats)
+
+
+def encode_changes(changes: dict[UUID, Decimal]) -> list[str]:
+    """
+    Serializes balance changes.
+    :param changes: mapping of wallet UUID to its balance.
+    :return: change of every wallet in JSON format 'SWalletCreated'.
+    """
+    return [
+        SWalletCreated.model_construct(
+            uuid=wallet_uuid, balance=balance
+        ).model_dump_json()
+        for wallet_uuid, balance in changes.items()
+    ]
+
+
+async def stream_events(subscription: Subscription) -> AsyncIterator[bytes]:
+    """
+    Streams the changes of a subscription as server-sent events.
+
+    Every change is a 'balance' event. The next changes are taken
+    after the previous ones were sent and 'EVENTS_COALESCE_INTERVAL'
+    passed. A comment is sent after 'EVENTS_HEARTBEAT' seconds
+    without changes. The subscription is removed when the stream ends.
+    :param subscription: subscription.
+    :return: asynchronous iterator over the event stream.
+    """
+    try:
+        while True:
+            changes = await subscription.changes(settings.EVENTS_HEARTBEAT)
+            if not changes:
+                yield b": heartbeat\n\n"
+                continue
+            yield "".join(
+                f"event: balance\ndata: {data}\n\n"
+                for data in encode_changes(changes)
+            ).encode()
+            await asyncio.sleep(settings.EVENTS_COALESCE_INTERVAL)
+    finally:
+        await balance_events.unsubscribe(subscription)
+
+
+async def serve_websocket(
+        websocket: WebSocket, subscription: Subscription
+) -> None:
+    """
+    Accepts a WebSocket and sends the changes of a subscription to it
+    until the client disconnects.
+
+    Every change is a text message. Messages of the client are ignored.
+    The subscription is removed when the client disconnects.
+    :param websocket: WebSocket to accept.
+    :param subscription: subscription.
+    :return: None.
+    """
+
+    async def send() -> None:
+        while True:
+            for data in encode_changes(await subscription.changes()):
+                await websocket.send_text(data)
+            await asyncio.sleep(settings.EVENTS_COALESCE_INTERVAL)
+
+    sender = None
+    try:
+        await websocket.accept()
+        sender = asyncio.ensure_future(send())
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+            with suppress(
+                    asyncio.CancelledError, WebSocketDisconnect, OSError
+            ):
+                await sender
+        await balance_events.unsubscribe(subscription)
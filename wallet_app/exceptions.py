@@ -0,0 +1,41 @@
+"""This module describes errors raised by wallet operations"""
+
+
+class WalletOperationError(Exception):
+    """Base class for errors raised by wallet operations."""
+
+
+class WalletNotFoundError(WalletOperationError):
+    """The wallet with the given UUID does not exist."""
+
+
+class InsufficientFundsError(WalletOperationError):
+    """The wallet balance is lower than the amount to withdraw."""
+
+
+class BalanceOverflowError(WalletOperationError):
+    """The balance would exceed the largest amount a wallet can hold."""
+
+
+class WalletStripedError(WalletOperationError):
+    """The wallet balance is striped over slots."""
+
+
+class WalletConflictError(WalletOperationError):
+    """Concurrent changes of the wallet exhausted the retries."""
+
+
+class WalletRaceLostError(WalletConflictError):
+    """A compare-and-swap update missed, the transaction can be rerun."""
+
+
+class HoldNotFoundError(WalletOperationError):
+    """The hold with the given identifier does not exist."""
+
+
+class HoldStateError(WalletOperationError):
+    """The hold is not active, its state is the first argument."""
+
+
+class StorageModeError(Exception):
+    """The balances are stored in the mode named by the first argument."""
@@ -0,0 +1,255 @@
+"""
+This module provides the raw asyncpg data-access backend.
+
+With 'DB_BACKEND' set to 'asyncpg' the hot endpoints (create, operate
+and get a wallet) run fixed SQL on an asyncpg pool instead of the ORM.
+asyncpg prepares each statement once per connection, and responses
+are built as JSON bytes directly from the returned row.
+Requests with an idempotency key, ledger mode and operations
+on striped wallets use the ORM path. Amounts are passed and read
+as minor units, see 'wallet_app.money'
+"""
+
+import time
+import uuid
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+import asyncpg
+
+from wallet_app.config import Settings, settings
+from wallet_app.database import db_timings, engine_options
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    InsufficientFundsError,
+    WalletNotFoundError,
+    WalletStripedError,
+)
+from wallet_app.metrics import add_query_time
+from wallet_app.money import from_minor, to_minor
+from wallet_app.schemas import OperationType
+
+# Same as 'wallet_app.striping.total_balance'.
+SELECT_WALLET = """
+SELECT balance + CASE WHEN stripes > 0 THEN (
+    SELECT coalesce(sum(balance), 0)::bigint FROM wallet_slots
+    WHERE wallet_uuid = wallets.uuid
+) ELSE 0 END
+FROM wallets WHERE uuid = $1
+"""
+
+INSERT_WALLET = """
+INSERT INTO wallets (uuid, balance) VALUES ($1, $2) RETURNING balance
+"""
+
+# Same shape as 'wallet_app.operations.operation_statement':
+# $1 wallet UUID, $2 operation type, $3 amount.
+DEPOSIT = """
+WITH updated AS (
+    UPDATE wallets SET balance = balance + $3, version = version + 1
+    WHERE uuid = $1 AND stripes = 0
+    RETURNING uuid, balance
+), recorded AS (
+    INSERT INTO wallet_operations
+        (wallet_uuid, operation_type, amount, balance)
+    SELECT uuid, $2, $3, balance FROM updated
+    RETURNING balance
+)
+SELECT (SELECT stripes FROM wallets WHERE uuid = $1) AS stripes,
+       (SELECT balance FROM recorded) AS balance
+"""
+
+WITHDRAW = """
+WITH updated AS (
+    UPDATE wallets SET balance = balance - $3, version = version + 1
+    WHERE uuid = $1 AND stripes = 0 AND balance >= $3
+    RETURNING uuid, balance
+), recorded AS (
+    INSERT INTO wallet_operations
+        (wallet_uuid, operation_type, amount, balance)
+    SELECT uuid, $2, $3, balance FROM updated
+    RETURNING balance
+)
+SELECT (SELECT stripes FROM wallets WHERE uuid = $1) AS stripes,
+       (SELECT balance FROM recorded) AS balance
+"""
+
+pool: Optional[asyncpg.Pool] = None
+
+
+def enabled() -> bool:
+    """
+    Returns whether the hot endpoints use the asyncpg backend.
+    :return: True if 'DB_BACKEND' is 'asyncpg' outside ledger mode.
+    """
+    return settings.DB_BACKEND == "asyncpg" and not settings.LEDGER_MODE
+
+
+async def create_pool(
+        config: Settings, dsn: Optional[str] = None
+) -> asyncpg.Pool:
+    """
+    Creates an asyncpg pool with the engine pool settings.
+    :param config: application settings.
+    :param dsn: database URL, by default the one from the settings.
+    :return: connection pool.
+    """
+    options = engine_options(config)
+    return await asyncpg.create_pool(
+        dsn or config.get_db_url().replace("+asyncpg", ""),
+        # Opened before the pool is returned, see 'DB_POOL_PREWARM'
+        min_size=max(0, min(config.DB_POOL_PREWARM, options["pool_size"])),
+        max_size=options["pool_size"] + options["max_overflow"],
+        statement_cache_size=config.DB_STATEMENT_CACHE_SIZE,
+        server_settings=options["connect_args"]["server_settings"],
+    )
+
+
+async def open_pool() -> asyncpg.Pool:
+    """
+    Opens the application pool.
+    :return: connection pool.
+    """
+    global pool
+    pool = await create_pool(settings)
+    return pool
+
+
+async def close_pool() -> None:
+    """
+    Closes the application pool if it is open.
+    :return: None.
+    """
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+@asynccontextmanager
+async def acquire(
+        connections: asyncpg.Pool
+) -> AsyncIterator[asyncpg.Connection]:
+    """
+    Acquires a connection and records how long it waited for it
+    if 'METRICS_ENABLED' is on.
+    :param connections: connection pool.
+    :return: connection returned to the pool on exit.
+    """
+    started = time.perf_counter()
+    async with connections.acquire(
+            timeout=settings.DB_POOL_TIMEOUT
+    ) as connection:
+        if settings.METRICS_ENABLED:
+            db_timings.observe(
+                "pool_wait_seconds", time.perf_counter() - started, "asyncpg"
+            )
+        yield connection
+
+
+def record_query(started: float) -> float:
+    """
+    Records the duration of a query for the metrics.
+    :param started: 'time.perf_counter' value before the query.
+    :return: duration in seconds.
+    """
+    elapsed = time.perf_counter() - started
+    if settings.METRICS_ENABLED:
+        db_timings.observe("query_seconds", elapsed, "asyncpg")
+        add_query_time(elapsed)
+    return elapsed
+
+
+def wallet_json(wallet_uuid: UUID, balance: int) -> bytes:
+    """
+    Serializes a wallet as 'SWalletCreated' does.
+    :param wallet_uuid: UUID of the wallet.
+    :param balance: balance of the wallet in minor units.
+    :return: JSON of 'SWalletCreated'.
+    """
+    return b'{"uuid":"%s","balance":"%s"}' % (
+        str(wallet_uuid).encode(), str(from_minor(balance)).encode()
+    )
+
+
+async def read_wallet(
+        connections: asyncpg.Pool, wallet_uuid: UUID
+) -> Optional[bytes]:
+    """
+    Reads the wallet and its current balance.
+    :param connections: connection pool.
+    :param wallet_uuid: UUID of the wallet.
+    :return: JSON of 'SWalletCreated' or None if it does not exist.
+    """
+    async with acquire(connections) as connection:
+        started = time.perf_counter()
+        balance = await connection.fetchval(SELECT_WALLET, wallet_uuid)
+        record_query(started)
+    if balance is None:
+        return None
+    return wallet_json(wallet_uuid, balance)
+
+
+async def create_wallet(
+        connections: asyncpg.Pool, balance: Optional[Decimal]
+) -> tuple[UUID, bytes]:
+    """
+    Creates a wallet.
+    :param connections: connection pool.
+    :param balance: initial balance, 0 if not set.
+    :return: UUID and JSON of the created wallet.
+    """
+    wallet_uuid = uuid.uuid4()
+    async with acquire(connections) as connection:
+        started = time.perf_counter()
+        balance = await connection.fetchval(
+            INSERT_WALLET, wallet_uuid, to_minor(balance or 0)
+        )
+        record_query(started)
+    return wallet_uuid, wallet_json(wallet_uuid, balance)
+
+
+async def apply_operation(
+        connections: asyncpg.Pool,
+        wallet_uuid: UUID,
+        operation_type: OperationType,
+        amount: Decimal
+) -> bytes:
+    """
+    Applies a deposit or withdrawal to the wallet in one statement.
+
+    The statement runs in its own implicit transaction.
+    :param connections: connection pool.
+    :param wallet_uuid: UUID of the wallet.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :return: JSON of the updated wallet.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the balance is too low to withdraw.
+    :raises WalletStripedError: if the wallet is striped.
+    :raises BalanceOverflowError: if a deposit exceeds the BIGINT range
+    of the balance.
+    """
+    query = DEPOSIT if operation_type == OperationType.DEPOSIT else WITHDRAW
+    async with acquire(connections) as connection:
+        started = time.perf_counter()
+        try:
+            stripes, balance = await connection.fetchrow(
+                query, wallet_uuid, operation_type.value, to_minor(amount)
+            )
+        except asyncpg.NumericValueOutOfRangeError as error:
+            raise BalanceOverflowError(wallet_uuid) from error
+        elapsed = record_query(started)
+        if settings.METRICS_ENABLED:
+            db_timings.observe(
+                "operation_statement_seconds", elapsed, "asyncpg"
+            )
+    if balance is None:
+        if stripes is None:
+            raise WalletNotFoundError(wallet_uuid)
+        if stripes:
+            raise WalletStripedError(wallet_uuid)
+        raise InsufficientFundsError(wallet_uuid)
+    return wallet_json(wallet_uuid, balance)
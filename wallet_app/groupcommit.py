@@ -0,0 +1,172 @@
+"""
+This module provides per-wallet group commit of wallet operations.
+
+With 'GROUP_COMMIT' enabled, operations on one wallet arriving at the
+worker are queued instead of each taking a connection and waiting
+for the row lock. One drain task per wallet applies the queued
+operations in arrival order, up to 'GROUP_COMMIT_MAX_BATCH' at a time,
+in a single transaction with 'wallet_app.operations.apply_batch',
+and every caller gets the result or error of its own operation.
+The queue of a wallet is dropped as soon as it is empty
+"""
+
+import asyncio
+from typing import Optional
+from uuid import UUID
+
+from wallet_app.config import settings
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    InsufficientFundsError,
+    WalletNotFoundError,
+)
+from wallet_app.metrics import Counters, register
+from wallet_app.operations import apply_batch
+from wallet_app.schemas import (
+    BatchItemStatus,
+    SBatchOperationItem,
+    SWalletCreated,
+    SWalletOperation,
+)
+from wallet_app.transactions import TransactionRunner
+
+Pending = tuple[SWalletOperation, asyncio.Future]
+
+
+def enabled() -> bool:
+    """
+    Returns whether wallet operations are group committed.
+    :return: True if 'GROUP_COMMIT' is set outside ledger mode.
+    """
+    return settings.GROUP_COMMIT and not settings.LEDGER_MODE
+
+
+class GroupCommit:
+    """
+    Serializes operations per wallet and commits them in groups.
+
+    Operations queued while a group is being committed form the next
+    group. A caller that is cancelled before its group starts
+    is skipped, after that its operation is applied regardless.
+    """
+
+    def __init__(self) -> None:
+        self._queues: dict[UUID, list[Pending]] = {}
+        self._drains: set[asyncio.Task] = set()
+        self.stats = Counters("operations", "commits", "evictions")
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    async def submit(
+            self,
+            runner: TransactionRunner,
+            wallet_uuid: UUID,
+            operation: SWalletOperation
+    ) -> SWalletCreated:
+        """
+        Queues the operation and waits for its group to be committed.
+        :param runner: transaction runner of the request.
+        :param wallet_uuid: UUID of the wallet.
+        :param operation: operation to perform.
+        :return: updated wallet in format 'SWalletCreated'.
+        :raises WalletNotFoundError: if the wallet does not exist.
+        :raises InsufficientFundsError: if the balance is too low to withdraw.
+        :raises BalanceOverflowError: if a deposit exceeds
+        the largest balance, other operations of the group are applied.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(wallet_uuid)
+        if queue is None:
+            queue = self._queues[wallet_uuid] = []
+            drain = asyncio.ensure_future(
+                self._drain(runner, wallet_uuid, queue)
+            )
+            self._drains.add(drain)
+            drain.add_done_callback(self._drains.discard)
+        queue.append((operation, future))
+        self.stats.inc("operations")
+        return await future
+
+    async def _drain(
+            self,
+            runner: TransactionRunner,
+            wallet_uuid: UUID,
+            queue: list[Pending]
+    ) -> None:
+        """
+        Commits the queued operations of the wallet until none are left.
+        :param runner: transaction runner.
+        :param wallet_uuid: UUID of the wallet.
+        :param queue: queued operations of the wallet.
+        :return: None.
+        """
+        try:
+            while queue:
+                group = [
+                    pending
+                    for pending in queue[:settings.GROUP_COMMIT_MAX_BATCH]
+                    if not pending[1].done()
+                ]
+                del queue[:settings.GROUP_COMMIT_MAX_BATCH]
+                if group:
+                    await self._commit(runner, wallet_uuid, group)
+        finally:
+            del self._queues[wallet_uuid]
+            self.stats.inc("evictions")
+            for _, future in queue:
+                future.cancel()
+
+    async def _commit(
+            self,
+            runner: TransactionRunner,
+            wallet_uuid: UUID,
+            group: list[Pending]
+    ) -> None:
+        """
+        Applies a group of operations in one transaction.
+        :param runner: transaction runner.
+        :param wallet_uuid: UUID of the wallet.
+        :param group: operations to apply in order.
+        :return: None.
+        """
+        items = [
+            SBatchOperationItem(
+                wallet_uuid=wallet_uuid,
+                operation_type=operation.operation_type,
+                amount=operation.amount,
+            )
+            for operation, _ in group
+        ]
+        try:
+            result = await runner.run(
+                lambda session: apply_batch(session, items, atomic=False)
+            )
+        except Exception as error:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.stats.inc("commits")
+        for (_, future), item in zip(group, result.results):
+            if future.done():
+                continue
+            error: Optional[Exception] = None
+            if item.status == BatchItemStatus.NOT_FOUND:
+                error = WalletNotFoundError(wallet_uuid)
+            elif item.status == BatchItemStatus.INSUFFICIENT_FUNDS:
+                error = InsufficientFundsError(wallet_uuid)
+            elif item.status == BatchItemStatus.BALANCE_OVERFLOW:
+                error = BalanceOverflowError(wallet_uuid)
+            if error is None:
+                future.set_result(
+                    SWalletCreated.model_construct(
+                        uuid=wallet_uuid, balance=item.balance
+                    )
+                )
+            else:
+                future.set_exception(error)
+
+
+wallet_queues = GroupCommit()
+register("group_commit", wallet_queues.stats)
@@ -0,0 +1,269 @@
+"""
+This module provides holds, withdrawals made in two phases.
+
+Creating a hold withdraws the amount with the usual conditional update
+of 'wallet_app.operations' and records the hold in the same
+transaction, so the wallet balance is its available balance, the full
+balance minus the active holds, and every other withdrawal sees only
+that. Capturing a hold marks it captured with one update of the hold
+row, the funds are already gone. Releasing it deposits the amount
+back. Active holds past their expiry time are released in batches
+by the sweeper. Every step locks the wallet row, the hold row
+or both only for the duration of its own short transaction
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from wallet_app.cache import balance_cache
+from wallet_app.config import settings
+from wallet_app.exceptions import HoldNotFoundError, HoldStateError
+from wallet_app.metrics import Counters, register
+from wallet_app.models import WalletHold
+from wallet_app.operations import apply_batch, apply_operation
+from wallet_app.schemas import (
+    HoldStatus,
+    OperationType,
+    SBatchOperationItem,
+    SHold,
+)
+from wallet_app.transactions import TransactionRunner
+
+logger = logging.getLogger(__name__)
+
+HOLD_COLUMNS = (
+    WalletHold.id,
+    WalletHold.wallet_uuid,
+    WalletHold.amount,
+    WalletHold.status,
+    WalletHold.expires_at,
+)
+
+stats = register("holds", Counters(
+    "created", "captured", "released", "expired"
+))
+
+
+def to_schema(row) -> SHold:
+    """
+    Converts a row of 'HOLD_COLUMNS' to the response model.
+    :param row: row of the hold.
+    :return: hold in format 'SHold'.
+    """
+    return SHold.model_construct(
+        id=row.id,
+        wallet_uuid=row.wallet_uuid,
+        amount=row.amount,
+        status=HoldStatus(row.status),
+        expires_at=row.expires_at,
+    )
+
+
+async def read_hold(session: AsyncSession, hold_id: UUID) -> SHold:
+    """
+    Reads the hold.
+    :param session: asynchronous database session.
+    :param hold_id: identifier of the hold.
+    :return: hold in format 'SHold'.
+    :raises HoldNotFoundError: if the hold does not exist.
+    """
+    row = (await session.execute(
+        select(*HOLD_COLUMNS).where(WalletHold.id == hold_id)
+    )).one_or_none()
+    if row is None:
+        raise HoldNotFoundError(hold_id)
+    return to_schema(row)
+
+
+async def create_hold(
+        session: AsyncSession,
+        wallet_uuid: UUID,
+        amount: Decimal,
+        ttl: Optional[float] = None
+) -> SHold:
+    """
+    Reserves funds of the wallet.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param amount: positive amount to reserve.
+    :param ttl: lifetime of the hold in seconds, 'HOLD_TTL' if not set.
+    :return: active hold in format 'SHold'.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the available balance is too low.
+    :raises WalletConflictError: if optimistic retries are exhausted.
+    """
+    await apply_operation(
+        session, wallet_uuid, OperationType.WITHDRAW, amount
+    )
+    ttl = settings.HOLD_TTL if ttl is None else ttl
+    row = (await session.execute(
+        insert(WalletHold)
+        .values(
+            id=uuid.uuid4(),
+            wallet_uuid=wallet_uuid,
+            amount=amount,
+            status=HoldStatus.ACTIVE.value,
+            expires_at=func.now() + timedelta(seconds=ttl),
+        )
+        .returning(*HOLD_COLUMNS)
+    )).one()
+    stats.inc("created")
+    return to_schema(row)
+
+
+async def capture_hold(session: AsyncSession, hold_id: UUID) -> SHold:
+    """
+    Captures an active hold before it expires.
+
+    Capturing a captured hold returns it unchanged.
+    :param session: asynchronous database session.
+    :param hold_id: identifier of the hold.
+    :return: captured hold in format 'SHold'.
+    :raises HoldNotFoundError: if the hold does not exist.
+    :raises HoldStateError: if the hold is released or expired.
+    """
+    row = (await session.execute(
+        update(WalletHold)
+        .where(
+            WalletHold.id == hold_id,
+            WalletHold.status == HoldStatus.ACTIVE.value,
+            WalletHold.expires_at > func.now(),
+        )
+        .values(status=HoldStatus.CAPTURED.value)
+        .returning(*HOLD_COLUMNS)
+    )).one_or_none()
+    if row is not None:
+        stats.inc("captured")
+        return to_schema(row)
+    hold = await read_hold(session, hold_id)
+    if hold.status == HoldStatus.CAPTURED:
+        return hold
+    # An active hold here is past its expiry and waits for the sweeper
+    raise HoldStateError(
+        HoldStatus.EXPIRED if hold.status == HoldStatus.ACTIVE
+        else hold.status
+    )
+
+
+async def release_hold(session: AsyncSession, hold_id: UUID) -> SHold:
+    """
+    Releases an active hold and deposits its amount back.
+
+    Releasing a released or expired hold returns it unchanged.
+    :param session: asynchronous database session.
+    :param hold_id: identifier of the hold.
+    :return: released hold in format 'SHold'.
+    :raises HoldNotFoundError: if the hold does not exist.
+    :raises HoldStateError: if the hold is captured.
+    """
+    row = (await session.execute(
+        update(WalletHold)
+        .where(
+            WalletHold.id == hold_id,
+            WalletHold.status == HoldStatus.ACTIVE.value,
+        )
+        .values(status=HoldStatus.RELEASED.value)
+        .returning(*HOLD_COLUMNS)
+    )).one_or_none()
+    if row is None:
+        hold = await read_hold(session, hold_id)
+        if hold.status == HoldStatus.CAPTURED:
+            raise HoldStateError(hold.status)
+        return hold
+    await apply_operation(
+        session, row.wallet_uuid, OperationType.DEPOSIT, row.amount
+    )
+    stats.inc("released")
+    return to_schema(row)
+
+
+async def sweep_expired(
+        session_factory: async_sessionmaker,
+        batch_size: int
+) -> int:
+    """
+    Releases expired holds in batches.
+
+    Each batch is a transaction that marks up to 'batch_size' expired
+    holds, skipping the ones locked by concurrent captures and
+    releases, and deposits the amounts back with one batch of
+    operations, one per wallet, see 'wallet_app.operations.apply_batch'.
+    :param session_factory: session factory.
+    :param batch_size: number of holds released per transaction.
+    :return: number of released holds.
+    """
+    runner = TransactionRunner(session_factory)
+
+    async def work(session: AsyncSession) -> tuple[int, set[UUID]]:
+        expired = (
+            select(WalletHold.id)
+            .where(
+                WalletHold.status == HoldStatus.ACTIVE.value,
+                WalletHold.expires_at <= func.now(),
+            )
+            .order_by(WalletHold.expires_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        rows = (await session.execute(
+            update(WalletHold)
+            .where(WalletHold.id.in_(expired))
+            .values(status=HoldStatus.EXPIRED.value)
+            .returning(WalletHold.wallet_uuid, WalletHold.amount)
+            .execution_options(synchronize_session=False)
+        )).all()
+        amounts: dict[UUID, Decimal] = {}
+        for row in rows:
+            amounts[row.wallet_uuid] = (
+                amounts.get(row.wallet_uuid, 0) + row.amount
+            )
+        if amounts:
+            await apply_batch(session, [
+                SBatchOperationItem.model_construct(
+                    wallet_uuid=wallet_uuid,
+                    operation_type=OperationType.DEPOSIT,
+                    amount=amount,
+                )
+                for wallet_uuid, amount in amounts.items()
+            ], atomic=False)
+        return len(rows), set(amounts)
+
+    swept = 0
+    while True:
+        released, wallet_uuids = await runner.run(work)
+        await balance_cache.invalidate(*wallet_uuids)
+        swept += released
+        stats.inc("expired", released)
+        if released < batch_size:
+            return swept
+
+
+async def run_sweeper(
+        session_factory: async_sessionmaker,
+        period: Optional[float] = None
+) -> None:
+    """
+    Releases expired holds until the task is cancelled.
+    :param session_factory: session factory.
+    :param period: pause in seconds between sweeps.
+    :return: None.
+    """
+    period = settings.HOLD_SWEEP_PERIOD if period is None else period
+    while True:
+        try:
+            swept = await sweep_expired(
+                session_factory, settings.HOLD_SWEEP_BATCH
+            )
+            if swept:
+                logger.info("Released %s expired holds", swept)
+        except Exception as e:
+            logger.error("Error in hold sweeper: %s", e)
+        await asyncio.sleep(period)
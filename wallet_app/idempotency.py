@@ -0,0 +1,244 @@
+"""
+This module provides idempotency keys for wallet operations.
+
+A successful response is stored under the client's 'Idempotency-Key'
+in the same transaction as the balance change. Retries with the same
+key are answered from an in-process LRU cache backed by the
+'idempotency_keys' table without touching the wallet row.
+Keys expire after 'IDEMPOTENCY_KEY_TTL' seconds and are purged
+in batches by a background task
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from wallet_app.config import settings
+from wallet_app.models import IdempotencyKey
+from wallet_app.schemas import SWalletCreated, SWalletOperation
+
+logger = logging.getLogger(__name__)
+
+
+class StoredResponse(NamedTuple):
+    """Response stored under an idempotency key."""
+
+    request_hash: str
+    response: dict
+    expires_at: datetime
+
+
+class IdempotencyKeyReusedError(Exception):
+    """The idempotency key was already used for a different request."""
+
+
+class IdempotencyKeyTakenError(Exception):
+    """The idempotency key was stored by a concurrent request."""
+
+
+class IdempotencyCache:
+    """
+    Bounded in-process cache of stored responses.
+
+    Least recently used keys are evicted when the cache is full,
+    expired keys are dropped on access.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, StoredResponse] = OrderedDict()
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        """
+        Returns the stored response if it is cached and not expired.
+        :param key: idempotency key.
+        :return: stored response or None.
+        """
+        stored = self._entries.get(key)
+        if stored is None:
+            return None
+        if stored.expires_at <= datetime.now(timezone.utc):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return stored
+
+    def put(self, key: str, stored: StoredResponse) -> None:
+        """
+        Caches the stored response.
+        :param key: idempotency key.
+        :param stored: stored response.
+        :return: None.
+        """
+        self._entries[key] = stored
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes all cached responses."""
+        self._entries.clear()
+
+
+cache = IdempotencyCache(settings.IDEMPOTENCY_CACHE_SIZE)
+
+
+def request_hash(wallet_uuid: UUID, operation: SWalletOperation) -> str:
+    """
+    Returns a fingerprint of the operation request.
+    :param wallet_uuid: UUID of the wallet.
+    :param operation: requested operation.
+    :return: hex digest.
+    """
+    payload = f"{wallet_uuid}:{operation.model_dump_json()}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay(stored: StoredResponse, fingerprint: str) -> SWalletCreated:
+    """
+    Returns the stored response for a retried request.
+    :param stored: stored response.
+    :param fingerprint: fingerprint of the retried request.
+    :return: wallet in format 'SWalletCreated'.
+    :raises IdempotencyKeyReusedError: if the request differs
+    from the one the key was stored with.
+    """
+    if stored.request_hash != fingerprint:
+        raise IdempotencyKeyReusedError
+    return SWalletCreated.model_validate(stored.response)
+
+
+async def lookup(session: AsyncSession, key: str) -> Optional[StoredResponse]:
+    """
+    Finds the response stored under the key.
+
+    The in-process cache is checked first, then the table.
+    :param session: asynchronous database session.
+    :param key: idempotency key.
+    :return: stored response or None.
+    """
+    stored = cache.get(key)
+    if stored is not None:
+        return stored
+    result = await session.execute(
+        select(
+            IdempotencyKey.request_hash,
+            IdempotencyKey.response,
+            IdempotencyKey.expires_at,
+        ).where(
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at > func.now(),
+        )
+    )
+    row = result.one_or_none()
+    if row is None:
+        return None
+    stored = StoredResponse(*row)
+    cache.put(key, stored)
+    return stored
+
+
+async def save(
+        session: AsyncSession,
+        key: str,
+        fingerprint: str,
+        response: SWalletCreated
+) -> Optional[StoredResponse]:
+    """
+    Stores the response under the key in the current transaction.
+
+    An expired key is overwritten. If the key is held by a concurrent
+    transaction, the insert waits for it to finish.
+    :param session: asynchronous database session.
+    :param key: idempotency key.
+    :param fingerprint: fingerprint of the request.
+    :param response: response to store.
+    :return: stored response or None if the key is already used.
+    """
+    statement = pg_insert(IdempotencyKey).values(
+        key=key,
+        request_hash=fingerprint,
+        response=response.model_dump(mode="json"),
+        expires_at=func.now() + timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL
+        ),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key],
+        set_={
+            "request_hash": statement.excluded.request_hash,
+            "response": statement.excluded.response,
+            "created_at": func.now(),
+            "expires_at": statement.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at <= func.now(),
+    ).returning(
+        IdempotencyKey.request_hash,
+        IdempotencyKey.response,
+        IdempotencyKey.expires_at,
+    )
+    row = (await session.execute(statement)).one_or_none()
+    return None if row is None else StoredResponse(*row)
+
+
+async def purge_expired(
+        session_factory: async_sessionmaker, batch_size: int
+) -> int:
+    """
+    Deletes expired keys in batches.
+
+    Each batch is a short transaction that skips rows locked
+    by concurrent requests.
+    :param session_factory: session factory.
+    :param batch_size: number of keys deleted per transaction.
+    :return: number of deleted keys.
+    """
+    purged = 0
+    while True:
+        expired = (
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at <= func.now())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    delete(IdempotencyKey)
+                    .where(IdempotencyKey.key.in_(expired))
+                    .execution_options(synchronize_session=False)
+                )
+        purged += result.rowcount
+        if result.rowcount < batch_size:
+            return purged
+
+
+async def run_purger(
+        session_factory: async_sessionmaker,
+        period: Optional[float] = None
+) -> None:
+    """
+    Purges expired keys until the task is cancelled.
+    :param session_factory: session factory.
+    :param period: pause in seconds between purges.
+    :return: None.
+    """
+    period = settings.IDEMPOTENCY_PURGE_PERIOD if period is None else period
+    while True:
+        try:
+            purged = await purge_expired(
+                session_factory, settings.IDEMPOTENCY_PURGE_BATCH
+            )
+            if purged:
+                logger.info("Purged %s expired idempotency keys", purged)
+        except Exception as e:
+            logger.error("Error in idempotency key purger: %s", e)
+        await asyncio.sleep(period)
@@ -1,8 +1,13 @@
 """
 This module provides a function that creates a PostgreSQL database,
-even if it does not exist
+even if it does not exist.
+Called by every worker at startup unless 'CREATE_DB' is off,
+then the database is created once from the command line:
+
+    python -m wallet_app.initdb
 """
 
+import asyncio
 import logging
 
 import asyncpg
@@ -46,3 +51,7 @@ async def create_db() -> None:
 
     finally:
         await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(create_db())
@@ -0,0 +1,646 @@
+"""
+This module provides the append-only wallet ledger.
+
+In ledger mode a deposit only appends an entry to 'wallet_operations'
+and never updates the wallet row. The current balance is the latest
+snapshot (or the opening balance of the wallet) plus the entries
+written after it. The compactor periodically rolls the entries
+into a new snapshot, so the tail read with every balance stays short.
+
+Entries take a 'FOR KEY SHARE' lock on the wallet row, which does not
+conflict between deposits. Withdrawals serialize on
+'FOR NO KEY UPDATE' and the compactor takes 'FOR UPDATE', so it only
+folds entries of committed transactions.
+
+Row mode also appends every operation to 'wallet_operations' while
+the wallet row holds the balance, so neither mode can read the
+balances written by the other. The mode of the stored balances is
+kept in 'balance_storage', the app refuses to start in the other one,
+and the balances are converted with the app stopped:
+
+    python -m wallet_app.ledger convert ledger
+    python -m wallet_app.ledger convert row
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import sys
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    String,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from wallet_app.config import settings
+from wallet_app.database import dispose_engine, get_sessionmaker
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    InsufficientFundsError,
+    StorageModeError,
+    WalletNotFoundError,
+)
+from wallet_app.models import (
+    BalanceStorage,
+    Wallet,
+    WalletOperation,
+    WalletSlot,
+    WalletSnapshot,
+)
+from wallet_app.money import MinorUnits, out_of_range
+from wallet_app.schemas import (
+    OperationType,
+    SWalletCreated,
+    SWalletOperationEntry,
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 1000
+
+# Modes of the stored balances recorded in 'balance_storage'
+ROW_STORAGE = "row"
+LEDGER_STORAGE = "ledger"
+
+
+def signed_amount() -> ColumnElement:
+    """
+    Returns the amount of a ledger entry with the sign of its operation.
+    :return: column expression.
+    """
+    return case(
+        (
+            WalletOperation.operation_type == OperationType.DEPOSIT.value,
+            WalletOperation.amount,
+        ),
+        else_=-WalletOperation.amount,
+    )
+
+
+def ledger_balances() -> Select:
+    """
+    Builds a select of wallet UUIDs and their ledger balances.
+
+    The balance is the latest snapshot (or the opening balance)
+    plus the tail of entries written after it.
+    The caller adds the filter on 'Wallet.uuid'.
+    :return: select statement with columns 'uuid' and 'balance'.
+    """
+    tail = (
+        select(func.coalesce(func.sum(signed_amount()), 0))
+        .where(
+            WalletOperation.wallet_uuid == Wallet.uuid,
+            WalletOperation.id > func.coalesce(WalletSnapshot.operation_id, 0),
+        )
+        .scalar_subquery()
+    )
+    balance = func.coalesce(WalletSnapshot.balance, Wallet.balance) + tail
+    return select(Wallet.uuid, balance.label("balance")).outerjoin(
+        WalletSnapshot, WalletSnapshot.wallet_uuid == Wallet.uuid
+    )
+
+
+async def read_balances(
+        session: AsyncSession, wallet_uuids: set[UUID]
+) -> dict[UUID, Decimal]:
+    """
+    Reads ledger balances of several wallets.
+    :param session: asynchronous database session.
+    :param wallet_uuids: UUIDs of the wallets.
+    :return: mapping of wallet UUID to its balance.
+    """
+    result = await session.execute(
+        ledger_balances().where(Wallet.uuid.in_(wallet_uuids))
+    )
+    return {row.uuid: row.balance for row in result}
+
+
+async def record_operations(
+        session: AsyncSession, entries: list[dict]
+) -> None:
+    """
+    Appends entries to the ledger.
+    :param session: asynchronous database session.
+    :param entries: rows with keys 'wallet_uuid', 'operation_type',
+    'amount' and 'balance'.
+    :return: None.
+    """
+    if entries:
+        await session.execute(insert(WalletOperation), entries)
+
+
+async def deposit(
+        session: AsyncSession, wallet_uuid: UUID, amount: Decimal
+) -> SWalletCreated:
+    """
+    Appends a deposit to the ledger without updating the wallet row.
+
+    The entry is inserted from a 'FOR KEY SHARE' select of the wallet,
+    so a missing wallet is detected by the same statement,
+    which also returns the balance including the new entry.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param amount: positive amount of the deposit.
+    :return: wallet in format 'SWalletCreated'.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises BalanceOverflowError: if the balance exceeds the largest one,
+    the entry is rolled back with the transaction then.
+    """
+    source = (
+        select(
+            Wallet.uuid,
+            literal(OperationType.DEPOSIT.value, String),
+            literal(amount, MinorUnits),
+        )
+        .where(Wallet.uuid == wallet_uuid)
+        .with_for_update(read=True, key_share=True)
+    )
+    recorded = (
+        insert(WalletOperation)
+        .from_select(["wallet_uuid", "operation_type", "amount"], source)
+        .returning(WalletOperation.wallet_uuid)
+        .cte("recorded")
+    )
+    result = await session.execute(
+        ledger_balances().where(
+            Wallet.uuid.in_(select(recorded.c.wallet_uuid))
+        )
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise WalletNotFoundError(wallet_uuid)
+    balance = row.balance + amount
+    if out_of_range(balance):
+        raise BalanceOverflowError(wallet_uuid)
+    return SWalletCreated.model_construct(uuid=wallet_uuid, balance=balance)
+
+
+async def withdraw(
+        session: AsyncSession, wallet_uuid: UUID, amount: Decimal
+) -> SWalletCreated:
+    """
+    Appends a withdrawal to the ledger.
+
+    Withdrawals of one wallet are serialized by a 'FOR NO KEY UPDATE'
+    lock, which does not block concurrent deposits. The balance is read
+    by a separate statement after the lock is taken, so it includes
+    every withdrawal committed before.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param amount: positive amount of the withdrawal.
+    :return: wallet in format 'SWalletCreated'.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the balance is too low.
+    """
+    locked = await session.execute(
+        select(Wallet.uuid)
+        .where(Wallet.uuid == wallet_uuid)
+        .with_for_update(key_share=True)
+    )
+    if locked.scalar_one_or_none() is None:
+        raise WalletNotFoundError(wallet_uuid)
+
+    current = (
+        ledger_balances().where(Wallet.uuid == wallet_uuid).cte("current")
+    )
+    recorded = (
+        insert(WalletOperation)
+        .from_select(
+            ["wallet_uuid", "operation_type", "amount"],
+            select(
+                current.c.uuid,
+                literal(OperationType.WITHDRAW.value, String),
+                literal(amount, MinorUnits),
+            ).where(current.c.balance >= amount),
+        )
+        .returning(WalletOperation.id)
+        .cte("recorded")
+    )
+    result = await session.execute(
+        select(
+            current.c.balance,
+            select(recorded.c.id).scalar_subquery().label("recorded"),
+        )
+    )
+    row = result.one()
+    if row.recorded is None:
+        raise InsufficientFundsError(wallet_uuid)
+    return SWalletCreated.model_construct(
+        uuid=wallet_uuid, balance=row.balance - amount
+    )
+
+
+def encode_cursor(created_at: datetime, operation_id: int) -> str:
+    """
+    Encodes the position of a ledger entry as an opaque cursor.
+    :param created_at: time of the entry.
+    :param operation_id: identifier of the entry.
+    :return: cursor string.
+    """
+    position = f"{created_at.isoformat()},{operation_id}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decodes a cursor created by 'encode_cursor'.
+    :param cursor: cursor string.
+    :return: time and identifier of the entry.
+    :raises ValueError: if the cursor is malformed.
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, operation_id = position.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(operation_id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def history_statement(
+        wallet_uuid: UUID, cursor: Optional[str] = None
+) -> Select:
+    """
+    Builds a select of ledger entries of the wallet, newest first.
+
+    Entries are paginated by keyset on ('created_at', 'id'),
+    so a page costs the same at any depth of the history.
+    Only the columns of the entry are selected, no ORM objects.
+    :param wallet_uuid: UUID of the wallet.
+    :param cursor: position after which the entries start.
+    :return: select statement.
+    :raises ValueError: if the cursor is malformed.
+    """
+    statement = (
+        select(
+            WalletOperation.id,
+            WalletOperation.operation_type,
+            WalletOperation.amount,
+            WalletOperation.balance,
+            WalletOperation.created_at,
+        )
+        .where(WalletOperation.wallet_uuid == wallet_uuid)
+        .order_by(
+            WalletOperation.created_at.desc(), WalletOperation.id.desc()
+        )
+    )
+    if cursor is not None:
+        statement = statement.where(
+            tuple_(WalletOperation.created_at, WalletOperation.id)
+            < tuple_(*decode_cursor(cursor))
+        )
+    return statement
+
+
+async def stream_history(
+        session_factory: async_sessionmaker, statement: Select
+) -> AsyncIterator[bytes]:
+    """
+    Streams ledger entries as NDJSON lines.
+
+    Rows are fetched from a server-side cursor in chunks
+    of 'STREAM_CHUNK_SIZE', so memory use does not depend
+    on the length of the history.
+    :param session_factory: session factory.
+    :param statement: statement built by 'history_statement'.
+    :return: asynchronous iterator of NDJSON lines.
+    """
+    async with session_factory() as session:
+        result = await session.stream(
+            statement.execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        async for row in result:
+            entry = SWalletOperationEntry.model_validate(row)
+            yield entry.model_dump_json().encode() + b"\n"
+
+
+async def compact_wallet(session: AsyncSession, wallet_uuid: UUID) -> bool:
+    """
+    Rolls the ledger tail of a wallet into its snapshot.
+
+    The 'FOR UPDATE' lock waits for in-flight entries of the wallet,
+    so every entry up to the new snapshot is committed.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :return: whether a new snapshot was written.
+    """
+    locked = await session.execute(
+        select(Wallet.uuid).where(Wallet.uuid == wallet_uuid).with_for_update()
+    )
+    if locked.scalar_one_or_none() is None:
+        return False
+
+    last_id = (
+        select(func.max(WalletOperation.id))
+        .where(WalletOperation.wallet_uuid == Wallet.uuid)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        ledger_balances()
+        .add_columns(
+            last_id.label("operation_id"),
+            WalletSnapshot.operation_id.label("snapshot_id"),
+        )
+        .where(Wallet.uuid == wallet_uuid)
+    )
+    row = result.one()
+    if row.operation_id is None or row.operation_id == row.snapshot_id:
+        return False
+
+    snapshot = pg_insert(WalletSnapshot).values(
+        wallet_uuid=wallet_uuid,
+        operation_id=row.operation_id,
+        balance=row.balance,
+    )
+    await session.execute(
+        snapshot.on_conflict_do_update(
+            index_elements=[WalletSnapshot.wallet_uuid],
+            set_={
+                "operation_id": snapshot.excluded.operation_id,
+                "balance": snapshot.excluded.balance,
+                "created_at": func.now(),
+            },
+        )
+    )
+    return True
+
+
+async def find_compactable(
+        session: AsyncSession, after_id: int, limit: int
+) -> list[UUID]:
+    """
+    Finds wallets whose ledger tail reached the snapshot interval.
+
+    Only wallets with entries after 'after_id' are considered,
+    so a pass reads the recent part of the ledger and not all of it.
+    :param session: asynchronous database session.
+    :param after_id: last entry seen by the previous pass.
+    :param limit: maximum number of wallets.
+    :return: UUIDs of the wallets to compact.
+    """
+    recent = (
+        select(WalletOperation.wallet_uuid)
+        .where(WalletOperation.id > after_id)
+        .distinct()
+    )
+    result = await session.execute(
+        select(WalletOperation.wallet_uuid)
+        .outerjoin(
+            WalletSnapshot,
+            WalletSnapshot.wallet_uuid == WalletOperation.wallet_uuid
+        )
+        .where(
+            WalletOperation.wallet_uuid.in_(recent),
+            WalletOperation.id > func.coalesce(WalletSnapshot.operation_id, 0),
+        )
+        .group_by(WalletOperation.wallet_uuid)
+        .having(func.count() >= settings.LEDGER_SNAPSHOT_INTERVAL)
+        .limit(limit)
+    )
+    return list(result.scalars())
+
+
+async def compact_once(
+        session_factory: async_sessionmaker, after_id: int = 0
+) -> tuple[int, int]:
+    """
+    Performs one pass of the compactor.
+
+    Each wallet is compacted in its own short transaction.
+    :param session_factory: session factory.
+    :param after_id: last entry seen by the previous pass.
+    :return: number of compacted wallets and the entry
+    to start the next pass from.
+    """
+    async with session_factory() as session:
+        last_id = await session.scalar(select(func.max(WalletOperation.id)))
+        wallet_uuids = await find_compactable(
+            session, after_id, settings.LEDGER_COMPACT_BATCH
+        )
+    compacted = 0
+    for wallet_uuid in wallet_uuids:
+        async with session_factory() as session:
+            async with session.begin():
+                compacted += await compact_wallet(session, wallet_uuid)
+    if len(wallet_uuids) == settings.LEDGER_COMPACT_BATCH:
+        return compacted, after_id
+    return compacted, last_id or after_id
+
+
+async def run_compactor(
+        session_factory: async_sessionmaker,
+        period: Optional[float] = None
+) -> None:
+    """
+    Runs the compactor until the task is cancelled.
+
+    A wallet whose entries were committed out of order with a pass
+    is picked up again with its next entry.
+    :param session_factory: session factory.
+    :param period: pause in seconds between passes.
+    :return: None.
+    """
+    period = settings.LEDGER_COMPACT_PERIOD if period is None else period
+    after_id = 0
+    while True:
+        try:
+            compacted, after_id = await compact_once(session_factory, after_id)
+            if compacted:
+                logger.info("Compacted ledger of %s wallets", compacted)
+        except Exception as e:
+            logger.error("Error in ledger compactor: %s", e)
+        await asyncio.sleep(period)
+
+
+def configured_storage() -> str:
+    """
+    Returns the mode of the stored balances expected by the settings.
+    :return: 'ledger' in ledger mode, 'row' otherwise.
+    """
+    return LEDGER_STORAGE if settings.LEDGER_MODE else ROW_STORAGE
+
+
+async def check_storage(session_factory: async_sessionmaker) -> None:
+    """
+    Checks that the balances are stored in the configured mode.
+    :param session_factory: session factory.
+    :return: None.
+    :raises StorageModeError: if they are stored in the other mode.
+    """
+    async with session_factory() as session:
+        mode = await session.scalar(select(BalanceStorage.mode))
+    expected = configured_storage()
+    if mode != expected:
+        logger.error(
+            "Balances are stored in %s mode, convert them with "
+            "'python -m wallet_app.ledger convert %s'", mode, expected
+        )
+        raise StorageModeError(mode)
+
+
+async def to_ledger_storage(session: AsyncSession) -> None:
+    """
+    Moves the balances of the wallet rows to ledger snapshots.
+
+    Slots of striped wallets are folded into the wallet rows, then
+    every wallet with entries gets a snapshot of its row balance
+    at its last entry, which the history written in row mode
+    already adds up to.
+    :param session: asynchronous database session.
+    :return: None.
+    """
+    slots = (
+        select(
+            WalletSlot.wallet_uuid,
+            func.sum(WalletSlot.balance).label("balance"),
+        )
+        .group_by(WalletSlot.wallet_uuid)
+        .subquery()
+    )
+    await session.execute(
+        update(Wallet)
+        .where(Wallet.uuid == slots.c.wallet_uuid)
+        .values(balance=Wallet.balance + slots.c.balance)
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(delete(WalletSlot))
+    await session.execute(
+        update(Wallet)
+        .where(Wallet.stripes > 0)
+        .values(stripes=0, version=Wallet.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    last = (
+        select(
+            WalletOperation.wallet_uuid,
+            func.max(WalletOperation.id).label("operation_id"),
+        )
+        .group_by(WalletOperation.wallet_uuid)
+        .subquery()
+    )
+    snapshot = pg_insert(WalletSnapshot).from_select(
+        ["wallet_uuid", "operation_id", "balance"],
+        select(Wallet.uuid, last.c.operation_id, Wallet.balance)
+        .join(last, last.c.wallet_uuid == Wallet.uuid),
+    )
+    await session.execute(
+        snapshot.on_conflict_do_update(
+            index_elements=[WalletSnapshot.wallet_uuid],
+            set_={
+                "operation_id": snapshot.excluded.operation_id,
+                "balance": snapshot.excluded.balance,
+                "created_at": func.now(),
+            },
+        )
+    )
+
+
+async def to_row_storage(session: AsyncSession) -> None:
+    """
+    Writes the ledger balances to the wallet rows.
+
+    The snapshots are deleted, a later conversion to the ledger
+    takes new ones.
+    :param session: asynchronous database session.
+    :return: None.
+    """
+    balances = ledger_balances().subquery()
+    await session.execute(
+        update(Wallet)
+        .where(Wallet.uuid == balances.c.uuid)
+        .values(balance=balances.c.balance, version=Wallet.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(delete(WalletSnapshot))
+
+
+async def mark_storage(session: AsyncSession, mode: str) -> None:
+    """
+    Records the mode of the stored balances without converting them.
+    :param session: asynchronous database session.
+    :param mode: 'row' or 'ledger'.
+    :return: None.
+    """
+    await session.execute(update(BalanceStorage).values(mode=mode))
+
+
+async def convert_storage(
+        session_factory: async_sessionmaker, mode: str
+) -> bool:
+    """
+    Converts the stored balances to the given mode in one transaction.
+
+    The wallets table is locked against writes, so operations
+    of a running app wait for the conversion, but the app must be
+    restarted in the new mode before it serves requests again.
+    :param session_factory: session factory.
+    :param mode: 'row' or 'ledger'.
+    :return: whether the balances were converted, False if they
+    are already stored in the mode.
+    """
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(text("LOCK TABLE wallets IN EXCLUSIVE MODE"))
+            current = await session.scalar(
+                select(BalanceStorage.mode).with_for_update()
+            )
+            if current == mode:
+                return False
+            if mode == LEDGER_STORAGE:
+                await to_ledger_storage(session)
+            else:
+                await to_row_storage(session)
+            await mark_storage(session, mode)
+    return True
+
+
+async def main(args: argparse.Namespace) -> int:
+    """
+    Runs the command line conversion.
+    :param args: parsed command line arguments.
+    :return: exit code.
+    """
+    session_factory = get_sessionmaker()
+    try:
+        if args.command == "mark":
+            async with session_factory() as session:
+                async with session.begin():
+                    await mark_storage(session, args.mode)
+            logging.info("Recorded balances stored in %s mode", args.mode)
+        elif await convert_storage(session_factory, args.mode):
+            logging.info("Converted balances to %s mode", args.mode)
+        else:
+            logging.info("Balances are already in %s mode", args.mode)
+    finally:
+        await dispose_engine()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "command", choices=["convert", "mark"],
+        help="'mark' records the mode of balances already stored in it",
+    )
+    parser.add_argument("mode", choices=[ROW_STORAGE, LEDGER_STORAGE])
+    sys.exit(asyncio.run(main(parser.parse_args())))
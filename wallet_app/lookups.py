@@ -0,0 +1,267 @@
+"""
+This module answers lookups of missing wallets without the database.
+
+UUIDs found missing are kept in a per-worker negative cache for
+'NEGATIVE_CACHE_TTL' seconds, so clients repeating requests for
+random or deleted wallets get their 404 from memory. A wallet imported
+with such a UUID on another worker is seen after at most the TTL.
+With 'WALLET_FILTER', a Bloom filter of all wallet UUIDs is built
+at startup and extended by every wallet this worker creates, so UUIDs
+not in it are rejected at once. Wallets created by other workers,
+hosts or command line imports are not in the filter, and this
+worker cannot detect them, so the filter is only built when
+'WALLET_FILTER_SINGLE_WRITER' asserts that this worker is the only
+writer of wallets, and never with several workers.
+Deleted wallets stay in the filter and are only checked
+in the database
+"""
+
+import hashlib
+import logging
+import math
+import struct
+import time
+from collections import OrderedDict
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from wallet_app.config import settings
+from wallet_app.metrics import Counters, Gauges, register
+from wallet_app.models import Wallet
+
+logger = logging.getLogger(__name__)
+
+# Number of UUIDs read from the database at once by the filter build
+BUILD_BATCH_SIZE = 10000
+# Bit positions taken from one 64-byte hash of a UUID
+MAX_HASHES = 16
+# Bits addressable by a 32-bit word of that hash
+MAX_BITS = 2 ** 32
+
+
+class NegativeCache:
+    """
+    UUIDs of missing wallets with per-entry TTL and LRU eviction.
+
+    Least recently added entries are evicted when 'max_size'
+    is reached, expired entries are dropped on access.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[UUID, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, wallet_uuid: UUID) -> bool:
+        expires_at = self._entries.get(wallet_uuid)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._entries[wallet_uuid]
+            return False
+        return True
+
+    def add(self, wallet_uuid: UUID) -> None:
+        """
+        Remembers that the wallet is missing.
+        :param wallet_uuid: UUID of the wallet.
+        :return: None.
+        """
+        self._entries[wallet_uuid] = time.monotonic() + self.ttl
+        self._entries.move_to_end(wallet_uuid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, *wallet_uuids: UUID) -> None:
+        """
+        Forgets the wallets.
+        :param wallet_uuids: UUIDs of the wallets.
+        :return: None.
+        """
+        for wallet_uuid in wallet_uuids:
+            self._entries.pop(wallet_uuid, None)
+
+
+class BloomFilter:
+    """
+    Bloom filter of UUIDs.
+
+    Sized for 'capacity' items at the false positive rate 'error_rate',
+    more items raise the rate. A UUID not in the filter was never added,
+    a UUID in it may not have been. The bit positions are 32-bit words
+    of one hash of the UUID, as the UUIDs of imported dumps need not be
+    random, so the filter holds at most 2 ** 32 bits and 16 hashes.
+    Larger filters are cut down to that size at a higher error rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = min(MAX_BITS, max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )))
+        self.hashes = min(
+            MAX_HASHES, max(1, round(self.size / capacity * math.log(2)))
+        )
+        self.items = 0
+        self._words = struct.Struct(f"<{self.hashes}I")
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __contains__(self, wallet_uuid: UUID) -> bool:
+        bits = self._bits
+        for position in self._positions(wallet_uuid):
+            if not bits[position >> 3] & 1 << (position & 7):
+                return False
+        return True
+
+    def add(self, wallet_uuid: UUID) -> None:
+        """
+        Adds the UUID.
+        :param wallet_uuid: UUID of the wallet.
+        :return: None.
+        """
+        bits = self._bits
+        for position in self._positions(wallet_uuid):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.items += 1
+
+    def error_rate(self) -> float:
+        """
+        Estimates the false positive rate at the current number of items.
+        :return: probability that a UUID never added is in the filter.
+        """
+        return (1 - math.exp(-self.hashes * self.items / self.size)) ** (
+            self.hashes
+        )
+
+    def _positions(self, wallet_uuid: UUID) -> list[int]:
+        """
+        Returns the bit positions of the UUID.
+        :param wallet_uuid: UUID of the wallet.
+        :return: 'hashes' positions below 'size'.
+        """
+        size = self.size
+        digest = hashlib.blake2b(
+            wallet_uuid.bytes, digest_size=self._words.size
+        ).digest()
+        return [word % size for word in self._words.unpack(digest)]
+
+
+class WalletLookups:
+    """
+    Knows which wallets are missing without asking the database.
+
+    Handlers check 'is_missing' before reading a wallet, report
+    wallets the database did not find with 'add_missing' and created
+    wallets with 'add_existing'.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.missing = NegativeCache(max_size, ttl)
+        self.filter: Optional[BloomFilter] = None
+        self._building: Optional[BloomFilter] = None
+        self.stats = Counters("cached_misses", "negative_hits", "rejected")
+
+    def is_missing(self, wallet_uuid: UUID) -> bool:
+        """
+        Checks if the wallet is known to be missing.
+        :param wallet_uuid: UUID of the wallet.
+        :return: True if the wallet does not exist, False if it may.
+        """
+        if self.filter is not None and wallet_uuid not in self.filter:
+            self.stats.inc("rejected")
+            return True
+        if settings.NEGATIVE_CACHE and wallet_uuid in self.missing:
+            self.stats.inc("negative_hits")
+            return True
+        return False
+
+    def add_missing(self, wallet_uuid: UUID) -> None:
+        """
+        Remembers a wallet the database did not find or which is deleted.
+        :param wallet_uuid: UUID of the wallet.
+        :return: None.
+        """
+        if settings.NEGATIVE_CACHE:
+            self.missing.add(wallet_uuid)
+            self.stats.inc("cached_misses")
+
+    def add_existing(self, *wallet_uuids: UUID) -> None:
+        """
+        Adds created or imported wallets.
+
+        Called when the wallets are written, a wallet added
+        before its transaction commits is only checked in the database.
+        :param wallet_uuids: UUIDs of the wallets.
+        :return: None.
+        """
+        self.missing.discard(*wallet_uuids)
+        for bloom in (self.filter, self._building):
+            if bloom is not None:
+                for wallet_uuid in wallet_uuids:
+                    bloom.add(wallet_uuid)
+
+    async def build_filter(self, session_factory: async_sessionmaker) -> None:
+        """
+        Builds the Bloom filter from the UUIDs of all wallets.
+
+        The UUIDs are streamed in batches, wallets created meanwhile
+        are added to the new filter as well. The filter is not built
+        unless the worker is asserted to be the only writer of wallets,
+        see the module description.
+        :param session_factory: session factory.
+        :return: None.
+        """
+        if not settings.WALLET_FILTER_SINGLE_WRITER:
+            logger.warning(
+                "Wallet filter is disabled, wallets created by other "
+                "writers would be rejected, set "
+                "WALLET_FILTER_SINGLE_WRITER if this worker is the only one"
+            )
+            return
+        if settings.WEB_CONCURRENCY > 1:
+            logger.warning(
+                "Wallet filter is disabled with %s workers",
+                settings.WEB_CONCURRENCY
+            )
+            return
+        self._building = BloomFilter(
+            settings.WALLET_FILTER_CAPACITY, settings.WALLET_FILTER_ERROR_RATE
+        )
+        try:
+            async with session_factory() as session:
+                result = await session.stream_scalars(
+                    select(Wallet.uuid).execution_options(
+                        yield_per=BUILD_BATCH_SIZE
+                    )
+                )
+                async for wallet_uuids in result.partitions():
+                    for wallet_uuid in wallet_uuids:
+                        self._building.add(wallet_uuid)
+            self.filter = self._building
+        finally:
+            self._building = None
+        if self.filter.items > settings.WALLET_FILTER_CAPACITY:
+            logger.warning(
+                "Wallet filter holds %s wallets over its capacity of %s",
+                self.filter.items, settings.WALLET_FILTER_CAPACITY
+            )
+
+
+wallet_lookups = WalletLookups(
+    settings.NEGATIVE_CACHE_MAX_SIZE, settings.NEGATIVE_CACHE_TTL
+)
+register("wallet_lookups", wallet_lookups.stats)
+register("wallet_filter", Gauges(
+    items=lambda: (
+        0 if wallet_lookups.filter is None else wallet_lookups.filter.items
+    ),
+    error_rate=lambda: (
+        0 if wallet_lookups.filter is None
+        else wallet_lookups.filter.error_rate()
+    ),
+))
@@ -3,13 +3,33 @@ This module creates the FastAPI app with lifecycle management
 and includes the router
 """
 
-from contextlib import asynccontextmanager
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
-from wallet_app.database import engine
+from wallet_app import fastpath
+from wallet_app.config import settings
+from wallet_app.database import (
+    POOL_CAPACITY,
+    check_pool_budget,
+    dispose_engine,
+    get_engine,
+    get_sessionmaker,
+    prewarm_pool,
+)
+from wallet_app.events import balance_events
+from wallet_app.holds import run_sweeper
+from wallet_app.idempotency import run_purger
 from wallet_app.initdb import create_db
-from wallet_app.router import router
+from wallet_app.ledger import check_storage, run_compactor
+from wallet_app.lookups import wallet_lookups
+from wallet_app.metrics import MetricsMiddleware
+from wallet_app.router import metrics_router, router
+from wallet_app.startup import StartupProfile
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -17,14 +37,66 @@ async def lifespan(app: FastAPI) -> None:
     """
     Lifespan context manager for the FastAPI app.
 
-    Calls 'create_db' function to ensure the database exists,
-    then yields control to the app. On shutdown,
-    disposes the global database engine.
+    Calls 'create_db' function to ensure the database exists unless
+    'CREATE_DB' is off, creates the database engine, checks that
+    the balances are stored in the configured mode, see
+    'wallet_app.ledger', and that the connection pools fit
+    on the server, opens 'DB_POOL_PREWARM' connections of the pool
+    and the asyncpg pool of the fast path if it is enabled, builds
+    the Bloom filter of wallet UUIDs if it is enabled, starts the
+    idempotency key purger, the sweeper of expired holds and, in ledger
+    mode, the ledger compactor, then yields control to the app, which
+    serves requests from then on. The startup steps are timed
+    in 'app.state.startup_profile'. On shutdown, stops the background
+    tasks, closes the LISTEN connection of the
+    balance events and the asyncpg pool and disposes the global
+    database engine.
     """
-    await create_db()
+    profile = StartupProfile()
+    app.state.startup_profile = profile
+    if settings.CREATE_DB:
+        with profile.step("create_db"):
+            await create_db()
+    with profile.step("engine"):
+        engine = get_engine()
+        async_session = get_sessionmaker()
+    with profile.step("storage_check"):
+        await check_storage(async_session)
+    with profile.step("pool_budget"):
+        await check_pool_budget(
+            engine, POOL_CAPACITY * (2 if fastpath.enabled() else 1)
+        )
+    with profile.step("pool_prewarm"):
+        await prewarm_pool(engine, settings.DB_POOL_PREWARM)
+    if fastpath.enabled():
+        with profile.step("fastpath_pool"):
+            await fastpath.open_pool()
+    if settings.WALLET_FILTER:
+        with profile.step("wallet_filter"):
+            await wallet_lookups.build_filter(async_session)
+    tasks = [
+        asyncio.create_task(run_purger(async_session)),
+        asyncio.create_task(run_sweeper(async_session)),
+    ]
+    if settings.LEDGER_MODE:
+        tasks.append(asyncio.create_task(run_compactor(async_session)))
+    if settings.STARTUP_PROFILE:
+        logger.info(
+            "Startup took %.1f ms:\n%s",
+            profile.total() * 1000, profile.report()
+        )
     yield
-    await engine.dispose()
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await balance_events.close()
+    await fastpath.close_pool()
+    await dispose_engine()
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
+app.include_router(metrics_router)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,331 @@
+"""
+This module provides counters, gauges and histograms of the application
+subsystems.
+
+Each subsystem registers a named group of counters, gauges or
+histograms, all groups are returned together by the stats endpoint
+and rendered in the Prometheus text exposition format by the metrics
+endpoint. 'MetricsMiddleware' times every request by route and splits
+the time into database queries, see 'wallet_app.database', and Python
+"""
+
+import re
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Optional, Union
+
+EXPOSITION_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "wallet"
+# Upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class Counters:
+    """
+    Group of monotonically increasing counters of one subsystem.
+
+    Counters are plain integers updated from the event loop thread,
+    so incrementing them costs a dictionary update.
+    """
+
+    def __init__(self, *names: str) -> None:
+        self._values = dict.fromkeys(names, 0)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        """
+        Increments the counter.
+        :param name: counter name.
+        :param value: increment.
+        :return: None.
+        """
+        self._values[name] += value
+
+    def get(self, name: str) -> int:
+        """
+        Returns the value of the counter.
+        :param name: counter name.
+        :return: counter value.
+        """
+        return self._values[name]
+
+    def snapshot(self) -> dict[str, int]:
+        """
+        Returns the values of all counters of the group.
+        :return: mapping of counter name to its value.
+        """
+        return dict(self._values)
+
+    def expose(self, group: str) -> list[str]:
+        """
+        Renders the counters in the text exposition format.
+        :param group: name of the subsystem.
+        :return: lines of the exposition.
+        """
+        lines = []
+        for name, value in self._values.items():
+            metric = metric_name(group, name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        return lines
+
+
+class Gauges:
+    """
+    Group of values of one subsystem read at snapshot time.
+
+    Each gauge is a function returning the current value,
+    so reading the state costs nothing until it is requested.
+    """
+
+    def __init__(self, **readers: Callable[[], float]) -> None:
+        self._readers = readers
+
+    def get(self, name: str) -> float:
+        """
+        Returns the current value of the gauge.
+        :param name: gauge name.
+        :return: gauge value.
+        """
+        return self._readers[name]()
+
+    def snapshot(self) -> dict[str, float]:
+        """
+        Returns the current values of all gauges of the group.
+        :return: mapping of gauge name to its value.
+        """
+        return {name: read() for name, read in self._readers.items()}
+
+    def expose(self, group: str) -> list[str]:
+        """
+        Renders the gauges in the text exposition format.
+        :param group: name of the subsystem.
+        :return: lines of the exposition.
+        """
+        lines = []
+        for name, value in self.snapshot().items():
+            metric = metric_name(group, name)
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return lines
+
+
+class Histograms:
+    """
+    Group of histograms of one subsystem with the same labels.
+
+    A series is kept per histogram and label values as a list
+    of bucket counts followed by the sum of the observed values,
+    so an observation costs a bisection and two list updates.
+    Buckets are made cumulative when the histograms are rendered.
+    """
+
+    def __init__(
+            self,
+            *names: str,
+            labels: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        self.names = names
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple[str, tuple[str, ...]], list[float]] = {}
+
+    def observe(self, name: str, value: float, *labels: str) -> None:
+        """
+        Records a value in the histogram.
+        :param name: histogram name.
+        :param value: observed value.
+        :param labels: values of the labels of the group, in order.
+        :return: None.
+        """
+        series = self._series.get((name, labels))
+        if series is None:
+            series = self._series[(name, labels)] = [0] * (
+                len(self.buckets) + 2
+            )
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, name: str) -> int:
+        """
+        Returns the number of values recorded in the histogram.
+        :param name: histogram name.
+        :return: number of values over all label values.
+        """
+        return sum(
+            sum(series[:-1])
+            for (series_name, _), series in self._series.items()
+            if series_name == name
+        )
+
+    def snapshot(self) -> dict[str, float]:
+        """
+        Returns the count and sum of every histogram of the group.
+        :return: mapping of '<name>_count' and '<name>_sum' to the values
+        over all label values.
+        """
+        values = {}
+        for name in self.names:
+            values[f"{name}_count"] = 0
+            values[f"{name}_sum"] = 0.0
+        for (name, _), series in self._series.items():
+            values[f"{name}_count"] += sum(series[:-1])
+            values[f"{name}_sum"] += series[-1]
+        return values
+
+    def expose(self, group: str) -> list[str]:
+        """
+        Renders the histograms in the text exposition format.
+        :param group: name of the subsystem.
+        :return: lines of the exposition.
+        """
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        lines = []
+        for name in self.names:
+            metric = metric_name(group, name)
+            lines.append(f"# TYPE {metric} histogram")
+            for (series_name, values), series in self._series.items():
+                if series_name != name:
+                    continue
+                labels = [
+                    f'{label}="{escape(value)}"'
+                    for label, value in zip(self.labels, values)
+                ]
+                total = 0
+                for bound, count in zip(bounds, series):
+                    total += count
+                    bucket_labels = ",".join(labels + [f'le="{bound}"'])
+                    lines.append(f"{metric}_bucket{{{bucket_labels}}} {total}")
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {series[-1]}")
+                lines.append(f"{metric}_count{suffix} {total}")
+        return lines
+
+
+Group = Union[Counters, Gauges, Histograms]
+
+registry: dict[str, Group] = {}
+
+
+def register(group: str, values: Group) -> Group:
+    """
+    Registers a group of counters.
+    :param group: name of the subsystem.
+    :param values: group of counters, gauges or histograms.
+    :return: the registered group.
+    """
+    registry[group] = values
+    return values
+
+
+def snapshot() -> dict[str, dict[str, float]]:
+    """
+    Returns the values of all registered groups.
+    :return: mapping of group name to its values.
+    """
+    return {group: values.snapshot() for group, values in registry.items()}
+
+
+def metric_name(group: str, name: str) -> str:
+    """
+    Returns the exposed name of a metric.
+    :param group: name of the subsystem.
+    :param name: name of the metric in the group.
+    :return: name valid in the exposition format.
+    """
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{PREFIX}_{group}_{name}")
+
+
+def escape(value: str) -> str:
+    """
+    Escapes a label value of the exposition format.
+    :param value: label value.
+    :return: escaped value.
+    """
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def exposition() -> bytes:
+    """
+    Renders all registered groups in the text exposition format.
+    :return: exposition.
+    """
+    lines = []
+    for group, values in registry.items():
+        lines += values.expose(group)
+    return ("\n".join(lines) + "\n").encode()
+
+
+# Seconds spent in database queries by the current request,
+# None outside requests
+query_time: ContextVar[Optional[list[float]]] = ContextVar(
+    "query_time", default=None
+)
+in_flight = 0
+http = register("http", Histograms(
+    "request_seconds", "db_seconds", "python_seconds",
+    labels=("method", "route", "status"),
+))
+register("http_requests", Gauges(in_flight=lambda: in_flight))
+
+
+def add_query_time(seconds: float) -> None:
+    """
+    Adds the time of a database query to the current request.
+    :param seconds: duration of the query.
+    :return: None.
+    """
+    spent = query_time.get()
+    if spent is not None:
+        spent[0] += seconds
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing requests by route.
+
+    Records the duration of every HTTP request, until its response
+    is sent, with the part spent in database queries and the rest
+    as Python time, labeled by method, route template and status,
+    and counts the requests in flight.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global in_flight
+        status = 500
+
+        async def send_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        spent = [0.0]
+        token = query_time.set(spent)
+        in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight -= 1
+            query_time.reset(token)
+            route = scope.get("route")
+            labels = (
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            )
+            http.observe("request_seconds", elapsed, *labels)
+            http.observe("db_seconds", spent[0], *labels)
+            http.observe("python_seconds", elapsed - spent[0], *labels)
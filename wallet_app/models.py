@@ -1,12 +1,26 @@
 """This module describes the application models, which are ORM objects"""
 
 import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
 
-from sqlalchemy import Float
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy import (
+    BigInteger,
+    CheckConstraint,
+    DateTime,
+    ForeignKey,
+    Index,
+    SmallInteger,
+    String,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
 from wallet_app.database import Base
+from wallet_app.money import MinorUnits
 
 
 class Wallet(Base):
@@ -19,13 +33,209 @@ class Wallet(Base):
     Attributes:
         uuid (str): Unique identifier for the wallet account,
         generated by default.
-        balance (float): The amount of money in the wallet, defaults to 0.
+        balance (Decimal): The amount of money in the wallet, defaults to 0,
+        stored as minor units, see 'wallet_app.money'.
+        For a striped wallet, the part of the balance kept outside the slots.
+        stripes (int): Number of balance slots of a striped wallet,
+        0 if the wallet is not striped.
+        version (int): Counter incremented by every change of the row,
+        compared by optimistic updates.
     """
 
     __tablename__ = "wallets"
+    __table_args__ = (
+        Index(
+            "ix_wallets_striped", "uuid", postgresql_where=text("stripes > 0")
+        ),
+    )
     uuid: Mapped[str] = mapped_column(
         PG_UUID(as_uuid=True),
         primary_key=True,
         default=lambda: str(uuid.uuid4())
     )
-    balance: Mapped[float] = mapped_column(Float, default=0)
+    balance: Mapped[Decimal] = mapped_column(MinorUnits, default=0)
+    stripes: Mapped[int] = mapped_column(
+        SmallInteger, default=0, server_default="0", nullable=False
+    )
+    version: Mapped[int] = mapped_column(
+        BigInteger, default=0, server_default="0", nullable=False
+    )
+
+
+class WalletOperation(Base):
+    """
+    ORM model for an entry of the append-only wallet ledger.
+
+    Every applied operation is recorded as a new row,
+    rows are never updated.
+
+    Attributes:
+        id (int): Sequential identifier of the entry.
+        wallet_uuid (str): UUID of the wallet.
+        operation_type (str): 'DEPOSIT' or 'WITHDRAW'.
+        amount (Decimal): Positive amount of the operation.
+        balance (Decimal): Wallet balance after the operation,
+        empty if it was not computed when the entry was written.
+        created_at (datetime): Time the entry was written.
+    """
+
+    __tablename__ = "wallet_operations"
+    __table_args__ = (
+        Index("ix_wallet_operations_wallet_uuid_id", "wallet_uuid", "id"),
+        Index(
+            "ix_wallet_operations_wallet_uuid_created_at_id",
+            "wallet_uuid",
+            "created_at",
+            "id",
+        ),
+    )
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    wallet_uuid: Mapped[str] = mapped_column(
+        PG_UUID(as_uuid=True),
+        ForeignKey("wallets.uuid", ondelete="CASCADE"),
+        nullable=False
+    )
+    operation_type: Mapped[str] = mapped_column(String(16), nullable=False)
+    amount: Mapped[Decimal] = mapped_column(MinorUnits, nullable=False)
+    balance: Mapped[Optional[Decimal]] = mapped_column(
+        MinorUnits, nullable=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class WalletSnapshot(Base):
+    """
+    ORM model for the latest balance snapshot of a wallet.
+
+    The balance includes every ledger entry of the wallet
+    up to and including 'operation_id'.
+
+    Attributes:
+        wallet_uuid (str): UUID of the wallet.
+        operation_id (int): Last ledger entry included in the snapshot.
+        balance (Decimal): Wallet balance at that entry.
+        created_at (datetime): Time the snapshot was taken.
+    """
+
+    __tablename__ = "wallet_snapshots"
+    wallet_uuid: Mapped[str] = mapped_column(
+        PG_UUID(as_uuid=True),
+        ForeignKey("wallets.uuid", ondelete="CASCADE"),
+        primary_key=True
+    )
+    operation_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    balance: Mapped[Decimal] = mapped_column(MinorUnits, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class WalletSlot(Base):
+    """
+    ORM model for a balance slot of a striped wallet.
+
+    The wallet balance is the sum of the wallet row balance
+    and the balances of all its slots.
+
+    Attributes:
+        wallet_uuid (str): UUID of the wallet.
+        slot (int): Number of the slot, from 0 to 'stripes' - 1.
+        balance (Decimal): Part of the wallet balance kept in the slot.
+    """
+
+    __tablename__ = "wallet_slots"
+    wallet_uuid: Mapped[str] = mapped_column(
+        PG_UUID(as_uuid=True),
+        ForeignKey("wallets.uuid", ondelete="CASCADE"),
+        primary_key=True
+    )
+    slot: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    balance: Mapped[Decimal] = mapped_column(
+        MinorUnits, default=0, nullable=False
+    )
+
+
+class WalletHold(Base):
+    """
+    ORM model for funds of a wallet reserved by a hold.
+
+    The amount is withdrawn from the wallet when the hold is created
+    and deposited back when it is released or expires.
+
+    Attributes:
+        id (str): Identifier of the hold.
+        wallet_uuid (str): UUID of the wallet.
+        amount (Decimal): Positive reserved amount.
+        status (str): 'ACTIVE', 'CAPTURED', 'RELEASED' or 'EXPIRED'.
+        created_at (datetime): Time the hold was created.
+        expires_at (datetime): Time after which an active hold
+        can no longer be captured and is released by the sweeper.
+    """
+
+    __tablename__ = "wallet_holds"
+    __table_args__ = (
+        Index("ix_wallet_holds_wallet_uuid", "wallet_uuid"),
+        Index(
+            "ix_wallet_holds_active_expires_at",
+            "expires_at",
+            postgresql_where=text("status = 'ACTIVE'"),
+        ),
+    )
+    id: Mapped[str] = mapped_column(PG_UUID(as_uuid=True), primary_key=True)
+    wallet_uuid: Mapped[str] = mapped_column(
+        PG_UUID(as_uuid=True),
+        ForeignKey("wallets.uuid", ondelete="CASCADE"),
+        nullable=False
+    )
+    amount: Mapped[Decimal] = mapped_column(MinorUnits, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+
+
+class IdempotencyKey(Base):
+    """
+    ORM model for a response stored under a client idempotency key.
+
+    Attributes:
+        key (str): Value of the 'Idempotency-Key' request header.
+        request_hash (str): Fingerprint of the request the key was used for.
+        response (dict): Stored response body.
+        created_at (datetime): Time the key was stored.
+        expires_at (datetime): Time after which the key can be reused.
+    """
+
+    __tablename__ = "idempotency_keys"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    response: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+
+
+class BalanceStorage(Base):
+    """
+    ORM model for the single row recording where balances are stored.
+
+    Attributes:
+        id (int): Always 1.
+        mode (str): 'row' if the wallet rows hold the balances or 'ledger'
+        if the snapshots and the ledger entries do, see 'wallet_app.ledger'.
+    """
+
+    __tablename__ = "balance_storage"
+    __table_args__ = (
+        CheckConstraint("id = 1", name="ck_balance_storage_single_row"),
+    )
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    mode: Mapped[str] = mapped_column(String(16), nullable=False)
@@ -0,0 +1,114 @@
+"""
+This module provides the fixed-point representation of money.
+
+Amounts are stored as BIGINT numbers of minor units, 'MONEY_SCALE'
+decimal digits below the major unit, e.g. cents for a scale of 2.
+In Python they are exact 'Decimal' values quantized to the scale,
+which the API accepts and returns as decimal strings. The column
+type 'MinorUnits' converts between the two, so balances are added
+and compared as integers by the database
+"""
+
+import operator
+from decimal import Decimal, InvalidOperation
+from typing import Annotated, Union
+
+from pydantic import AfterValidator
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+from wallet_app.config import settings
+
+MAX_MINOR_UNITS = 2 ** 63 - 1
+
+
+def to_decimal(value: Union[Decimal, int, float, str, bytes]) -> Decimal:
+    """
+    Converts an amount to a decimal quantized to 'MONEY_SCALE'.
+
+    Floats are converted by their shortest representation,
+    so 0.1 is exactly 0.1.
+    :param value: amount in major units.
+    :return: quantized amount.
+    :raises ValueError: if the value is not a finite number, has more
+    decimal places than the scale or does not fit in BIGINT minor units.
+    """
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    try:
+        amount = Decimal(repr(value) if isinstance(value, float) else value)
+    except (InvalidOperation, TypeError):
+        raise ValueError("Amount is not a number")
+    if not amount.is_finite():
+        raise ValueError("Amount is not a number")
+    if out_of_range(amount):
+        raise ValueError("Amount is out of range")
+    quantized = amount.quantize(Decimal(1).scaleb(-settings.MONEY_SCALE))
+    if quantized != amount:
+        raise ValueError(
+            f"Amount has more than {settings.MONEY_SCALE} decimal places"
+        )
+    return quantized
+
+
+def out_of_range(amount: Decimal) -> bool:
+    """
+    Checks whether an amount does not fit in BIGINT minor units.
+
+    Balances computed in Python are checked before they are bound,
+    as the binding would fail with 'ValueError'.
+    :param amount: amount in major units.
+    :return: True if the amount cannot be stored.
+    """
+    return abs(amount.scaleb(settings.MONEY_SCALE)) > MAX_MINOR_UNITS
+
+
+def to_minor(value: Union[Decimal, int, float, str]) -> int:
+    """
+    Converts an amount to minor units.
+    :param value: amount in major units.
+    :return: number of minor units.
+    :raises ValueError: if the amount is invalid, see 'to_decimal'.
+    """
+    return int(to_decimal(value).scaleb(settings.MONEY_SCALE))
+
+
+def from_minor(units: Union[int, Decimal]) -> Decimal:
+    """
+    Converts minor units to an amount.
+    :param units: number of minor units, sums of BIGINT columns
+    are NUMERIC and read as integral decimals.
+    :return: amount in major units quantized to 'MONEY_SCALE'.
+    """
+    return Decimal(int(units)).scaleb(-settings.MONEY_SCALE)
+
+
+class MinorUnits(TypeDecorator):
+    """
+    Column type of amounts stored as BIGINT minor units.
+
+    Binds and returns 'Decimal' amounts in major units.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator):
+        """Keeps the type of sums and differences of amounts."""
+
+        def _adapt_expression(self, op, other_comparator):
+            if op in (operator.add, operator.sub):
+                return op, self.type
+            return super()._adapt_expression(op, other_comparator)
+
+    def coerce_compared_value(self, op, value):
+        return self
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_minor(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_minor(value)
+
+
+Money = Annotated[Decimal, AfterValidator(to_decimal)]
@@ -0,0 +1,561 @@
+"""
+This module provides the wallet operation engine.
+
+Operations are applied with a single conditional
+'UPDATE ... RETURNING' statement instead of locking the row,
+changing it in Python and flushing it back.
+Every applied operation is also recorded in the ledger.
+In ledger mode operations are delegated to 'wallet_app.ledger',
+operations on striped wallets to 'wallet_app.striping',
+in optimistic mode to 'wallet_app.optimistic'
+"""
+
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Iterator, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    String,
+    and_,
+    case,
+    column,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wallet_app import ledger, optimistic, striping
+from wallet_app.config import settings
+from wallet_app.database import db_timings
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    InsufficientFundsError,
+    WalletNotFoundError,
+)
+from wallet_app.models import Wallet, WalletOperation
+from wallet_app.money import MinorUnits, out_of_range
+from wallet_app.schemas import (
+    BatchItemStatus,
+    OperationType,
+    SBatchItemResult,
+    SBatchOperationItem,
+    SBatchResult,
+    STransferResult,
+    SWalletCreated,
+    WalletField,
+)
+from wallet_app.transactions import NUMERIC_VALUE_OUT_OF_RANGE, sqlstate
+
+
+@contextmanager
+def balance_range(*wallet_uuids: UUID) -> Iterator[None]:
+    """
+    Turns a balance pushed out of the BIGINT range by a statement
+    into 'BalanceOverflowError', the transaction is aborted then.
+    :param wallet_uuids: UUIDs of the wallets written by the statements.
+    :return: None.
+    :raises BalanceOverflowError: on the SQLSTATE 22003.
+    """
+    try:
+        yield
+    except DBAPIError as error:
+        if sqlstate(error) == NUMERIC_VALUE_OUT_OF_RANGE:
+            raise BalanceOverflowError(*wallet_uuids) from error
+        raise
+
+
+def operation_statement(
+        wallet_uuid: UUID,
+        operation_type: OperationType,
+        amount: Decimal
+) -> Select:
+    """
+    Builds a statement that applies an operation in one round trip.
+
+    The balance is changed by a conditional update in a CTE
+    and the applied operation is recorded in the ledger by another one.
+    Striped wallets are not updated.
+    The outer select always returns exactly one row with columns
+    'stripes' (number of slots or NULL if the wallet does not exist)
+    and 'balance' (new balance or NULL if the update was not applied),
+    so a failed update can be classified without a second locking query.
+    :param wallet_uuid: UUID of the wallet.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :return: select statement.
+    """
+    condition = and_(Wallet.uuid == wallet_uuid, Wallet.stripes == 0)
+    if operation_type == OperationType.DEPOSIT:
+        new_balance = Wallet.balance + amount
+    else:
+        condition = and_(condition, Wallet.balance >= amount)
+        new_balance = Wallet.balance - amount
+
+    updated = (
+        update(Wallet)
+        .where(condition)
+        .values(balance=new_balance, version=Wallet.version + 1)
+        .returning(Wallet.uuid, Wallet.balance)
+        .cte("updated")
+    )
+    recorded = (
+        insert(WalletOperation)
+        .from_select(
+            ["wallet_uuid", "operation_type", "amount", "balance"],
+            select(
+                updated.c.uuid,
+                literal(operation_type.value, String),
+                literal(amount, MinorUnits),
+                updated.c.balance,
+            ),
+        )
+        .returning(WalletOperation.balance)
+        .cte("recorded")
+    )
+    stripes = select(Wallet.stripes).where(Wallet.uuid == wallet_uuid)
+    return select(
+        stripes.scalar_subquery().label("stripes"),
+        select(recorded.c.balance).scalar_subquery().label("balance"),
+    )
+
+
+async def apply_operation(
+        session: AsyncSession,
+        wallet_uuid: UUID,
+        operation_type: OperationType,
+        amount: Decimal
+) -> SWalletCreated:
+    """
+    Applies a deposit or withdrawal to the wallet.
+
+    The row lock is held only for the duration of the update statement
+    inside the caller's transaction. If the wallet turns out
+    to be striped, the operation is applied to its slots.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :return: updated wallet in format 'SWalletCreated'.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the balance is too low to withdraw.
+    :raises BalanceOverflowError: if a deposit exceeds the BIGINT range
+    of the balance, the transaction is aborted then.
+    :raises WalletConflictError: if optimistic retries are exhausted.
+    """
+    if settings.LEDGER_MODE:
+        if operation_type == OperationType.DEPOSIT:
+            return await ledger.deposit(session, wallet_uuid, amount)
+        return await ledger.withdraw(session, wallet_uuid, amount)
+    if optimistic.enabled():
+        wallet = await optimistic.apply_operation(
+            session, wallet_uuid, operation_type, amount
+        )
+        if wallet is not None:
+            return wallet
+
+    while True:
+        started = time.perf_counter()
+        with balance_range(wallet_uuid):
+            result = await session.execute(
+                operation_statement(wallet_uuid, operation_type, amount)
+            )
+        if settings.METRICS_ENABLED:
+            db_timings.observe(
+                "operation_statement_seconds",
+                time.perf_counter() - started, "orm"
+            )
+        row = result.one()
+        if row.balance is not None:
+            return SWalletCreated.model_construct(
+                uuid=wallet_uuid, balance=row.balance
+            )
+        if row.stripes is None:
+            raise WalletNotFoundError(wallet_uuid)
+        if not row.stripes:
+            raise InsufficientFundsError(wallet_uuid)
+        with balance_range(wallet_uuid):
+            wallet = await striping.apply_operation(
+                session, wallet_uuid, row.stripes, operation_type, amount
+            )
+        # None means the wallet was converted concurrently, retry
+        if wallet is not None:
+            return wallet
+
+
+async def read_wallet(
+        session: AsyncSession, wallet_uuid: UUID
+) -> Optional[SWalletCreated]:
+    """
+    Reads the wallet and its current balance.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :return: wallet in format 'SWalletCreated' or None if it does not exist.
+    """
+    if settings.LEDGER_MODE:
+        statement = ledger.ledger_balances().where(Wallet.uuid == wallet_uuid)
+    else:
+        statement = select(
+            Wallet.uuid, striping.total_balance().label("balance")
+        ).where(Wallet.uuid == wallet_uuid)
+    row = (await session.execute(statement)).one_or_none()
+    if row is None:
+        return None
+    return SWalletCreated.model_construct(uuid=row.uuid, balance=row.balance)
+
+
+def wallets_statement(
+        fields: Sequence[WalletField],
+        cursor: Optional[UUID] = None,
+        min_balance: Optional[Decimal] = None,
+        max_balance: Optional[Decimal] = None
+) -> Select:
+    """
+    Builds a select of wallets in UUID order.
+
+    Wallets are paginated by keyset on 'uuid', so a page costs
+    the same at any depth of the table. The balance of a row is only
+    computed when it is selected or filtered on. The balance range
+    is checked on the rows of the primary key walk, so a filtered
+    page reads wallets in UUID order until it is full: the fewer
+    wallets match, the more rows it reads, up to the rest of the table.
+    The balance is not indexed, an index on it would add an index
+    write to every operation and prevent HOT updates of the row.
+    The 'uuid' column is always selected.
+    :param fields: fields of the wallets to select.
+    :param cursor: UUID after which the wallets start.
+    :param min_balance: lowest full balance, inclusive.
+    :param max_balance: highest full balance, inclusive.
+    :return: select statement.
+    """
+    if settings.LEDGER_MODE:
+        statement = ledger.ledger_balances()
+        balance = statement.selected_columns.balance
+    else:
+        statement = select(Wallet.uuid)
+        balance = striping.total_balance().label("balance")
+    columns = {
+        WalletField.BALANCE: balance,
+        WalletField.STRIPES: Wallet.stripes,
+        WalletField.VERSION: Wallet.version,
+    }
+    statement = statement.with_only_columns(
+        Wallet.uuid, *(columns[field] for field in fields if field in columns)
+    ).order_by(Wallet.uuid)
+    if cursor is not None:
+        statement = statement.where(Wallet.uuid > cursor)
+
+    def in_range(amount: ColumnElement) -> ColumnElement:
+        """Checks that the amount is within the balance range."""
+        bounds = []
+        if min_balance is not None:
+            bounds.append(amount >= literal(min_balance, MinorUnits))
+        if max_balance is not None:
+            bounds.append(amount <= literal(max_balance, MinorUnits))
+        return and_(*bounds)
+
+    if min_balance is None and max_balance is None:
+        return statement
+    if settings.LEDGER_MODE:
+        return statement.where(in_range(balance.element))
+    return statement.where(or_(
+        and_(Wallet.stripes == 0, in_range(Wallet.balance)),
+        and_(Wallet.stripes > 0, in_range(balance.element)),
+    ))
+
+
+async def lock_wallets(
+        session: AsyncSession, wallet_uuids: set[UUID]
+) -> dict[UUID, Decimal]:
+    """
+    Locks wallets and returns their balances.
+
+    Rows are locked 'FOR NO KEY UPDATE' in UUID order, so concurrent
+    transactions locking overlapping sets of wallets cannot deadlock
+    each other and ledger inserts of deposits are not blocked.
+    The slots of striped wallets are consolidated into the wallet rows.
+    In ledger mode the balances are read by a separate statement
+    after the locks are taken.
+    Missing wallets are absent from the result.
+    :param session: asynchronous database session.
+    :param wallet_uuids: UUIDs of the wallets to lock.
+    :return: mapping of wallet UUID to its balance.
+    """
+    if settings.LEDGER_MODE:
+        locked = await session.execute(
+            select(Wallet.uuid)
+            .where(Wallet.uuid.in_(wallet_uuids))
+            .order_by(Wallet.uuid)
+            .with_for_update(key_share=True)
+        )
+        return await ledger.read_balances(session, set(locked.scalars()))
+
+    result = await session.execute(
+        select(Wallet.uuid, Wallet.balance, Wallet.stripes)
+        .where(Wallet.uuid.in_(wallet_uuids))
+        .order_by(Wallet.uuid)
+        .with_for_update(key_share=True)
+    )
+    rows = result.all()
+    balances = {row.uuid: row.balance for row in rows}
+    balances.update(await striping.consolidate(
+        session, {row.uuid for row in rows if row.stripes}
+    ))
+    return balances
+
+
+async def store_balances(
+        session: AsyncSession, balances: dict[UUID, Decimal]
+) -> None:
+    """
+    Writes new balances of several wallets with one statement.
+    :param session: asynchronous database session.
+    :param balances: mapping of wallet UUID to its new balance.
+    :return: None.
+    """
+    if not balances:
+        return
+    new_balances = values(
+        column("uuid", PG_UUID(as_uuid=True)),
+        column("balance", MinorUnits),
+        name="new_balances",
+    ).data(list(balances.items()))
+    await session.execute(
+        update(Wallet.__table__)
+        .where(Wallet.uuid == new_balances.c.uuid)
+        .values(
+            balance=new_balances.c.balance, version=Wallet.version + 1
+        )
+    )
+
+
+async def apply_batch(
+        session: AsyncSession,
+        operations: list[SBatchOperationItem],
+        atomic: bool
+) -> SBatchResult:
+    """
+    Applies a batch of wallet operations.
+
+    All affected wallets are locked with one query, operations are
+    evaluated in request order, the new balances are written
+    with one more statement and the applied operations are recorded
+    in the ledger.
+    In atomic mode nothing is written if any operation fails.
+    A deposit beyond the largest balance fails on its own item.
+    :param session: asynchronous database session.
+    :param operations: operations to apply.
+    :param atomic: whether the batch is applied all-or-nothing.
+    :return: batch result in format 'SBatchResult'.
+    :raises BalanceOverflowError: if the slots of a striped wallet
+    add up beyond the largest balance.
+    """
+    wallet_uuids = {operation.wallet_uuid for operation in operations}
+    with balance_range(*wallet_uuids):
+        balances = await lock_wallets(session, wallet_uuids)
+    changed = {}
+    entries = []
+    results = []
+    for operation in operations:
+        balance = balances.get(operation.wallet_uuid)
+        if operation.amount <= 0:
+            status = BatchItemStatus.INVALID_AMOUNT
+        elif balance is None:
+            status = BatchItemStatus.NOT_FOUND
+        elif (operation.operation_type == OperationType.WITHDRAW
+              and balance < operation.amount):
+            status = BatchItemStatus.INSUFFICIENT_FUNDS
+        elif (operation.operation_type == OperationType.DEPOSIT
+              and out_of_range(balance + operation.amount)):
+            status = BatchItemStatus.BALANCE_OVERFLOW
+        else:
+            status = BatchItemStatus.OK
+            if operation.operation_type == OperationType.DEPOSIT:
+                balance += operation.amount
+            else:
+                balance -= operation.amount
+            balances[operation.wallet_uuid] = balance
+            changed[operation.wallet_uuid] = balance
+            entries.append({
+                "wallet_uuid": operation.wallet_uuid,
+                "operation_type": operation.operation_type.value,
+                "amount": operation.amount,
+                "balance": None if settings.LEDGER_MODE else balance,
+            })
+        results.append(SBatchItemResult(
+            status=status,
+            balance=balance if status == BatchItemStatus.OK else None,
+        ))
+
+    applied = not atomic or all(
+        result.status == BatchItemStatus.OK for result in results
+    )
+    if applied:
+        if not settings.LEDGER_MODE:
+            await store_balances(session, changed)
+        await ledger.record_operations(session, entries)
+    else:
+        for result in results:
+            result.balance = None
+    return SBatchResult(applied=applied, results=results)
+
+
+def transfer_statement(
+        from_wallet_uuid: UUID, to_wallet_uuid: UUID, amount: Decimal
+) -> Select:
+    """
+    Builds a statement that moves funds between two wallets
+    in one round trip.
+
+    Both rows are locked 'FOR NO KEY UPDATE' in UUID order by the first
+    CTE, so opposing transfers cannot deadlock each other. The update
+    runs only if both wallets exist, neither is striped and the source
+    balance covers the amount, and both legs are recorded in the ledger.
+    The outer select returns a row per existing wallet with columns
+    'uuid', 'stripes' and 'balance' (new balance or NULL
+    if nothing was applied).
+    :param from_wallet_uuid: UUID of the source wallet.
+    :param to_wallet_uuid: UUID of the destination wallet.
+    :param amount: positive amount of the transfer.
+    :return: select statement.
+    """
+    locked = (
+        select(Wallet.uuid, Wallet.balance, Wallet.stripes)
+        .where(Wallet.uuid.in_([from_wallet_uuid, to_wallet_uuid]))
+        .order_by(Wallet.uuid)
+        .with_for_update(key_share=True)
+        .cte("locked")
+    )
+    unstriped = (
+        select(func.count())
+        .where(locked.c.stripes == 0)
+        .scalar_subquery()
+    )
+    source_balance = (
+        select(locked.c.balance)
+        .where(locked.c.uuid == from_wallet_uuid)
+        .scalar_subquery()
+    )
+    updated = (
+        update(Wallet)
+        .where(
+            Wallet.uuid == locked.c.uuid,
+            unstriped == 2,
+            source_balance >= amount,
+        )
+        .values(
+            balance=Wallet.balance + case(
+                (Wallet.uuid == to_wallet_uuid, literal(amount, MinorUnits)),
+                else_=literal(-amount, MinorUnits),
+            ),
+            version=Wallet.version + 1,
+        )
+        .returning(Wallet.uuid, Wallet.balance)
+        .cte("updated")
+    )
+    recorded = (
+        insert(WalletOperation)
+        .from_select(
+            ["wallet_uuid", "operation_type", "amount", "balance"],
+            select(
+                updated.c.uuid,
+                case(
+                    (updated.c.uuid == to_wallet_uuid,
+                     literal(OperationType.DEPOSIT.value, String)),
+                    else_=literal(OperationType.WITHDRAW.value, String),
+                ),
+                literal(amount, MinorUnits),
+                updated.c.balance,
+            ),
+        )
+        .returning(WalletOperation.wallet_uuid, WalletOperation.balance)
+        .cte("recorded")
+    )
+    return select(
+        locked.c.uuid, locked.c.stripes, recorded.c.balance
+    ).select_from(
+        locked.outerjoin(recorded, recorded.c.wallet_uuid == locked.c.uuid)
+    )
+
+
+async def apply_transfer(
+        session: AsyncSession,
+        from_wallet_uuid: UUID,
+        to_wallet_uuid: UUID,
+        amount: Decimal
+) -> STransferResult:
+    """
+    Moves funds between two different wallets.
+
+    In ledger mode or if a wallet is striped, the wallets are locked
+    by 'lock_wallets' and the new balances are computed in Python.
+    :param session: asynchronous database session.
+    :param from_wallet_uuid: UUID of the source wallet.
+    :param to_wallet_uuid: UUID of the destination wallet.
+    :param amount: positive amount of the transfer.
+    :return: both wallets in format 'STransferResult'.
+    :raises WalletNotFoundError: if either wallet does not exist.
+    :raises InsufficientFundsError: if the source balance is too low.
+    :raises BalanceOverflowError: if the destination balance would exceed
+    the largest balance.
+    """
+    wallet_uuids = (from_wallet_uuid, to_wallet_uuid)
+    striped = False
+    if not settings.LEDGER_MODE:
+        with balance_range(to_wallet_uuid):
+            result = await session.execute(
+                transfer_statement(from_wallet_uuid, to_wallet_uuid, amount)
+            )
+        rows = result.all()
+        balances = {row.uuid: row.balance for row in rows}
+        striped = any(row.stripes for row in rows)
+    if settings.LEDGER_MODE or striped:
+        with balance_range(*wallet_uuids):
+            balances = await lock_wallets(session, set(wallet_uuids))
+    for wallet_uuid in wallet_uuids:
+        if wallet_uuid not in balances:
+            raise WalletNotFoundError(wallet_uuid)
+
+    if settings.LEDGER_MODE or striped:
+        if balances[from_wallet_uuid] < amount:
+            raise InsufficientFundsError(from_wallet_uuid)
+        if out_of_range(balances[to_wallet_uuid] + amount):
+            raise BalanceOverflowError(to_wallet_uuid)
+        balances[from_wallet_uuid] -= amount
+        balances[to_wallet_uuid] += amount
+        if not settings.LEDGER_MODE:
+            await store_balances(session, balances)
+        await ledger.record_operations(session, [
+            {
+                "wallet_uuid": wallet_uuid,
+                "operation_type": operation_type.value,
+                "amount": amount,
+                "balance": (
+                    None if settings.LEDGER_MODE else balances[wallet_uuid]
+                ),
+            }
+            for wallet_uuid, operation_type in (
+                (from_wallet_uuid, OperationType.WITHDRAW),
+                (to_wallet_uuid, OperationType.DEPOSIT),
+            )
+        ])
+    elif balances[from_wallet_uuid] is None:
+        raise InsufficientFundsError(from_wallet_uuid)
+    return STransferResult.model_construct(
+        from_wallet=SWalletCreated.model_construct(
+            uuid=from_wallet_uuid, balance=balances[from_wallet_uuid]
+        ),
+        to_wallet=SWalletCreated.model_construct(
+            uuid=to_wallet_uuid, balance=balances[to_wallet_uuid]
+        ),
+    )
@@ -0,0 +1,154 @@
+"""
+This module provides optimistic wallet operations.
+
+With 'CONCURRENCY_MODE' set to 'optimistic' an operation reads the
+balance and version of the wallet without locking it and writes the
+new balance with a compare-and-swap update that only succeeds if the
+version is unchanged. Every writer of the wallet row increments the
+version. A lost race rolls the transaction back, and the transaction
+runner reruns it after a jittered exponential pause with the
+connection returned to the pool, see 'wallet_app.transactions'.
+The operation is aborted after 'OPTIMISTIC_RETRIES' retries
+"""
+
+import random
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Select, String, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wallet_app.config import settings
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    InsufficientFundsError,
+    WalletNotFoundError,
+    WalletRaceLostError,
+)
+from wallet_app.metrics import Counters, register
+from wallet_app.models import Wallet, WalletOperation
+from wallet_app.money import MinorUnits, out_of_range
+from wallet_app.schemas import OperationType, SWalletCreated
+
+stats = Counters("applied", "conflicts", "retries", "aborts")
+register("optimistic", stats)
+
+
+def enabled() -> bool:
+    """
+    Returns whether wallet operations use compare-and-swap updates.
+    :return: True if 'CONCURRENCY_MODE' is 'optimistic' outside ledger mode.
+    """
+    return (
+        settings.CONCURRENCY_MODE == "optimistic"
+        and not settings.LEDGER_MODE
+    )
+
+
+def swap_statement(
+        wallet_uuid: UUID,
+        version: int,
+        operation_type: OperationType,
+        amount: Decimal,
+        balance: Decimal
+) -> Select:
+    """
+    Builds a statement that writes the new balance if the version matches.
+
+    The applied operation is recorded in the ledger by the same statement.
+    The outer select returns the new balance or NULL
+    if the wallet was changed since it was read.
+    :param wallet_uuid: UUID of the wallet.
+    :param version: version of the wallet that was read.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :param balance: new balance of the wallet.
+    :return: select statement.
+    """
+    updated = (
+        update(Wallet)
+        .where(
+            Wallet.uuid == wallet_uuid,
+            Wallet.version == version,
+            Wallet.stripes == 0,
+        )
+        .values(balance=balance, version=version + 1)
+        .returning(Wallet.uuid, Wallet.balance)
+        .cte("updated")
+    )
+    recorded = (
+        insert(WalletOperation)
+        .from_select(
+            ["wallet_uuid", "operation_type", "amount", "balance"],
+            select(
+                updated.c.uuid,
+                literal(operation_type.value, String),
+                literal(amount, MinorUnits),
+                updated.c.balance,
+            ),
+        )
+        .returning(WalletOperation.balance)
+        .cte("recorded")
+    )
+    return select(select(recorded.c.balance).scalar_subquery())
+
+
+def backoff(retry: int) -> float:
+    """
+    Returns the pause before a retry with full jitter.
+    :param retry: number of the retry, starting from 0.
+    :return: pause in seconds.
+    """
+    return random.uniform(0, settings.OPTIMISTIC_BACKOFF * 2 ** retry)
+
+
+async def apply_operation(
+        session: AsyncSession,
+        wallet_uuid: UUID,
+        operation_type: OperationType,
+        amount: Decimal
+) -> Optional[SWalletCreated]:
+    """
+    Applies a deposit or withdrawal with a compare-and-swap update.
+
+    The balance is read without a lock. The update still waits for
+    the row lock of a concurrent uncommitted writer, like the
+    pessimistic update, then finds the version changed and misses.
+    A miss is raised for the transaction runner to rerun the whole
+    transaction, nothing is held while it waits before the rerun.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :return: updated wallet in format 'SWalletCreated' or None
+    if the wallet is striped.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the balance is too low to withdraw.
+    :raises BalanceOverflowError: if a deposit exceeds the largest balance.
+    :raises WalletRaceLostError: if the wallet was changed since it was read.
+    """
+    row = (await session.execute(
+        select(Wallet.balance, Wallet.version, Wallet.stripes)
+        .where(Wallet.uuid == wallet_uuid)
+    )).one_or_none()
+    if row is None:
+        raise WalletNotFoundError(wallet_uuid)
+    if row.stripes:
+        return None
+    if operation_type == OperationType.DEPOSIT:
+        balance = row.balance + amount
+        if out_of_range(balance):
+            raise BalanceOverflowError(wallet_uuid)
+    elif row.balance < amount:
+        raise InsufficientFundsError(wallet_uuid)
+    else:
+        balance = row.balance - amount
+    balance = await session.scalar(swap_statement(
+        wallet_uuid, row.version, operation_type, amount, balance
+    ))
+    if balance is None:
+        stats.inc("conflicts")
+        raise WalletRaceLostError(wallet_uuid)
+    stats.inc("applied")
+    return SWalletCreated.model_construct(uuid=wallet_uuid, balance=balance)
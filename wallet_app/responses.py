@@ -0,0 +1,109 @@
+"""
+This module provides the serialization of API responses.
+
+Handlers return their models through 'render', which serializes them
+straight to bytes with the compiled serializer of pydantic-core,
+instead of letting FastAPI validate the returned model against
+'response_model' again and encode it with the stdlib JSON encoder.
+Models built from database rows are created with 'model_construct'
+and are not validated at all. Clients sending 'Accept' with a
+MessagePack media type get the same data as MessagePack
+"""
+
+import json
+from typing import Any
+
+import msgpack
+from fastapi.responses import Response
+from pydantic import BaseModel
+from starlette.status import HTTP_200_OK
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+# Media ranges of the 'Accept' header that JSON responses satisfy
+JSON_MEDIA_RANGES = (JSON_MEDIA_TYPE, "application/*", "*/*")
+
+
+def negotiate(accept: str) -> str:
+    """
+    Chooses the media type of a response.
+    :param accept: 'Accept' request header.
+    :return: 'MSGPACK_MEDIA_TYPE' if the header accepts a MessagePack
+    media type with a quality not below that of JSON, otherwise
+    'JSON_MEDIA_TYPE'. Media types with 'q=0' are not acceptable.
+    """
+    if "msgpack" not in accept:
+        return JSON_MEDIA_TYPE
+    msgpack_quality = 0.0
+    json_quality = 0.0
+    for media_range in accept.split(","):
+        media_type, *params = media_range.split(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in MSGPACK_MEDIA_TYPES:
+            msgpack_quality = max(msgpack_quality, quality)
+        elif media_type in JSON_MEDIA_RANGES:
+            json_quality = max(json_quality, quality)
+    if msgpack_quality > 0 and msgpack_quality >= json_quality:
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def pack(value: Any) -> bytes:
+    """
+    Encodes JSON data as MessagePack.
+    :param value: None, bool, int, float, str, list or dict with str keys.
+    :return: MessagePack encoding.
+    :raises TypeError: for other types.
+    """
+    return msgpack.packb(value)
+
+
+def render(
+        model: BaseModel,
+        media_type: str = JSON_MEDIA_TYPE,
+        status_code: int = HTTP_200_OK,
+        exclude_unset: bool = False
+) -> Response:
+    """
+    Serializes a model into a response without validating it.
+    :param model: response model.
+    :param media_type: 'JSON_MEDIA_TYPE' or 'MSGPACK_MEDIA_TYPE'.
+    :param status_code: status code of the response.
+    :param exclude_unset: whether fields not set are left out.
+    :return: response.
+    """
+    serializer = model.__pydantic_serializer__
+    if media_type == MSGPACK_MEDIA_TYPE:
+        content = pack(serializer.to_python(
+            model, mode="json", exclude_unset=exclude_unset
+        ))
+    else:
+        content = serializer.to_json(model, exclude_unset=exclude_unset)
+    return Response(content, status_code=status_code, media_type=media_type)
+
+
+def render_json(
+        content: bytes,
+        media_type: str = JSON_MEDIA_TYPE,
+        status_code: int = HTTP_200_OK
+) -> Response:
+    """
+    Returns a response already serialized as JSON
+    in the negotiated format.
+    :param content: JSON of the response.
+    :param media_type: 'JSON_MEDIA_TYPE' or 'MSGPACK_MEDIA_TYPE'.
+    :param status_code: status code of the response.
+    :return: response.
+    """
+    if media_type == MSGPACK_MEDIA_TYPE:
+        content = pack(json.loads(content))
+    return Response(content, status_code=status_code, media_type=media_type)
@@ -1,29 +1,153 @@
 """This module provides API request handlers"""
 
-from uuid import UUID
+from tempfile import SpooledTemporaryFile
+from typing import Optional
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter
-from fastapi import Depends, HTTPException, Body
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncpg
+from fastapi import APIRouter, WebSocket
+from fastapi import Depends, HTTPException, Body, Header, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.background import BackgroundTask
 from starlette.status import (
     HTTP_201_CREATED,
     HTTP_200_OK,
     HTTP_400_BAD_REQUEST,
     HTTP_404_NOT_FOUND,
     HTTP_204_NO_CONTENT,
+    HTTP_409_CONFLICT,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+    WS_1008_POLICY_VIOLATION,
 )
 
-from wallet_app.deps import get_db, get_transaction_session
+from wallet_app import (
+    bulk,
+    dump,
+    events,
+    fastpath,
+    groupcommit,
+    holds,
+    idempotency,
+    metrics,
+    optimistic,
+    striping,
+)
+from wallet_app.cache import balance_cache
+from wallet_app.config import settings
+from wallet_app.events import balance_events
+from wallet_app.deps import (
+    get_db,
+    get_idempotency_key,
+    get_media_type,
+    get_pool,
+    get_session_factory,
+    transaction_runner,
+)
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    HoldNotFoundError,
+    HoldStateError,
+    InsufficientFundsError,
+    WalletConflictError,
+    WalletNotFoundError,
+    WalletStripedError,
+)
+from wallet_app.ledger import encode_cursor, history_statement, stream_history
+from wallet_app.lookups import wallet_lookups
 from wallet_app.models import Wallet
+from wallet_app.money import Money
+from wallet_app.operations import (
+    apply_batch,
+    apply_operation,
+    apply_transfer,
+    read_wallet,
+    wallets_statement,
+)
+from wallet_app.responses import (
+    JSON_MEDIA_TYPE,
+    negotiate,
+    render,
+    render_json,
+)
 from wallet_app.schemas import (
+    MAX_PAGE_SIZE,
+    BatchItemStatus,
+    DumpFormat,
+    SBatchOperations,
+    SBatchResult,
+    SHold,
+    SHoldCreate,
+    STransfer,
+    STransferResult,
+    SWalletOperationEntry,
+    SWalletOperationsPage,
     SWalletOperation,
     SWalletCreated,
     SWalletCreate,
-    OperationType,
+    SWalletBulkCreate,
+    SWalletStripes,
+    SWalletStriped,
+    SWalletListItem,
+    SWalletsPage,
+    WalletField,
 )
+from wallet_app.groupcommit import wallet_queues
+from wallet_app.singleflight import wallet_reads
+from wallet_app.transactions import TransactionRunner
 
 router = APIRouter(prefix="/api/v1", tags=["wallets"])
+metrics_router = APIRouter(tags=["stats"])
+
+CSV_MEDIA_TYPE = "text/csv"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+outcomes = metrics.register("outcomes", metrics.Counters(
+    "insufficient_funds", "wallet_not_found"
+))
+
+
+def balance_overflow() -> HTTPException:
+    """
+    Returns the error of a deposit beyond the largest balance.
+    :return: error of the status code 'HTTP_400_BAD_REQUEST'.
+    """
+    return HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                         detail="Balance would exceed the maximum")
+
+
+def idempotency_key_reused() -> HTTPException:
+    """
+    Returns the error of an idempotency key sent with another request.
+    :return: error of the status code 'HTTP_422_UNPROCESSABLE_ENTITY'.
+    """
+    return HTTPException(
+        status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+        detail="Idempotency-Key was used for a different request"
+    )
+
+
+def wallet_not_found() -> HTTPException:
+    """
+    Counts a request for a missing wallet.
+    :return: error of the status code 'HTTP_404_NOT_FOUND'.
+    """
+    outcomes.inc("wallet_not_found")
+    return HTTPException(status_code=HTTP_404_NOT_FOUND,
+                         detail="Wallet not found")
+
+
+def insufficient_funds() -> HTTPException:
+    """
+    Counts an operation rejected for insufficient funds.
+    :return: error of the status code 'HTTP_400_BAD_REQUEST'.
+    """
+    outcomes.inc("insufficient_funds")
+    return HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                         detail="Insufficient funds")
 
 
 @router.post(
@@ -31,8 +155,10 @@ router = APIRouter(prefix="/api/v1", tags=["wallets"])
 )
 async def create_wallet(
         data: SWalletCreate = Body(default={}),
-        db: AsyncSession = Depends(get_db)
-) -> SWalletCreated:
+        db: AsyncSession = Depends(get_db),
+        pool: Optional[asyncpg.Pool] = Depends(get_pool),
+        media_type: str = Depends(get_media_type),
+) -> Response:
     """
     Creates a new wallet.
 
@@ -41,13 +167,94 @@ async def create_wallet(
     If it worked without errors, it returns the status code 'HTTP_201_CREATED'.
     :param data: data to create a new wallet.
     :param db: asynchronous database session generator.
+    :param pool: asyncpg pool of the fast path, see 'wallet_app.fastpath'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
     :return: created wallet object in format 'SWalletCreated'.
     """
-    wallet = Wallet(**data.model_dump())
-    db.add(wallet)
+    if fastpath.enabled():
+        wallet_uuid, content = await fastpath.create_wallet(
+            pool, data.balance
+        )
+        wallet_lookups.add_existing(wallet_uuid)
+        await balance_cache.set_json(wallet_uuid, content)
+        return render_json(content, media_type, HTTP_201_CREATED)
+    result = await db.execute(
+        insert(Wallet)
+        .values(uuid=uuid4(), balance=data.balance or 0)
+        .returning(Wallet.uuid, Wallet.balance)
+    )
+    row = result.one()
+    created = SWalletCreated.model_construct(
+        uuid=row.uuid, balance=row.balance
+    )
     await db.commit()
-    await db.refresh(wallet)
-    return SWalletCreated.model_validate(wallet)
+    wallet_lookups.add_existing(created.uuid)
+    await balance_cache.set(created)
+    return render(created, media_type, HTTP_201_CREATED)
+
+
+@router.post(
+    "/wallets/bulk",
+    status_code=HTTP_201_CREATED,
+    response_class=StreamingResponse,
+    responses={HTTP_201_CREATED: {"content": {NDJSON_MEDIA_TYPE: {}}}},
+    openapi_extra={"requestBody": {"required": True, "content": {
+        JSON_MEDIA_TYPE: {"schema": SWalletBulkCreate.model_json_schema()},
+        CSV_MEDIA_TYPE: {"schema": {"type": "string"}},
+    }}},
+)
+async def create_wallets_bulk(
+        request: Request,
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+) -> StreamingResponse:
+    """
+    Creates many wallets with COPY.
+
+    A JSON body must be in valid format 'SWalletBulkCreate'.
+    A 'text/csv' body holds one initial balance per line and is read
+    completely before the transaction is opened. All wallets are
+    created in one transaction, see 'wallet_app.bulk', and streamed
+    back as NDJSON lines of 'SWalletCreated' after the commit.
+    If it worked without errors, it returns the status code
+    'HTTP_201_CREATED', otherwise nothing is created and it returns
+    the status code 'HTTP_400_BAD_REQUEST' for an invalid CSV body or
+    'HTTP_422_UNPROCESSABLE_ENTITY' for an invalid JSON body.
+    :param request: request with the JSON or CSV body.
+    :param session_factory: database session factory.
+    :return: stream of created wallets.
+    """
+    body = None
+    if request.headers.get("content-type", "").startswith(CSV_MEDIA_TYPE):
+        body = await bulk.spool(request.stream())
+        balances = bulk.csv_balances(bulk.stream_file(body))
+    else:
+        try:
+            data = SWalletBulkCreate.model_validate_json(await request.body())
+        except ValidationError as error:
+            raise RequestValidationError(error.errors(include_url=False))
+        balances = bulk.request_balances(data)
+    output = SpooledTemporaryFile(max_size=bulk.SPOOL_MAX_SIZE)
+    try:
+        created = await bulk.import_wallets(session_factory, balances, output)
+    except bulk.CSVFormatError as error:
+        output.close()
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST, detail=str(error)
+        )
+    finally:
+        if body is not None:
+            body.close()
+    if not created:
+        output.close()
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST, detail="No balances given"
+        )
+    return StreamingResponse(
+        bulk.stream_file(output),
+        status_code=HTTP_201_CREATED,
+        media_type=NDJSON_MEDIA_TYPE,
+    )
 
 
 @router.post(
@@ -58,19 +265,36 @@ async def create_wallet(
 async def wallet_operating(
         wallet_uuid: UUID,
         operation: SWalletOperation,
-        session: AsyncSession = Depends(get_transaction_session),
-):
+        runner: TransactionRunner = Depends(transaction_runner("operation")),
+        idempotency_key: Optional[str] = Depends(get_idempotency_key),
+        pool: Optional[asyncpg.Pool] = Depends(get_pool),
+        media_type: str = Depends(get_media_type),
+) -> Response:
     """
     Performs a wallet operation.
 
+    The balance is changed by a single conditional update,
+    see 'wallet_app.operations.apply_operation'.
     Input data must be in valid format 'SWalletOperation'.
     If it worked without errors, it returns the status code 'HTTP_200_OK',
     otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
-    or 'HTTP_404_NOT_FOUND' based on the error.
+    or 'HTTP_404_NOT_FOUND' based on the error. In optimistic mode
+    it returns the status code 'HTTP_409_CONFLICT' if concurrent
+    changes of the wallet exhausted the retries.
+    With group commit, operations on the same wallet are queued
+    and applied in groups, see 'wallet_app.groupcommit'.
+    A successful response is stored under the 'Idempotency-Key' header
+    and returned for retries with the same key without applying
+    the operation again. Reusing the key for a different request returns
+    the status code 'HTTP_422_UNPROCESSABLE_ENTITY'.
     :param wallet_uuid: UUID of existing wallet.
     :param operation: operation to perform.
     Contains 'operation_type' and 'amount'.
-    :param session: asynchronous database session generator for transactions.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param idempotency_key: optional idempotency key of the request.
+    :param pool: asyncpg pool of the fast path, see 'wallet_app.fastpath'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
     :return: updated wallet object in format 'SWalletCreated'.
     """
     if operation.amount <= 0:
@@ -78,49 +302,603 @@ async def wallet_operating(
             status_code=HTTP_400_BAD_REQUEST,
             detail="Transfer amount must be positive"
         )
-    async with session.begin():
-        result = await session.execute(
-            select(Wallet).where(Wallet.uuid == wallet_uuid).with_for_update()
+    if wallet_lookups.is_missing(wallet_uuid):
+        raise wallet_not_found()
+    if (
+            fastpath.enabled()
+            and not optimistic.enabled()
+            and not groupcommit.enabled()
+            and not idempotency_key
+    ):
+        try:
+            content = await fastpath.apply_operation(
+                pool, wallet_uuid, operation.operation_type, operation.amount
+            )
+        except WalletStripedError:
+            # striped wallets are handled by the ORM path below
+            content = None
+        except WalletNotFoundError:
+            wallet_lookups.add_missing(wallet_uuid)
+            raise wallet_not_found()
+        except InsufficientFundsError:
+            raise insufficient_funds()
+        except BalanceOverflowError:
+            raise balance_overflow()
+        if content is not None:
+            await balance_cache.invalidate(wallet_uuid)
+            return render_json(content, media_type)
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = idempotency.request_hash(wallet_uuid, operation)
+
+    async def work(session: AsyncSession):
+        stored = None
+        if idempotency_key:
+            stored = await idempotency.lookup(session, idempotency_key)
+            if stored is not None:
+                return None, stored
+        wallet = await apply_operation(
+            session, wallet_uuid, operation.operation_type, operation.amount
         )
-        wallet = result.scalar_one_or_none()
+        if idempotency_key:
+            stored = await idempotency.save(
+                session, idempotency_key, fingerprint, wallet
+            )
+            if stored is None:
+                raise idempotency.IdempotencyKeyTakenError
+        return wallet, stored
+
+    try:
+        if groupcommit.enabled() and not idempotency_key:
+            wallet = await wallet_queues.submit(runner, wallet_uuid, operation)
+            stored = None
+        else:
+            wallet, stored = await runner.run(work)
         if wallet is None:
+            return render(idempotency.replay(stored, fingerprint), media_type)
+    except WalletNotFoundError:
+        wallet_lookups.add_missing(wallet_uuid)
+        raise wallet_not_found()
+    except InsufficientFundsError:
+        raise insufficient_funds()
+    except BalanceOverflowError:
+        raise balance_overflow()
+    except WalletConflictError:
+        raise HTTPException(
+            status_code=HTTP_409_CONFLICT,
+            detail="Wallet is changed concurrently, retry later"
+        )
+    except idempotency.IdempotencyKeyTakenError:
+        async with runner.session_factory() as session:
+            stored = await idempotency.lookup(session, idempotency_key)
+        if stored is None:
             raise HTTPException(
-                status_code=HTTP_404_NOT_FOUND, detail="Wallet not found"
+                status_code=HTTP_409_CONFLICT,
+                detail="Request with this Idempotency-Key is in progress"
             )
+        # The sibling clause below does not catch errors raised here
+        try:
+            replayed = idempotency.replay(stored, fingerprint)
+        except idempotency.IdempotencyKeyReusedError:
+            raise idempotency_key_reused()
+        return render(replayed, media_type)
+    except idempotency.IdempotencyKeyReusedError:
+        raise idempotency_key_reused()
+    await balance_cache.invalidate(wallet_uuid)
+    if idempotency_key:
+        idempotency.cache.put(idempotency_key, stored)
+    return render(wallet, media_type)
 
-        if operation.operation_type == OperationType.DEPOSIT:
-            wallet.balance += operation.amount
-        else:
-            if wallet.balance < operation.amount:
-                raise HTTPException(
-                    status_code=HTTP_400_BAD_REQUEST,
-                    detail="Insufficient funds"
-                )
-            wallet.balance -= operation.amount
-    await session.commit()
-    return SWalletCreated.model_validate(wallet)
 
+@router.post(
+    "/wallets/operations:batch",
+    response_model=SBatchResult,
+    status_code=HTTP_200_OK,
+)
+async def wallet_batch_operating(
+        batch: SBatchOperations,
+        runner: TransactionRunner = Depends(transaction_runner("batch")),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Performs a batch of wallet operations in one transaction.
+
+    Input data must be in valid format 'SBatchOperations'.
+    Wallets are locked in UUID order, so concurrent batches
+    cannot deadlock each other.
+    If the batch is well-formed, it returns the status code 'HTTP_200_OK'
+    with a per-item status. In atomic mode 'applied' is false
+    and no balance is changed when any operation fails.
+    :param batch: operations to perform and the batch mode.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: batch result in format 'SBatchResult'.
+    """
+    result = await runner.run(
+        lambda session: apply_batch(session, batch.operations, batch.atomic)
+    )
+    for item in result.results:
+        if item.status == BatchItemStatus.INSUFFICIENT_FUNDS:
+            outcomes.inc("insufficient_funds")
+        elif item.status == BatchItemStatus.NOT_FOUND:
+            outcomes.inc("wallet_not_found")
+    if result.applied:
+        await balance_cache.invalidate(
+            *{operation.wallet_uuid for operation in batch.operations}
+        )
+    return render(result, media_type)
+
+
+@router.post(
+    "/transfers", response_model=STransferResult, status_code=HTTP_200_OK
+)
+async def transfer(
+        data: STransfer,
+        runner: TransactionRunner = Depends(transaction_runner("transfer")),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Moves funds between two wallets in one transaction.
 
-@router.get("/wallets/{wallet_uuid}", status_code=HTTP_200_OK)
+    Input data must be in valid format 'STransfer'.
+    Both wallets are locked in UUID order, so opposing transfers
+    cannot deadlock each other, see 'wallet_app.operations.apply_transfer'.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
+    or 'HTTP_404_NOT_FOUND' based on the error.
+    :param data: source and destination wallets and the amount.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: both wallets in format 'STransferResult'.
+    """
+    if data.amount <= 0:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Transfer amount must be positive"
+        )
+    if data.from_wallet_uuid == data.to_wallet_uuid:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Cannot transfer to the same wallet"
+        )
+    try:
+        result = await runner.run(lambda session: apply_transfer(
+            session, data.from_wallet_uuid, data.to_wallet_uuid, data.amount
+        ))
+    except WalletNotFoundError:
+        raise wallet_not_found()
+    except InsufficientFundsError:
+        raise insufficient_funds()
+    except BalanceOverflowError:
+        raise balance_overflow()
+    await balance_cache.invalidate(data.from_wallet_uuid, data.to_wallet_uuid)
+    return render(result, media_type)
+
+
+def hold_not_found() -> HTTPException:
+    """
+    Returns the error of a request for a missing hold.
+    :return: error of the status code 'HTTP_404_NOT_FOUND'.
+    """
+    return HTTPException(status_code=HTTP_404_NOT_FOUND,
+                         detail="Hold not found")
+
+
+def hold_not_active(error: HoldStateError) -> HTTPException:
+    """
+    Returns the error of a step the hold is no longer in the state for.
+    :param error: error holding the state of the hold.
+    :return: error of the status code 'HTTP_409_CONFLICT'.
+    """
+    return HTTPException(status_code=HTTP_409_CONFLICT,
+                         detail=f"Hold is {error.args[0].value.lower()}")
+
+
+@router.post(
+    "/wallets/{wallet_uuid}/holds",
+    response_model=SHold,
+    status_code=HTTP_201_CREATED,
+)
+async def create_hold(
+        wallet_uuid: UUID,
+        data: SHoldCreate,
+        runner: TransactionRunner = Depends(transaction_runner("hold")),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Reserves funds of a wallet for a later capture or release.
+
+    The amount is withdrawn at once, so the wallet balance is
+    the available balance, see 'wallet_app.holds'. An active hold
+    that is neither captured nor released before 'expires_at'
+    is released by the background sweeper.
+    Input data must be in valid format 'SHoldCreate'.
+    If it worked without errors, it returns the status code
+    'HTTP_201_CREATED', otherwise it returns the status code
+    'HTTP_400_BAD_REQUEST' or 'HTTP_404_NOT_FOUND' based on the error.
+    :param wallet_uuid: UUID of existing wallet.
+    :param data: amount and lifetime of the hold.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: active hold in format 'SHold'.
+    """
+    if data.amount <= 0:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Hold amount must be positive"
+        )
+    if wallet_lookups.is_missing(wallet_uuid):
+        raise wallet_not_found()
+    try:
+        hold = await runner.run(lambda session: holds.create_hold(
+            session, wallet_uuid, data.amount, data.ttl
+        ))
+    except WalletNotFoundError:
+        wallet_lookups.add_missing(wallet_uuid)
+        raise wallet_not_found()
+    except InsufficientFundsError:
+        raise insufficient_funds()
+    except WalletConflictError:
+        raise HTTPException(
+            status_code=HTTP_409_CONFLICT,
+            detail="Wallet is changed concurrently, retry later"
+        )
+    await balance_cache.invalidate(wallet_uuid)
+    return render(hold, media_type, HTTP_201_CREATED)
+
+
+@router.post(
+    "/holds/{hold_id}/capture", response_model=SHold, status_code=HTTP_200_OK
+)
+async def capture_hold(
+        hold_id: UUID,
+        runner: TransactionRunner = Depends(transaction_runner("hold")),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Captures an active hold, completing the withdrawal.
+
+    Only the hold row is updated, the wallet balance does not change.
+    Capturing a captured hold again returns it unchanged.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_404_NOT_FOUND'
+    or 'HTTP_409_CONFLICT' if the hold is released or expired.
+    :param hold_id: identifier of existing hold.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: captured hold in format 'SHold'.
+    """
+    try:
+        hold = await runner.run(
+            lambda session: holds.capture_hold(session, hold_id)
+        )
+    except HoldNotFoundError:
+        raise hold_not_found()
+    except HoldStateError as error:
+        raise hold_not_active(error)
+    return render(hold, media_type)
+
+
+@router.post(
+    "/holds/{hold_id}/release", response_model=SHold, status_code=HTTP_200_OK
+)
+async def release_hold(
+        hold_id: UUID,
+        runner: TransactionRunner = Depends(transaction_runner("hold")),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Releases an active hold, returning its amount to the wallet.
+
+    Releasing a released or expired hold again returns it unchanged.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_404_NOT_FOUND'
+    or 'HTTP_409_CONFLICT' if the hold is captured.
+    :param hold_id: identifier of existing hold.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: released hold in format 'SHold'.
+    """
+    try:
+        hold = await runner.run(
+            lambda session: holds.release_hold(session, hold_id)
+        )
+    except HoldNotFoundError:
+        raise hold_not_found()
+    except HoldStateError as error:
+        raise hold_not_active(error)
+    await balance_cache.invalidate(hold.wallet_uuid)
+    return render(hold, media_type)
+
+
+@router.get(
+    "/wallets",
+    response_model=SWalletsPage,
+    response_model_exclude_unset=True,
+    status_code=HTTP_200_OK,
+)
+async def list_wallets(
+        cursor: Optional[UUID] = None,
+        limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+        min_balance: Optional[Money] = Query(default=None, ge=0),
+        max_balance: Optional[Money] = Query(default=None, ge=0),
+        fields: str = ",".join(WalletField),
+        db: AsyncSession = Depends(get_db),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Returns a page of wallets in UUID order.
+
+    The 'next_cursor' of a page is passed as 'cursor' to get the next
+    one. Wallets can be filtered by an inclusive range of their full
+    balance, 'fields' is a comma-separated list of the returned fields.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_422_UNPROCESSABLE_ENTITY'
+    for an unknown field.
+    :param cursor: cursor returned with the previous page.
+    :param limit: maximum number of wallets on the page.
+    :param min_balance: lowest balance, inclusive.
+    :param max_balance: highest balance, inclusive.
+    :param fields: comma-separated fields of the wallets.
+    :param db: asynchronous database session generator.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: page in format 'SWalletsPage'.
+    """
+    try:
+        selected = [WalletField(name) for name in fields.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Unknown field")
+    statement = wallets_statement(selected, cursor, min_balance, max_balance)
+    rows = (await db.execute(statement.limit(limit + 1))).all()
+    wallets = [
+        SWalletListItem.model_construct(**{
+            field.value: row._mapping[field.value] for field in selected
+        })
+        for row in rows[:limit]
+    ]
+    next_cursor = rows[limit - 1].uuid if len(rows) > limit else None
+    page = SWalletsPage.model_construct(
+        wallets=wallets, next_cursor=next_cursor
+    )
+    return render(page, media_type, exclude_unset=True)
+
+
+def check_subscription(wallet_uuids: list[UUID]) -> None:
+    """
+    Checks that balance changes can be subscribed to.
+    :param wallet_uuids: UUIDs of the subscribed wallets.
+    :return: None.
+    :raises HTTPException: with the status code 'HTTP_400_BAD_REQUEST'
+    if balance events are disabled or 'HTTP_422_UNPROCESSABLE_ENTITY'
+    if there are too many wallets.
+    """
+    if not settings.BALANCE_EVENTS:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Balance events are disabled"
+        )
+    if len(set(wallet_uuids)) > settings.EVENTS_MAX_WALLETS:
+        raise HTTPException(
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Too many wallets"
+        )
+
+
+@router.get(
+    "/wallets/events",
+    status_code=HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={HTTP_200_OK: {"content": {
+        events.EVENT_STREAM_MEDIA_TYPE: {}
+    }}},
+)
+async def stream_wallet_events(
+        wallet_uuid: list[UUID] = Query(min_length=1),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+) -> StreamingResponse:
+    """
+    Streams balance changes of wallets as server-sent events.
+
+    The first event of every wallet is its current balance, then
+    an event is sent for every change, see 'wallet_app.events'.
+    Changes arriving faster than the client reads them are merged
+    into the latest balance of the wallet.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
+    if balance events are disabled, 'HTTP_404_NOT_FOUND'
+    or 'HTTP_422_UNPROCESSABLE_ENTITY' for too many wallets.
+    :param wallet_uuid: UUIDs of existing wallets, repeated.
+    :param session_factory: session factory to read balances with.
+    :return: stream of 'balance' events in format 'SWalletCreated'.
+    """
+    check_subscription(wallet_uuid)
+    try:
+        subscription = await balance_events.subscribe(
+            session_factory, wallet_uuid
+        )
+    except WalletNotFoundError:
+        raise wallet_not_found()
+    return StreamingResponse(
+        events.stream_events(subscription),
+        media_type=events.EVENT_STREAM_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache"},
+        # Unsubscribes also if the client left before the stream started
+        background=BackgroundTask(balance_events.unsubscribe, subscription),
+    )
+
+
+@router.websocket("/wallets/events")
+async def wallet_events_websocket(
+        websocket: WebSocket,
+        wallet_uuid: list[UUID] = Query(min_length=1),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+) -> None:
+    """
+    Sends balance changes of wallets over a WebSocket.
+
+    Same as the event stream of 'GET /wallets/events', every change
+    is a text message in JSON format 'SWalletCreated'. The connection
+    is closed with the code 'WS_1008_POLICY_VIOLATION' and the reason
+    of the error instead of the error status codes.
+    :param websocket: WebSocket connection.
+    :param wallet_uuid: UUIDs of existing wallets, repeated.
+    :param session_factory: session factory to read balances with.
+    :return: None.
+    """
+    try:
+        check_subscription(wallet_uuid)
+        try:
+            subscription = await balance_events.subscribe(
+                session_factory, wallet_uuid
+            )
+        except WalletNotFoundError:
+            raise wallet_not_found()
+    except HTTPException as error:
+        await websocket.close(
+            code=WS_1008_POLICY_VIOLATION, reason=error.detail
+        )
+        return
+    await events.serve_websocket(websocket, subscription)
+
+
+@router.get(
+    "/wallets/{wallet_uuid}",
+    response_model=SWalletCreated,
+    status_code=HTTP_200_OK,
+)
 async def get_wallet(
-        wallet_uuid: UUID, db: AsyncSession = Depends(get_db)
-) -> SWalletCreated:
+        wallet_uuid: UUID,
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+        pool: Optional[asyncpg.Pool] = Depends(get_pool),
+        media_type: str = Depends(get_media_type),
+) -> Response:
     """
     Returns an existing wallet by UUID.
 
+    The wallet is read through the balance cache, see 'wallet_app.cache'.
+    On a miss, concurrent requests for the same wallet share one database
+    read and one serialized response, see 'wallet_app.singleflight'.
+    Wallets known to be missing are not read, see 'wallet_app.lookups'.
     Input UUID must exist and be UUID as well.
     If it worked without errors, it returns the status code 'HTTP_200_OK',
     otherwise, it returns the status code 'HTTP_404_NOT_FOUND'.
     :param wallet_uuid: UUID of existing wallet.
-    :param db: asynchronous database session generator.
+    :param session_factory: session factory for the shared read.
+    :param pool: asyncpg pool of the fast path, see 'wallet_app.fastpath'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
     :return: wallet object in format 'SWalletCreated'.
     """
-    result = await db.execute(select(Wallet).where(Wallet.uuid == wallet_uuid))
-    wallet = result.scalar_one_or_none()
-    if not wallet:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
-                            detail="Wallet not found")
-    return SWalletCreated.model_validate(wallet)
+    if wallet_lookups.is_missing(wallet_uuid):
+        raise wallet_not_found()
+    content = await balance_cache.get_json(wallet_uuid)
+    if content is None:
+        if settings.SINGLE_FLIGHT:
+            content = await wallet_reads.do(
+                wallet_uuid,
+                lambda: load_wallet(session_factory, pool, wallet_uuid)
+            )
+        else:
+            content = await load_wallet(session_factory, pool, wallet_uuid)
+    if content is None:
+        raise wallet_not_found()
+    return render_json(content, media_type)
+
+
+async def load_wallet(
+        session_factory: async_sessionmaker,
+        pool: Optional[asyncpg.Pool],
+        wallet_uuid: UUID
+) -> Optional[bytes]:
+    """
+    Reads the wallet from the database and caches it,
+    a missing wallet is remembered as missing.
+    :param session_factory: session factory.
+    :param pool: asyncpg pool of the fast path.
+    :param wallet_uuid: UUID of the wallet.
+    :return: JSON of 'SWalletCreated' or None if the wallet does not exist.
+    """
+    if fastpath.enabled():
+        content = await fastpath.read_wallet(pool, wallet_uuid)
+    else:
+        async with session_factory() as session:
+            wallet = await read_wallet(session, wallet_uuid)
+        content = None if wallet is None else wallet.model_dump_json().encode()
+    if content is None:
+        wallet_lookups.add_missing(wallet_uuid)
+        return None
+    await balance_cache.set_json(wallet_uuid, content)
+    return content
+
+
+@router.get(
+    "/wallets/{wallet_uuid}/operations",
+    response_model=SWalletOperationsPage,
+    status_code=HTTP_200_OK,
+)
+async def get_wallet_operations(
+        wallet_uuid: UUID,
+        cursor: Optional[str] = None,
+        limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+        accept: str = Header(default=""),
+        db: AsyncSession = Depends(get_db),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+):
+    """
+    Returns the operation history of an existing wallet.
+
+    Entries are returned from newest to oldest in pages of 'limit'
+    entries. The 'next_cursor' of a page is passed as 'cursor'
+    to get the next one.
+    If the 'Accept' header contains 'application/x-ndjson',
+    all entries after the cursor are streamed as NDJSON instead,
+    a MessagePack media type returns the page as MessagePack.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
+    for a malformed cursor or 'HTTP_404_NOT_FOUND'.
+    :param wallet_uuid: UUID of existing wallet.
+    :param cursor: cursor returned with the previous page.
+    :param limit: maximum number of entries on the page.
+    :param accept: 'Accept' request header.
+    :param db: asynchronous database session generator.
+    :param session_factory: session factory for the streaming response.
+    :return: page in format 'SWalletOperationsPage' or NDJSON stream.
+    """
+    exists = await db.scalar(
+        select(Wallet.uuid).where(Wallet.uuid == wallet_uuid)
+    )
+    if not exists:
+        raise wallet_not_found()
+    try:
+        statement = history_statement(wallet_uuid, cursor)
+    except ValueError:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Invalid cursor")
+
+    if NDJSON_MEDIA_TYPE in accept:
+        return StreamingResponse(
+            stream_history(session_factory, statement),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+
+    rows = (await db.execute(statement.limit(limit + 1))).all()
+    operations = [SWalletOperationEntry.model_validate(row)
+                  for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(rows[limit - 1].created_at,
+                                    rows[limit - 1].id)
+    page = SWalletOperationsPage.model_construct(
+        operations=operations, next_cursor=next_cursor
+    )
+    return render(page, negotiate(accept))
 
 
 @router.delete("/wallets/{wallet_uuid}", status_code=HTTP_204_NO_CONTENT)
@@ -131,16 +909,184 @@ async def delete_wallet(
     Deletes an existing wallet by UUID.
 
     Input UUID must exist and be UUID as well.
+    Deleted wallets are remembered as missing, see 'wallet_app.lookups'.
     If it worked without errors,
     it returns the status code 'HTTP_204_NO_CONTENT'.
     :param wallet_uuid: UUID of existing wallet.
     :param db: asynchronous database session generator.
     :return: None
     """
+    if wallet_lookups.is_missing(wallet_uuid):
+        raise wallet_not_found()
     result = await db.execute(select(Wallet).where(Wallet.uuid == wallet_uuid))
     wallet = result.scalar_one_or_none()
     if not wallet:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
-                            detail="Wallet not found")
+        wallet_lookups.add_missing(wallet_uuid)
+        raise wallet_not_found()
     await db.delete(wallet)
     await db.commit()
+    wallet_lookups.add_missing(wallet_uuid)
+    await balance_cache.invalidate(wallet_uuid)
+
+
+@router.put(
+    "/admin/wallets/{wallet_uuid}/stripes",
+    response_model=SWalletStriped,
+    status_code=HTTP_200_OK,
+    tags=["admin"],
+)
+async def set_wallet_stripes(
+        wallet_uuid: UUID,
+        data: SWalletStripes,
+        runner: TransactionRunner = Depends(transaction_runner("stripes")),
+        media_type: str = Depends(get_media_type),
+) -> Response:
+    """
+    Converts a hot wallet to striped balance slots or back.
+
+    Deposits to a striped wallet update one of its slots, so they
+    no longer wait for each other on the wallet row lock,
+    see 'wallet_app.striping'. Zero slots turns striping off.
+    Input data must be in valid format 'SWalletStripes'.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
+    in ledger mode or 'HTTP_404_NOT_FOUND' if the wallet does not exist.
+    :param wallet_uuid: UUID of existing wallet.
+    :param data: new number of slots.
+    :param runner: transaction runner, see 'wallet_app.transactions'.
+    :param media_type: media type of the response body,
+    see 'wallet_app.responses'.
+    :return: wallet in format 'SWalletStriped'.
+    """
+    if settings.LEDGER_MODE:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Striping is not available in ledger mode"
+        )
+    try:
+        balance = await runner.run(lambda session: striping.set_stripes(
+            session, wallet_uuid, data.stripes
+        ))
+    except WalletNotFoundError:
+        raise wallet_not_found()
+    await balance_cache.invalidate(wallet_uuid)
+    return render(SWalletStriped.model_construct(
+        uuid=wallet_uuid, stripes=data.stripes, balance=balance
+    ), media_type)
+
+
+@router.get(
+    "/admin/wallets/export",
+    status_code=HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={HTTP_200_OK: {"content": {
+        media_type: {} for media_type in dump.MEDIA_TYPES.values()
+    }}},
+    tags=["admin"],
+)
+async def export_wallets(
+        data_format: DumpFormat = Query(DumpFormat.CSV, alias="format"),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+) -> StreamingResponse:
+    """
+    Streams a dump of the wallets table.
+
+    The wallets are read with one 'COPY TO STDOUT', see
+    'wallet_app.dump', as CSV with a header line, NDJSON
+    or the binary COPY format, holding the UUID and full balance.
+    If it worked without errors, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
+    in ledger mode.
+    :param data_format: format of the dump.
+    :param session_factory: database session factory.
+    :return: stream of the dump.
+    """
+    if settings.LEDGER_MODE:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Dump is not available in ledger mode"
+        )
+    return StreamingResponse(
+        dump.export_wallets(session_factory, data_format),
+        media_type=dump.MEDIA_TYPES[data_format],
+    )
+
+
+@router.post(
+    "/admin/wallets/import",
+    status_code=HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={HTTP_200_OK: {"content": {NDJSON_MEDIA_TYPE: {}}}},
+    openapi_extra={"requestBody": {"required": True, "content": {
+        media_type: {"schema": {"type": "string"}}
+        for media_type in dump.MEDIA_TYPES.values()
+    }}},
+    tags=["admin"],
+)
+async def import_wallets(
+        request: Request,
+        data_format: DumpFormat = Query(DumpFormat.CSV, alias="format"),
+        skip: int = Query(0, ge=0),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+) -> StreamingResponse:
+    """
+    Loads a dump of the wallets table made by the export.
+
+    The body is spooled first, then loaded with 'COPY FROM'
+    in chunks of 'IMPORT_CHUNK_SIZE' rows, each in its own transaction,
+    overwriting existing wallets. The number of rows loaded so far is
+    streamed as NDJSON lines of 'SImportProgress' after every commit,
+    and an interrupted import is resumed by sending the same dump
+    with the last number as 'skip'. An invalid row ends
+    the stream with a line holding the error.
+    If the import started, it returns the status code 'HTTP_200_OK',
+    otherwise it returns the status code 'HTTP_400_BAD_REQUEST'
+    in ledger mode.
+    :param request: request with the dump body.
+    :param data_format: format of the dump.
+    :param skip: number of leading rows loaded by an earlier import.
+    :param session_factory: database session factory.
+    :return: stream of import progress.
+    """
+    if settings.LEDGER_MODE:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="Dump is not available in ledger mode"
+        )
+    # The body is read before the response starts, as a streaming
+    # response listens for the client disconnect on the same channel
+    body = SpooledTemporaryFile(max_size=bulk.SPOOL_MAX_SIZE)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    return StreamingResponse(
+        dump.stream_import(session_factory, body, data_format, skip),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+
+@router.get("/stats", status_code=HTTP_200_OK, tags=["stats"])
+async def get_stats() -> dict[str, dict[str, float]]:
+    """
+    Returns the counters and gauges of the application subsystems.
+
+    For example, hits and misses of the balance cache
+    or connections checked out of the database pool.
+    :return: mapping of subsystem name to its values.
+    """
+    return metrics.snapshot()
+
+
+@metrics_router.get("/metrics", status_code=HTTP_200_OK)
+async def get_metrics() -> Response:
+    """
+    Returns all counters, gauges and histograms of the application
+    in the Prometheus text exposition format.
+
+    Request latencies by route are recorded by
+    'wallet_app.metrics.MetricsMiddleware'.
+    :return: exposition.
+    """
+    return Response(
+        metrics.exposition(), media_type=metrics.EXPOSITION_MEDIA_TYPE
+    )
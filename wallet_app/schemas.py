@@ -3,11 +3,21 @@ This module describes schemas for verifying request input
 and response data
 """
 
+from datetime import datetime
 from enum import Enum
 from typing import Optional
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from wallet_app.money import Money
+
+MAX_BATCH_SIZE = 10_000
+MAX_PAGE_SIZE = 1000
+MAX_STRIPES = 256
+MAX_BULK_SIZE = 1_000_000
+# Longest lifetime of a hold in seconds, a week
+MAX_HOLD_TTL = 7 * 24 * 3600
 
 
 class OperationType(str, Enum):
@@ -26,7 +36,7 @@ class SWalletOperation(BaseModel):
     """
 
     operation_type: OperationType
-    amount: Optional[float]
+    amount: Optional[Money]
 
     model_config = ConfigDict(extra="forbid")
 
@@ -38,7 +48,7 @@ class SWalletCreate(BaseModel):
     thar must be positive. If it is not specified, the default value is 0.
     """
 
-    balance: Optional[float] = Field(default=0, ge=0)
+    balance: Optional[Money] = Field(default=0, ge=0)
 
     model_config = ConfigDict(extra="forbid")
 
@@ -51,6 +61,269 @@ class SWalletCreated(BaseModel):
     """
 
     uuid: UUID
-    balance: float
+    balance: Money
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class SWalletBulkCreate(BaseModel):
+    """
+    Schema for creating many wallets at once.
+
+    Contains either 'count' wallets to create with the same 'balance'
+    or the list of initial 'balances', one per wallet.
+    """
+
+    count: Optional[int] = Field(default=None, gt=0, le=MAX_BULK_SIZE)
+    balance: Money = Field(default=0, ge=0)
+    balances: Optional[list[Money]] = Field(
+        default=None, min_length=1, max_length=MAX_BULK_SIZE
+    )
+
+    model_config = ConfigDict(extra="forbid")
+
+    @model_validator(mode="after")
+    def check_count_or_balances(self) -> "SWalletBulkCreate":
+        """
+        Checks that exactly one of 'count' and 'balances' is set.
+        :return: validated schema.
+        """
+        if (self.count is None) == (self.balances is None):
+            raise ValueError(
+                "Exactly one of 'count' and 'balances' is required"
+            )
+        if self.balances is not None and min(self.balances) < 0:
+            raise ValueError("Balances must be greater than or equal to 0")
+        return self
+
+
+class SBatchOperationItem(BaseModel):
+    """
+    Schema for a single item of a batch of wallet operations.
+
+    Contains the wallet UUID, operation type and amount.
+    """
+
+    wallet_uuid: UUID
+    operation_type: OperationType
+    amount: Money
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class SBatchOperations(BaseModel):
+    """
+    Schema for a batch of wallet operations.
+
+    Operations are applied in the given order. If 'atomic' is set,
+    the batch is applied only when every operation succeeds,
+    otherwise each successful operation is applied independently.
+    """
+
+    operations: list[SBatchOperationItem] = Field(
+        min_length=1, max_length=MAX_BATCH_SIZE
+    )
+    atomic: bool = True
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class BatchItemStatus(str, Enum):
+    """Enumeration of batch operation outcomes."""
+
+    OK = "OK"
+    INVALID_AMOUNT = "INVALID_AMOUNT"
+    NOT_FOUND = "NOT_FOUND"
+    INSUFFICIENT_FUNDS = "INSUFFICIENT_FUNDS"
+    BALANCE_OVERFLOW = "BALANCE_OVERFLOW"
+
+
+class SBatchItemResult(BaseModel):
+    """
+    Scheme for the outcome of a single batch operation.
+
+    The balance is set only for applied operations.
+    """
+
+    status: BatchItemStatus
+    balance: Optional[Money] = None
+
+
+class SBatchResult(BaseModel):
+    """
+    Scheme for output data after a batch of wallet operations.
+
+    Returns whether the batch was applied and per-item results
+    in the order of the request.
+    """
+
+    applied: bool
+    results: list[SBatchItemResult]
+
+
+class STransfer(BaseModel):
+    """
+    Schema for a transfer between two wallets.
+
+    Contains the source and destination wallet UUIDs and the amount.
+    """
+
+    from_wallet_uuid: UUID
+    to_wallet_uuid: UUID
+    amount: Money
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class STransferResult(BaseModel):
+    """
+    Scheme for output data after a transfer.
+
+    Returns both wallets with their balances after the transfer.
+    """
+
+    from_wallet: SWalletCreated
+    to_wallet: SWalletCreated
+
+
+class HoldStatus(str, Enum):
+    """Enumeration of states of a hold."""
+
+    ACTIVE = "ACTIVE"
+    CAPTURED = "CAPTURED"
+    RELEASED = "RELEASED"
+    EXPIRED = "EXPIRED"
+
+
+class SHoldCreate(BaseModel):
+    """
+    Schema for reserving funds of a wallet.
+
+    Contains the amount and an optional lifetime of the hold in seconds,
+    'HOLD_TTL' of the settings if it is not specified.
+    """
+
+    amount: Money
+    ttl: Optional[float] = Field(default=None, gt=0, le=MAX_HOLD_TTL)
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class SHold(BaseModel):
+    """
+    Scheme for output data of a hold.
+
+    Returns the hold identifier, wallet UUID, reserved amount,
+    state and the time after which an active hold expires.
+    """
+
+    id: UUID
+    wallet_uuid: UUID
+    amount: Money
+    status: HoldStatus
+    expires_at: datetime
+
+
+class SWalletStripes(BaseModel):
+    """
+    Schema for the number of balance slots of a wallet.
+
+    Zero turns striping off.
+    """
+
+    stripes: int = Field(ge=0, le=MAX_STRIPES)
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class SWalletStriped(SWalletCreated):
+    """
+    Scheme for output data after converting a wallet.
+
+    Returns the wallet with its full balance and number of slots.
+    """
+
+    stripes: int
+
+
+class DumpFormat(str, Enum):
+    """Enumeration of formats of a wallets table dump."""
+
+    CSV = "csv"
+    NDJSON = "ndjson"
+    BINARY = "binary"
+
+
+class SImportProgress(BaseModel):
+    """
+    Scheme for a progress line of a wallets table import.
+
+    Returns the number of rows of the dump loaded so far, including
+    the skipped ones, and the error that stopped the import, if any.
+    """
+
+    rows: int
+    error: Optional[str] = None
+
+
+class SWalletOperationEntry(BaseModel):
+    """
+    Scheme for output data of a wallet ledger entry.
+
+    Returns the entry identifier, operation type, amount,
+    balance after the operation (if known) and the time of the entry.
+    """
+
+    id: int
+    operation_type: OperationType
+    amount: Money
+    balance: Optional[Money] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SWalletOperationsPage(BaseModel):
+    """
+    Scheme for output data of a page of the wallet history.
+
+    Returns entries from newest to oldest and the cursor
+    of the next page, which is empty on the last page.
+    """
+
+    operations: list[SWalletOperationEntry]
+    next_cursor: Optional[str] = None
+
+
+class WalletField(str, Enum):
+    """Enumeration of fields of a wallet listing."""
+
+    UUID = "uuid"
+    BALANCE = "balance"
+    STRIPES = "stripes"
+    VERSION = "version"
+
+
+class SWalletListItem(BaseModel):
+    """
+    Scheme for output data of a wallet in a listing.
+
+    Only the requested fields are set and returned.
+    """
+
+    uuid: Optional[UUID] = None
+    balance: Optional[Money] = None
+    stripes: Optional[int] = None
+    version: Optional[int] = None
+
+
+class SWalletsPage(BaseModel):
+    """
+    Scheme for output data of a page of the wallet listing.
+
+    Returns wallets in UUID order and the cursor of the next page,
+    which is empty on the last page.
+    """
+
+    wallets: list[SWalletListItem]
+    next_cursor: Optional[UUID] = None
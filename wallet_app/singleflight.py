@@ -0,0 +1,63 @@
+"""
+This module provides request coalescing (single-flight).
+
+Concurrent callers asking for the same key share one in-flight call
+instead of each running their own.
+'wallet_reads' coalesces reads of the same wallet
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from wallet_app.metrics import Counters, register
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key.
+
+    The first caller starts the call as a task, callers arriving
+    while it runs await the same task. The task is shielded,
+    so a cancelled caller does not cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self.stats = Counters("calls", "collapsed")
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs the call or joins the one in flight for the key.
+        :param key: key identifying the call.
+        :param call: coroutine function to run.
+        :return: result of the shared call.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.stats.inc("calls")
+        else:
+            self.stats.inc("collapsed")
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """
+        Removes the finished call.
+
+        The exception is retrieved here, so a call whose callers
+        were all cancelled does not log it as never retrieved.
+        :param key: key identifying the call.
+        :param task: finished task.
+        :return: None.
+        """
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+
+wallet_reads = SingleFlight()
+register("single_flight", wallet_reads.stats)
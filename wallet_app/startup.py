@@ -0,0 +1,101 @@
+"""
+This module measures the startup of a worker.
+
+The lifespan of the app times each of its steps, and with
+'STARTUP_PROFILE' logs the durations once the worker is ready
+to serve requests. Modules are imported before the lifespan runs,
+so the command line profile imports the app module by module,
+then runs its lifespan against the configured database:
+
+    python -m wallet_app.startup
+"""
+
+import asyncio
+import importlib
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Imported by the command line profile in this order, each time
+# includes only the modules not imported before
+IMPORTS = (
+    "pydantic_settings",
+    "wallet_app.config",
+    "sqlalchemy.ext.asyncio",
+    "asyncpg",
+    "fastapi",
+    "wallet_app.database",
+    "wallet_app.models",
+    "wallet_app.router",
+    "wallet_app.main",
+)
+
+
+class StartupProfile:
+    """Durations of the named steps of a startup in seconds."""
+
+    def __init__(self) -> None:
+        self.steps: dict[str, float] = {}
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block.
+        :param name: name of the step.
+        :return: None.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = time.perf_counter() - started
+
+    def total(self) -> float:
+        """
+        Returns the duration of all steps.
+        :return: sum of the step durations in seconds.
+        """
+        return sum(self.steps.values())
+
+    def report(self) -> str:
+        """
+        Formats the durations, one step per line.
+        :return: table of the steps in milliseconds.
+        """
+        width = max((len(name) for name in self.steps), default=0)
+        return "\n".join(
+            f"{name:<{width}} {elapsed * 1000:9.1f} ms"
+            for name, elapsed in self.steps.items()
+        )
+
+
+def profile_imports() -> StartupProfile:
+    """
+    Imports the modules of 'IMPORTS' one by one.
+    :return: import time of each module.
+    """
+    profile = StartupProfile()
+    for name in IMPORTS:
+        with profile.step(name):
+            importlib.import_module(name)
+    return profile
+
+
+async def profile_lifespan() -> StartupProfile:
+    """
+    Runs the startup and the shutdown of the app.
+    :return: duration of each startup step of the lifespan.
+    """
+    main = importlib.import_module("wallet_app.main")
+    async with main.lifespan(main.app):
+        pass
+    return main.app.state.startup_profile
+
+
+if __name__ == "__main__":
+    for title, profile in (
+            ("Imports", profile_imports()),
+            ("Lifespan", asyncio.run(profile_lifespan())),
+    ):
+        print(f"{title}: {profile.total() * 1000:.1f} ms")
+        print(profile.report())
@@ -0,0 +1,290 @@
+"""
+This module provides striped wallet balances.
+
+The balance of a striped wallet is spread over the wallet row and
+'stripes' slot rows. Deposits go to a random slot, so concurrent
+deposits rarely wait for each other. A withdrawal first tries a random
+slot, and if that slot cannot cover the amount it locks the wallet
+and every slot and moves the whole balance to the wallet row.
+
+The wallet row is only locked 'FOR NO KEY UPDATE', which does not
+block the 'FOR KEY SHARE' lock taken by ledger inserts of deposits
+holding a slot. Striping applies to row mode, ledger mode keeps
+the balance in the ledger
+"""
+
+import random
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    String,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wallet_app.exceptions import (
+    BalanceOverflowError,
+    InsufficientFundsError,
+    WalletNotFoundError,
+)
+from wallet_app.models import Wallet, WalletOperation, WalletSlot
+from wallet_app.money import MinorUnits, out_of_range
+from wallet_app.schemas import OperationType, SWalletCreated
+
+
+def total_balance() -> ColumnElement:
+    """
+    Returns the full balance of a wallet row including its slots.
+
+    The slots are read only for striped wallets.
+    :return: SQL expression.
+    """
+    slots = (
+        select(func.coalesce(func.sum(WalletSlot.balance), 0))
+        .where(WalletSlot.wallet_uuid == Wallet.uuid)
+        .scalar_subquery()
+    )
+    return case(
+        (Wallet.stripes > 0, Wallet.balance + slots), else_=Wallet.balance
+    )
+
+
+def slot_statement(
+        wallet_uuid: UUID,
+        slot: int,
+        operation_type: OperationType,
+        amount: Decimal
+) -> Select:
+    """
+    Builds a statement that applies an operation to one slot.
+
+    The ledger entry is recorded without a balance, the outer select
+    returns the full balance as of the statement start or no row
+    if the slot was not changed.
+    :param wallet_uuid: UUID of the wallet.
+    :param slot: number of the slot.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :return: select statement.
+    """
+    condition = [
+        WalletSlot.wallet_uuid == wallet_uuid, WalletSlot.slot == slot
+    ]
+    if operation_type == OperationType.DEPOSIT:
+        new_balance = WalletSlot.balance + amount
+    else:
+        condition.append(WalletSlot.balance >= amount)
+        new_balance = WalletSlot.balance - amount
+    updated = (
+        update(WalletSlot)
+        .where(*condition)
+        .values(balance=new_balance)
+        .returning(WalletSlot.wallet_uuid)
+        .cte("updated")
+    )
+    recorded = (
+        insert(WalletOperation)
+        .from_select(
+            ["wallet_uuid", "operation_type", "amount"],
+            select(
+                updated.c.wallet_uuid,
+                literal(operation_type.value, String),
+                literal(amount, MinorUnits),
+            ),
+        )
+        .returning(WalletOperation.wallet_uuid)
+        .cte("recorded")
+    )
+    return select(total_balance().label("balance")).where(
+        Wallet.uuid.in_(select(recorded.c.wallet_uuid))
+    )
+
+
+async def consolidate(
+        session: AsyncSession, wallet_uuids: set[UUID]
+) -> dict[UUID, Decimal]:
+    """
+    Moves the slot balances of striped wallets to their wallet rows.
+
+    The caller must hold the wallet row locks. The slots are locked
+    in order, set to zero and their sums are added to the wallet rows
+    by one statement.
+    :param session: asynchronous database session.
+    :param wallet_uuids: UUIDs of striped wallets.
+    :return: mapping of wallet UUID to its full balance.
+    """
+    if not wallet_uuids:
+        return {}
+    locked = (
+        select(WalletSlot.wallet_uuid, WalletSlot.slot, WalletSlot.balance)
+        .where(WalletSlot.wallet_uuid.in_(wallet_uuids))
+        .order_by(WalletSlot.wallet_uuid, WalletSlot.slot)
+        .with_for_update()
+        .cte("locked")
+    )
+    zeroed = (
+        update(WalletSlot.__table__)
+        .where(
+            WalletSlot.wallet_uuid == locked.c.wallet_uuid,
+            WalletSlot.slot == locked.c.slot,
+        )
+        .values(balance=0)
+        .returning(WalletSlot.wallet_uuid)
+        .cte("zeroed")
+    )
+    sums = (
+        select(
+            locked.c.wallet_uuid,
+            func.sum(locked.c.balance).label("balance"),
+        )
+        .group_by(locked.c.wallet_uuid)
+        .cte("sums")
+    )
+    result = await session.execute(
+        update(Wallet.__table__)
+        .where(Wallet.uuid == sums.c.wallet_uuid)
+        .values(
+            balance=Wallet.balance + sums.c.balance,
+            version=Wallet.version + 1,
+        )
+        .returning(Wallet.uuid, Wallet.balance)
+        .add_cte(zeroed)
+    )
+    return {row.uuid: row.balance for row in result}
+
+
+async def withdraw_locked(
+        session: AsyncSession, wallet_uuid: UUID, amount: Decimal
+) -> Optional[SWalletCreated]:
+    """
+    Withdraws from a striped wallet with the wallet and all slots locked.
+
+    The whole balance is moved to the wallet row first.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param amount: positive amount of the withdrawal.
+    :return: wallet in format 'SWalletCreated' or None if the wallet
+    is no longer striped.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the balance is too low.
+    """
+    stripes = await session.scalar(
+        select(Wallet.stripes)
+        .where(Wallet.uuid == wallet_uuid)
+        .with_for_update(key_share=True)
+    )
+    if stripes is None:
+        raise WalletNotFoundError(wallet_uuid)
+    if not stripes:
+        return None
+    balance = (await consolidate(session, {wallet_uuid}))[wallet_uuid]
+    if balance < amount:
+        raise InsufficientFundsError(wallet_uuid)
+    balance -= amount
+    await session.execute(
+        update(Wallet.__table__)
+        .where(Wallet.uuid == wallet_uuid)
+        .values(balance=balance, version=Wallet.version + 1)
+    )
+    await session.execute(insert(WalletOperation).values(
+        wallet_uuid=wallet_uuid,
+        operation_type=OperationType.WITHDRAW.value,
+        amount=amount,
+        balance=balance,
+    ))
+    return SWalletCreated.model_construct(uuid=wallet_uuid, balance=balance)
+
+
+async def apply_operation(
+        session: AsyncSession,
+        wallet_uuid: UUID,
+        stripes: int,
+        operation_type: OperationType,
+        amount: Decimal
+) -> Optional[SWalletCreated]:
+    """
+    Applies a deposit or withdrawal to a striped wallet.
+
+    The operation is applied to a random slot. A withdrawal the slot
+    cannot cover falls back to 'withdraw_locked'. The returned balance
+    of a slot operation does not include concurrent uncommitted ones.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param stripes: number of slots of the wallet.
+    :param operation_type: operation to perform.
+    :param amount: positive amount of the operation.
+    :return: wallet in format 'SWalletCreated' or None if the wallet
+    is no longer striped.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    :raises InsufficientFundsError: if the balance is too low to withdraw.
+    :raises BalanceOverflowError: if a deposit exceeds the largest balance,
+    the slot update is rolled back with the transaction then.
+    """
+    result = await session.execute(slot_statement(
+        wallet_uuid, random.randrange(stripes), operation_type, amount
+    ))
+    balance = result.scalar_one_or_none()
+    if balance is not None:
+        if operation_type == OperationType.DEPOSIT:
+            if out_of_range(balance + amount):
+                raise BalanceOverflowError(wallet_uuid)
+            return SWalletCreated.model_construct(
+                uuid=wallet_uuid, balance=balance + amount
+            )
+        return SWalletCreated.model_construct(
+            uuid=wallet_uuid, balance=balance - amount
+        )
+    if operation_type == OperationType.DEPOSIT:
+        return None
+    return await withdraw_locked(session, wallet_uuid, amount)
+
+
+async def set_stripes(
+        session: AsyncSession, wallet_uuid: UUID, stripes: int
+) -> Decimal:
+    """
+    Converts the wallet to the given number of slots.
+
+    The current slots are consolidated into the wallet row and replaced
+    by empty ones, 0 slots turns striping off. Operations on the wallet
+    wait for the conversion and continue in the new mode.
+    :param session: asynchronous database session.
+    :param wallet_uuid: UUID of the wallet.
+    :param stripes: new number of slots.
+    :return: full balance of the wallet.
+    :raises WalletNotFoundError: if the wallet does not exist.
+    """
+    row = (await session.execute(
+        select(Wallet.balance, Wallet.stripes)
+        .where(Wallet.uuid == wallet_uuid)
+        .with_for_update(key_share=True)
+    )).one_or_none()
+    if row is None:
+        raise WalletNotFoundError(wallet_uuid)
+    balance = row.balance
+    if row.stripes:
+        balance = (await consolidate(session, {wallet_uuid}))[wallet_uuid]
+        await session.execute(
+            delete(WalletSlot).where(WalletSlot.wallet_uuid == wallet_uuid)
+        )
+    await session.execute(
+        update(Wallet.__table__)
+        .where(Wallet.uuid == wallet_uuid)
+        .values(stripes=stripes, version=Wallet.version + 1)
+    )
+    if stripes:
+        await session.execute(insert(WalletSlot), [
+            {"wallet_uuid": wallet_uuid, "slot": slot, "balance": 0}
+            for slot in range(stripes)
+        ])
+    return balance
@@ -0,0 +1,141 @@
+"""
+This module provides the transaction runner of the write endpoints.
+
+A unit of work is a coroutine function taking a session. The runner
+runs it in a new transaction and commits, and when Postgres aborts the
+transaction with a serialization failure or a deadlock, it rolls back
+and runs the whole unit of work again after a jittered exponential
+pause, until 'TX_MAX_RETRIES' retries or 'TX_RETRY_DEADLINE' seconds.
+A unit of work that lost an optimistic race is rerun the same way,
+until 'OPTIMISTIC_RETRIES' retries, see 'wallet_app.optimistic'.
+The session is closed before every pause, so no connection is held.
+Endpoints listed in 'SERIALIZABLE_ENDPOINTS' run at the SERIALIZABLE
+isolation level, the rest at the default READ COMMITTED
+"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from wallet_app import optimistic
+from wallet_app.config import settings
+from wallet_app.exceptions import WalletRaceLostError
+from wallet_app.metrics import Counters, register
+
+T = TypeVar("T")
+
+# SQLSTATE codes of errors after which the transaction can be rerun
+SERIALIZATION_FAILURE = "40001"
+DEADLOCK_DETECTED = "40P01"
+RETRYABLE_SQLSTATES = frozenset({SERIALIZATION_FAILURE, DEADLOCK_DETECTED})
+# SQLSTATE of a BIGINT balance pushed out of its range
+NUMERIC_VALUE_OUT_OF_RANGE = "22003"
+
+stats = Counters(
+    "transactions",
+    "serialization_failures",
+    "deadlocks",
+    "retries",
+    "backoff_ms",
+    "give_ups",
+)
+register("transactions", stats)
+
+
+def sqlstate(error: BaseException) -> Optional[str]:
+    """
+    Returns the SQLSTATE code of a database error.
+    :param error: error raised by SQLAlchemy or asyncpg.
+    :return: SQLSTATE code or None if the error has none.
+    """
+    if isinstance(error, DBAPIError):
+        error = error.orig
+    return getattr(error, "sqlstate", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Returns whether the transaction failed only because of concurrency.
+    :param error: error raised by SQLAlchemy or asyncpg.
+    :return: True for serialization failures and deadlocks.
+    """
+    return sqlstate(error) in RETRYABLE_SQLSTATES
+
+
+def backoff(retry: int) -> float:
+    """
+    Returns the pause before a retry with full jitter.
+    :param retry: number of the retry, starting from 0.
+    :return: pause in seconds.
+    """
+    return random.uniform(0, settings.TX_RETRY_BACKOFF * 2 ** retry)
+
+
+class TransactionRunner:
+    """
+    Runs units of work in transactions, retrying transient failures.
+
+    The unit of work may run several times, so it must not have
+    side effects outside the database session.
+    """
+
+    def __init__(
+            self,
+            session_factory: async_sessionmaker,
+            isolation_level: Optional[str] = None
+    ) -> None:
+        self.session_factory = session_factory
+        self.isolation_level = isolation_level
+
+    async def run(self, work: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """
+        Runs the unit of work in a transaction and commits it.
+        :param work: coroutine function performing the unit of work.
+        :return: result of the unit of work.
+        :raises DBAPIError: if the retries or the deadline are exhausted,
+        or the error is not transient.
+        :raises WalletRaceLostError: if the optimistic retries
+        are exhausted.
+        """
+        deadline = time.monotonic() + settings.TX_RETRY_DEADLINE
+        retry = 0
+        races = 0
+        while True:
+            stats.inc("transactions")
+            async with self.session_factory() as session:
+                try:
+                    async with session.begin():
+                        if self.isolation_level:
+                            await session.connection(execution_options={
+                                "isolation_level": self.isolation_level
+                            })
+                        return await work(session)
+                except WalletRaceLostError:
+                    if races >= settings.OPTIMISTIC_RETRIES:
+                        optimistic.stats.inc("aborts")
+                        raise
+                    pause = optimistic.backoff(races)
+                    races += 1
+                    optimistic.stats.inc("retries")
+                except DBAPIError as error:
+                    if not is_retryable(error):
+                        raise
+                    if sqlstate(error) == DEADLOCK_DETECTED:
+                        stats.inc("deadlocks")
+                    else:
+                        stats.inc("serialization_failures")
+                    pause = backoff(retry)
+                    if (
+                            retry >= settings.TX_MAX_RETRIES
+                            or time.monotonic() + pause > deadline
+                    ):
+                        stats.inc("give_ups")
+                        raise
+                    retry += 1
+                    stats.inc("retries")
+                    stats.inc("backoff_ms", round(pause * 1000))
+            await asyncio.sleep(pause)